@@ -2,14 +2,25 @@
 Fleet Management System - Main Dashboard with Authentication
 """
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
+from lazy_imports import lazy_module
+px = lazy_module('plotly.express')
+go = lazy_module('plotly.graph_objects')
+pd = lazy_module('pandas')
 from datetime import datetime, timedelta
 from database import execute_query, init_db
-from translations import get_text, LANGUAGES
+from translations import get_text, translate_series, available_languages
 from utils import format_currency
 from auth import require_auth, show_org_header
+from analytics_cache import start_prewarm
+from partitions import start_maintenance
+from document_retention import start_compactor
+from tco_report import start_accrual_refresh
+from forecasting import get_forecast, start_forecast_refresh
+from fuel_analytics import start_fuel_stats_refresh
+from cache_manager import get_vehicle_status_counts
+
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 15
 
 # Page configuration
 st.set_page_config(
@@ -26,6 +37,12 @@ st.set_page_config(
 
 # Initialize database and require authentication
 init_db()
+start_prewarm()
+start_maintenance()
+start_compactor()
+start_accrual_refresh()
+start_forecast_refresh()
+start_fuel_stats_refresh()
 require_auth()
 
 # Initialize language in session state
@@ -37,11 +54,12 @@ with st.sidebar:
     st.title("🚗 Fleet Management")
     
     # Language selector
+    languages = available_languages()
     language = st.selectbox(
         "Language / Язык",
-        options=list(LANGUAGES.keys()),
-        format_func=lambda x: LANGUAGES[x],
-        index=list(LANGUAGES.keys()).index(st.session_state.language)
+        options=list(languages.keys()),
+        format_func=lambda x: languages[x],
+        index=list(languages.keys()).index(st.session_state.language)
     )
     
     if language != st.session_state.language:
@@ -111,22 +129,12 @@ try:
     with col1:
         st.subheader(f"🚗 {get_text('vehicles', st.session_state.language)} - {get_text('status', st.session_state.language)}")
         
-        @st.cache_data(ttl=300)
-        def get_vehicle_status():
-            return execute_query("""
-                SELECT status, COUNT(*) as count 
-                FROM vehicles 
-                GROUP BY status
-                ORDER BY count DESC
-            """)
-        
-        vehicle_status_data = get_vehicle_status()
+        # Shared cache, cleared by vehicle status changes on the vehicles page
+        vehicle_status_data = get_vehicle_status_counts()
         
         if vehicle_status_data:
             df_status = pd.DataFrame(vehicle_status_data, columns=['Status', 'Count'])
-            df_status['Status_Translated'] = df_status['Status'].apply(
-                lambda x: get_text(x, st.session_state.language)
-            )
+            df_status['Status_Translated'] = translate_series(df_status['Status'], st.session_state.language)
             
             fig_status = px.pie(
                 df_status, 
@@ -183,6 +191,28 @@ try:
                 y='Amount',
                 title=get_text('monthly_expenses', st.session_state.language)
             )
+            
+            # Projection band from the nightly fitted model (no fitting here)
+            @st.cache_data(ttl=3600)
+            def get_spend_forecast(org_id):
+                return get_forecast(org_id)
+            
+            forecast = get_spend_forecast(st.session_state.get('organization_id'))
+            if forecast:
+                forecast_months = [m.strftime('%Y-%m') for m, _, _, _ in forecast]
+                fig_expenses.add_trace(go.Scatter(
+                    x=forecast_months, y=[upper for _, _, _, upper in forecast],
+                    line=dict(width=0), showlegend=False, hoverinfo='skip'
+                ))
+                fig_expenses.add_trace(go.Scatter(
+                    x=forecast_months, y=[lower for _, _, lower, _ in forecast],
+                    line=dict(width=0), fill='tonexty', fillcolor='rgba(69, 183, 209, 0.25)',
+                    name='Прогноз (диапазон)'
+                ))
+                fig_expenses.add_trace(go.Scatter(
+                    x=forecast_months, y=[value for _, value, _, _ in forecast],
+                    line=dict(color='#45B7D1', dash='dash'), name='Прогноз'
+                ))
             st.plotly_chart(fig_expenses, use_container_width=True)
         else:
             st.info(get_text('no_data', st.session_state.language))
@@ -0,0 +1,271 @@
+"""
+Date-range cache for expense analytics
+
+Results are cached per tenant, normalized date range and filters. Underneath,
+car expenses are stored as daily per-vehicle aggregates so that any range is
+assembled from cached days and only days not cached recently hit the database.
+Writes from this process invalidate the affected days right away; writers
+that do not (the Next.js API, the tax cron, CLI runs in another process)
+show up once a day's COLD_DAY_TTL has passed.
+Common windows (last 30 days, month-to-date, year-to-date) are pre-warmed for
+every active organization by a background thread.
+"""
+import threading
+import time
+from datetime import date, datetime, timedelta
+from database import execute_query
+from query_metrics import background_thread_name
+
+# Seconds before a cached range result is recomputed from daily aggregates
+RESULT_TTL = 300
+# Seconds before aggregates for today/yesterday are refetched (still receiving writes)
+HOT_DAY_TTL = 300
+# Seconds before older days are refetched (backdated writes from other processes)
+COLD_DAY_TTL = 4 * 3600
+# Seconds between background pre-warm passes
+PREWARM_INTERVAL = 900
+
+# Order of the per-vehicle aggregate vector stored for every day
+EXPENSE_CATEGORIES = ['fuel', 'repair', 'maintenance', 'insurance', 'other']
+
+
+class InMemoryAnalyticsBackend:
+    """Process-local storage for daily aggregates and range results.
+
+    Any object with the same methods can be installed with set_cache_backend(),
+    e.g. to share aggregates between several Streamlit workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days = {}
+        self._results = {}
+
+    def get_days(self, org_id, days):
+        """Return {day: (stored_at, aggregates)} for the requested days that are cached"""
+        with self._lock:
+            tenant_days = self._days.get(org_id, {})
+            return {d: tenant_days[d] for d in days if d in tenant_days}
+
+    def set_days(self, org_id, day_aggregates):
+        now = time.time()
+        with self._lock:
+            tenant_days = self._days.setdefault(org_id, {})
+            for day, aggregates in day_aggregates.items():
+                tenant_days[day] = (now, aggregates)
+
+    def get_result(self, key):
+        with self._lock:
+            return self._results.get(key)
+
+    def set_result(self, key, rows):
+        with self._lock:
+            self._results[key] = (time.time(), rows)
+
+    def invalidate(self, org_id, days=None):
+        with self._lock:
+            if days is None:
+                self._days.pop(org_id, None)
+            else:
+                tenant_days = self._days.get(org_id, {})
+                for day in days:
+                    tenant_days.pop(day, None)
+            self._results = {k: v for k, v in self._results.items() if k[0] != org_id}
+
+
+_backend = InMemoryAnalyticsBackend()
+_prewarm_lock = threading.Lock()
+_prewarm_thread = None
+
+
+def set_cache_backend(backend):
+    """Replace the cache backend (mainly for shared/external storage)"""
+    global _backend
+    _backend = backend
+
+
+def normalize_range(date_from, date_to):
+    """Snap a range to whole days and order its bounds"""
+    if isinstance(date_from, datetime):
+        date_from = date_from.date()
+    if isinstance(date_to, datetime):
+        date_to = date_to.date()
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    return date_from, date_to
+
+
+def common_windows(today=None):
+    """Return the pre-warmed windows: last 30 days, month-to-date, year-to-date"""
+    today = today or date.today()
+    return {
+        'last_30_days': (today - timedelta(days=30), today),
+        'month_to_date': (today.replace(day=1), today),
+        'year_to_date': (today.replace(month=1, day=1), today),
+    }
+
+
+def _missing_runs(days):
+    """Group a sorted list of days into contiguous (first, last) runs"""
+    runs = []
+    for day in days:
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def _fetch_daily_aggregates(org_id, first_day, last_day):
+    """Aggregate car expenses per day and vehicle for one contiguous range"""
+    rows = execute_query("""
+        SELECT
+            date,
+            vehicle_id,
+            COUNT(id) as expense_count,
+            COALESCE(SUM(amount), 0) as total_amount,
+            SUM(CASE WHEN category = 'fuel' THEN amount ELSE 0 END) as fuel_cost,
+            SUM(CASE WHEN category = 'repair' THEN amount ELSE 0 END) as repair_cost,
+            SUM(CASE WHEN category = 'maintenance' THEN amount ELSE 0 END) as maintenance_cost,
+            SUM(CASE WHEN category = 'insurance' THEN amount ELSE 0 END) as insurance_cost,
+            SUM(CASE WHEN category = 'other' THEN amount ELSE 0 END) as other_cost
+        FROM car_expenses
+        WHERE organization_id = :org_id
+          AND date BETWEEN :first_day AND :last_day
+        GROUP BY date, vehicle_id
+    """, {'org_id': org_id, 'first_day': first_day, 'last_day': last_day}) or []
+
+    # Days without expenses are stored too, so they are never rescanned
+    day_aggregates = {}
+    day = first_day
+    while day <= last_day:
+        day_aggregates[day] = {}
+        day += timedelta(days=1)
+
+    for row in rows:
+        day_aggregates[row[0]][str(row[1])] = tuple(float(v or 0) for v in row[2:])
+    return day_aggregates
+
+
+def get_daily_aggregates(org_id, date_from, date_to):
+    """Return {day: {vehicle_id: aggregates}} for a range, loading only uncached days"""
+    org_id = str(org_id)
+    date_from, date_to = normalize_range(date_from, date_to)
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+    hot_from = date.today() - timedelta(days=1)
+    now = time.time()
+    cached = {
+        day: aggregates
+        for day, (stored_at, aggregates) in _backend.get_days(org_id, days).items()
+        if now - stored_at < (COLD_DAY_TTL if day < hot_from else HOT_DAY_TTL)
+    }
+
+    missing = [day for day in days if day not in cached]
+    for first_day, last_day in _missing_runs(missing):
+        fetched = _fetch_daily_aggregates(org_id, first_day, last_day)
+        _backend.set_days(org_id, fetched)
+        cached.update(fetched)
+
+    return {day: cached[day] for day in days}
+
+
+def _get_vehicle_info(org_id):
+    rows = execute_query("""
+        SELECT id, name, license_plate, photo_url
+        FROM vehicles
+        WHERE organization_id = :org_id
+    """, {'org_id': org_id}) or []
+    return {str(row[0]): row for row in rows}
+
+
+def _compute_vehicle_analytics(org_id, date_from, date_to, categories, limit):
+    totals = {}
+    for aggregates in get_daily_aggregates(org_id, date_from, date_to).values():
+        for vehicle_id, values in aggregates.items():
+            current = totals.get(vehicle_id)
+            totals[vehicle_id] = values if current is None else tuple(a + b for a, b in zip(current, values))
+
+    vehicles = _get_vehicle_info(org_id)
+    category_index = {name: i for i, name in enumerate(EXPENSE_CATEGORIES)}
+    rows = []
+    for vehicle_id, values in totals.items():
+        expense_count, total_amount = values[0], values[1]
+        category_costs = values[2:]
+        if categories:
+            total_amount = sum(category_costs[category_index[c]] for c in categories if c in category_index)
+        if total_amount <= 0 or vehicle_id not in vehicles:
+            continue
+        vehicle = vehicles[vehicle_id]
+        rows.append((
+            vehicle[0], vehicle[1], vehicle[2], vehicle[3],
+            int(expense_count),
+            total_amount,
+            values[1] / expense_count if expense_count else 0,
+            *category_costs
+        ))
+
+    rows.sort(key=lambda r: r[5], reverse=True)
+    return rows[:limit] if limit else rows
+
+
+def get_vehicle_analytics(org_id, date_from, date_to, categories=None, limit=20):
+    """Get per-vehicle expense totals for a date range
+
+    Returns rows shaped like the analytics page query:
+    (id, name, license_plate, photo_url, expense_count, total_amount, avg_amount,
+     fuel_cost, repair_cost, maintenance_cost, insurance_cost, other_cost)
+    """
+    org_id = str(org_id)
+    date_from, date_to = normalize_range(date_from, date_to)
+    categories = tuple(sorted(categories)) if categories else ()
+    key = (org_id, date_from, date_to, categories, limit)
+
+    cached = _backend.get_result(key)
+    if cached and time.time() - cached[0] < RESULT_TTL:
+        return cached[1]
+
+    rows = _compute_vehicle_analytics(org_id, date_from, date_to, categories, limit)
+    _backend.set_result(key, rows)
+    return rows
+
+
+def invalidate_analytics_cache(org_id, days=None):
+    """Drop cached aggregates after a car expense write
+
+    Pass the affected days when known; otherwise the whole tenant is dropped.
+    """
+    org_id = str(org_id)
+    if days is not None:
+        days = [d.date() if isinstance(d, datetime) else d for d in days if d]
+    _backend.invalidate(org_id, days)
+
+
+def prewarm_tenant(org_id):
+    """Load the common windows for one organization"""
+    for date_from, date_to in common_windows().values():
+        get_vehicle_analytics(org_id, date_from, date_to)
+
+
+def _prewarm_loop():
+    while True:
+        try:
+            organizations = execute_query(
+                "SELECT id FROM organizations WHERE subscription_status = 'active'"
+            ) or []
+            for org in organizations:
+                prewarm_tenant(org[0])
+        except Exception as e:
+            print(f"Analytics pre-warm failed: {e}")
+        time.sleep(PREWARM_INTERVAL)
+
+
+def start_prewarm():
+    """Start the background pre-warm thread once per process"""
+    global _prewarm_thread
+    with _prewarm_lock:
+        if _prewarm_thread is None or not _prewarm_thread.is_alive():
+            _prewarm_thread = threading.Thread(
+                target=_prewarm_loop, name=background_thread_name("analytics-prewarm"), daemon=True
+            )
+            _prewarm_thread.start()
@@ -5,9 +5,15 @@ import hashlib
 import uuid
 import streamlit as st
 from database import execute_query
+from profiler import profiled
+from session_inspector import track_rerun
 from datetime import datetime, timedelta
 import os
 
+# Users (comma-separated ids) who operate the server and may see process-wide
+# diagnostics of all organizations
+OPERATOR_USER_IDS = {i.strip() for i in os.getenv('OPERATOR_USER_IDS', '').split(',') if i.strip()}
+
 # Session management
 def init_session():
     """Initialize session state variables"""
@@ -132,6 +138,7 @@ def logout():
     
     st.rerun()
 
+@profiled('auth')
 def require_auth():
     """Decorator to require authentication"""
     init_session()
@@ -139,6 +146,9 @@ def require_auth():
         show_login_page()
         st.stop()
     
+    # Expire transient UI keys and account session size
+    track_rerun()
+    
     # Return user object for authenticated user
     from database import execute_query
     user_data = execute_query("""
@@ -251,6 +261,11 @@ def is_manager():
     user_role = st.session_state.get('user_role')
     return user_role in ['owner', 'admin', 'manager']
 
+def is_operator():
+    """Check if current user is a server operator (OPERATOR_USER_IDS)"""
+    user_id = st.session_state.get('user_id')
+    return bool(st.session_state.get('authenticated') and user_id and str(user_id) in OPERATOR_USER_IDS)
+
 def is_owner():
     """Check if current user is owner"""
     return st.session_state.get('user_role') == 'owner'
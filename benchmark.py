@@ -0,0 +1,283 @@
+"""
+Benchmarks for page-level data access
+
+Runs the data-access functions behind each page headlessly against a
+database loaded with synthetic_data.py and records wall time, SQL statement
+count and peak Python memory per case. Functions defined inside page
+scripts are extracted from the page source (without their st.cache_data
+decorator, so the database work is measured). Whole-page renders go through
+streamlit.testing.v1.AppTest.
+
+    python benchmark.py                    # compare with benchmark_baseline.json
+    python benchmark.py --update-baseline  # record a new baseline
+
+Exits with status 1 when a case regresses beyond the thresholds.
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from sqlalchemy import event
+from database import engine, execute_query, init_db
+from query_metrics import is_background_thread
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(ROOT, 'benchmark_baseline.json')
+# Relative slowdown / memory growth tolerated before failing
+TIME_THRESHOLD = 0.25
+MEMORY_THRESHOLD = 0.25
+# Absolute slack so that sub-millisecond noise never fails a run
+TIME_SLACK_MS = 2.0
+
+YEAR_AGO = date.today() - timedelta(days=365)
+
+# (case name, script glob, function name, args)
+FUNCTION_CASES = [
+    ('home.get_metrics', 'Home.py', 'get_metrics', ()),
+    ('home.get_vehicle_status', 'cache_manager.py', 'get_vehicle_status_counts', ()),
+    ('home.get_monthly_expenses', 'Home.py', 'get_monthly_expenses', ()),
+    ('home.get_team_stats', 'Home.py', 'get_team_stats', ()),
+    ('vehicles.get_documents_cached', 'pages/1_*.py', 'get_documents_cached', ()),
+    ('users.get_user_documents_cached', 'pages/3_*.py', 'get_user_documents_cached', ()),
+    ('penalties.get_penalties_cached', 'pages/4_*.py', 'get_penalties_cached', ()),
+    ('car_expenses.get_car_expenses_cached', 'pages/6_*.py', 'get_car_expenses_cached', ()),
+    ('expenses.get_expenses_summary', 'pages/8_*.py', 'get_expenses_summary', ()),
+    ('analytics.get_vehicle_expense_statistics', 'pages/9_*.py', 'get_vehicle_expense_statistics', (YEAR_AGO, date.today())),
+    ('analytics.get_team_expense_statistics', 'pages/9_*.py', 'get_team_expense_statistics', (YEAR_AGO, date.today())),
+    ('analytics.get_penalty_statistics', 'pages/9_*.py', 'get_penalty_statistics', ()),
+    ('equipment.get_active_assignments', 'pages/10_*.py', 'get_active_assignments', ()),
+]
+
+# (case name, script glob) rendered with AppTest as a logged-in owner
+PAGE_CASES = [
+    ('page.home', 'Home.py'),
+    ('page.vehicles', 'pages/1_*.py'),
+    ('page.teams', 'pages/2_*.py'),
+    ('page.users', 'pages/3_*.py'),
+    ('page.penalties', 'pages/4_*.py'),
+    ('page.car_expenses', 'pages/6_*.py'),
+    ('page.analytics', 'pages/9_*.py'),
+    ('page.equipment', 'pages/10_*.py'),
+]
+
+
+def resolve_script(pattern):
+    matches = sorted(glob.glob(os.path.join(ROOT, pattern)))
+    if not matches:
+        raise FileNotFoundError(pattern)
+    return matches[0]
+
+
+def is_lazy_import(node):
+    """True for top-level `name = lazy_module('...')` assignments"""
+    return (isinstance(node, ast.Assign)
+            and isinstance(node.value, ast.Call)
+            and getattr(node.value.func, 'id', None) == 'lazy_module')
+
+
+def extract_function(path, name, overrides=None):
+    """Compile one function out of a page script, with the script's imports
+
+    Decorators are dropped so cached functions hit the database every call.
+    The function may be nested (e.g. inside try/with blocks in Home.py).
+    """
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)) or is_lazy_import(node)]
+    function = next((node for node in ast.walk(tree)
+                     if isinstance(node, ast.FunctionDef) and node.name == name), None)
+    if function is None:
+        raise LookupError(f"{name} not found in {path}")
+    function.decorator_list = []
+
+    module = ast.Module(body=imports + [function], type_ignores=[])
+    namespace = {'__name__': f"benchmark_{name}", 'language': 'ru'}
+    namespace.update(overrides or {})
+    exec(compile(module, path, 'exec'), namespace)
+    return namespace[name]
+
+
+@contextmanager
+def count_queries():
+    """Count SQL statements sent through the engine; yields a list of statements"""
+    statements = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        # Background threads (analytics pre-warm) are not part of the measured work
+        if not is_background_thread():
+            statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before)
+
+
+def login_session(org_id=None):
+    """Session state of the owner of an organization (first active one by default)"""
+    # Migrations run once per process; apply them before any render is measured
+    init_db()
+    result = execute_query("""
+        SELECT u.id, u.organization_id, u.role, o.name
+        FROM users u
+        JOIN organizations o ON u.organization_id = o.id
+        WHERE o.subscription_status = 'active'
+          AND (CAST(:org_id AS uuid) IS NULL OR o.id = CAST(:org_id AS uuid))
+        ORDER BY o.name, CASE WHEN u.role = 'owner' THEN 0 ELSE 1 END
+        LIMIT 1
+    """, {'org_id': org_id})
+    if not result:
+        raise RuntimeError("No active organization with users; load data with synthetic_data.py first")
+    user_id, organization_id, role, org_name = result[0]
+    return {
+        'authenticated': True,
+        'user_id': str(user_id),
+        'organization_id': str(organization_id),
+        'user_role': role,
+        'organization_name': org_name,
+        'language': 'ru',
+        'remember_me': True,
+        'last_activity': datetime.now()
+    }
+
+
+def render_page(path, session, timeout=120):
+    """Render a page once with AppTest (caches cleared); raises if the script raised"""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.cache_data.clear()
+    app = AppTest.from_file(path, default_timeout=timeout)
+    for key, value in session.items():
+        app.session_state[key] = value
+    app.run()
+    if app.exception:
+        raise RuntimeError(f"{os.path.basename(path)}: {app.exception[0].message}")
+    return app
+
+
+def measure(run, repeats):
+    """Median wall time over repeats, statements of one run and peak traced memory"""
+    run()  # warm-up: imports, connection pool, plan cache
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    with count_queries() as statements:
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'time_ms': round(statistics.median(timings), 3),
+        'queries': len(statements),
+        'peak_kb': round(peak / 1024, 1)
+    }
+
+
+def run_benchmarks(repeats=5, pages=True, only=None, org_id=None):
+    results = {}
+    for name, pattern, function_name, args in FUNCTION_CASES:
+        if only and only not in name:
+            continue
+        function = extract_function(resolve_script(pattern), function_name)
+        results[name] = measure(lambda: function(*args), repeats)
+        print(f"  {name}: {results[name]}")
+
+    if pages:
+        session = login_session(org_id)
+        for name, pattern in PAGE_CASES:
+            if only and only not in name:
+                continue
+            path = resolve_script(pattern)
+            results[name] = measure(lambda: render_page(path, session), max(1, repeats // 2))
+            print(f"  {name}: {results[name]}")
+    return results
+
+
+def compare(results, baseline, time_threshold=TIME_THRESHOLD, memory_threshold=MEMORY_THRESHOLD):
+    """Return a list of regression messages (empty when everything is within limits)"""
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        time_limit = previous['time_ms'] * (1 + time_threshold) + TIME_SLACK_MS
+        if current['time_ms'] > time_limit:
+            regressions.append(f"{name}: time {current['time_ms']:.1f} ms > {time_limit:.1f} ms "
+                               f"(baseline {previous['time_ms']:.1f} ms)")
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name}: queries {current['queries']} > baseline {previous['queries']}")
+        memory_limit = previous['peak_kb'] * (1 + memory_threshold)
+        if current['peak_kb'] > memory_limit:
+            regressions.append(f"{name}: peak memory {current['peak_kb']:.0f} KB > {memory_limit:.0f} KB "
+                               f"(baseline {previous['peak_kb']:.0f} KB)")
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('cases', {})
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+            'cases': results
+        }, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark page data access against the synthetic dataset")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--only', help="run only cases whose name contains this text")
+    parser.add_argument('--no-pages', action='store_true', help="skip AppTest page renders")
+    parser.add_argument('--org-id', help="organization to render pages for")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--time-threshold', type=float, default=TIME_THRESHOLD)
+    parser.add_argument('--memory-threshold', type=float, default=MEMORY_THRESHOLD)
+    options = parser.parse_args(argv)
+
+    results = run_benchmarks(options.repeats, not options.no_pages, options.only, options.org_id)
+
+    if options.update_baseline:
+        baseline = load_baseline(options.baseline)
+        baseline.update(results)
+        save_baseline(baseline, options.baseline)
+        print(f"✅ Baseline written to {options.baseline}")
+        return 0
+
+    baseline = load_baseline(options.baseline)
+    if not baseline:
+        print(f"⚠️ No baseline at {options.baseline}; run with --update-baseline first")
+        return 0
+    regressions = compare(results, baseline, options.time_threshold, options.memory_threshold)
+    for message in regressions:
+        print(f"❌ {message}")
+    if regressions:
+        return 1
+    print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Set-based bulk actions for the vehicle, penalty and expense lists
+
+Every action is one statement over `id = ANY(:ids)` scoped to the
+organization, and returns what the caller needs for a single follow-up:
+the affected vehicle ids and dates for record_cost_change, so a page clears
+its cache and reruns once per action instead of once per row.
+
+select_rows() renders a list as a multi-row selectable table and returns
+the selected ids.
+"""
+import streamlit as st
+from sqlalchemy import text
+from database import engine
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
+
+VEHICLE_STATUSES = ['active', 'repair', 'unavailable', 'rented']
+
+
+def _ids(ids):
+    return [str(i) for i in ids if i]
+
+
+def _run(statement, params):
+    with engine.begin() as conn:
+        return conn.execute(text(statement), params).fetchall()
+
+
+def set_vehicle_status(ids, status, organization_id):
+    """Returns the ids of the vehicles whose status changed"""
+    rows = _run("""
+        UPDATE vehicles
+        SET status = CAST(:status AS vehicle_status)
+        WHERE id = ANY(CAST(:ids AS uuid[]))
+          AND organization_id = :org_id
+          AND status IS DISTINCT FROM CAST(:status AS vehicle_status)
+        RETURNING id
+    """, {'ids': _ids(ids), 'status': status, 'org_id': organization_id})
+    return [row[0] for row in rows]
+
+
+def assign_vehicles_to_team(ids, team_id, organization_id):
+    """End the vehicles' open assignments to other teams and open one to team_id
+
+    Vehicles already assigned to the team are left alone. Returns the ids of
+    the newly assigned vehicles.
+    """
+    rows = _run("""
+        WITH closed AS (
+            UPDATE vehicle_assignments va
+            SET end_date = CURRENT_DATE
+            FROM vehicles v
+            WHERE va.vehicle_id = v.id
+              AND v.id = ANY(CAST(:ids AS uuid[]))
+              AND v.organization_id = :org_id
+              AND va.end_date IS NULL
+              AND va.team_id IS DISTINCT FROM CAST(:team_id AS uuid)
+        )
+        INSERT INTO vehicle_assignments (vehicle_id, team_id, start_date)
+        SELECT v.id, CAST(:team_id AS uuid), CURRENT_DATE
+        FROM vehicles v
+        WHERE v.id = ANY(CAST(:ids AS uuid[]))
+          AND v.organization_id = :org_id
+          AND NOT EXISTS (
+              SELECT 1 FROM vehicle_assignments va
+              WHERE va.vehicle_id = v.id AND va.end_date IS NULL
+                AND va.team_id = CAST(:team_id AS uuid)
+          )
+        RETURNING vehicle_id
+    """, {'ids': _ids(ids), 'team_id': str(team_id), 'org_id': organization_id})
+    return [row[0] for row in rows]
+
+
+def delete_vehicles(ids, organization_id):
+    """Delete vehicles (expenses, penalties and documents cascade)
+
+    Returns [(vehicle_id, date)] with one row per day of the deleted
+    vehicles' car expenses (date is None for a vehicle without any), for
+    invalidating the analytics aggregates.
+    """
+    return _run("""
+        WITH deleted AS (
+            DELETE FROM vehicles
+            WHERE id = ANY(CAST(:ids AS uuid[]))
+              AND organization_id = :org_id
+            RETURNING id
+        )
+        SELECT DISTINCT d.id, ce.date::date
+        FROM deleted d
+        LEFT JOIN car_expenses ce ON ce.vehicle_id = d.id
+    """, {'ids': _ids(ids), 'org_id': organization_id})
+
+
+def mark_penalties_paid(ids, organization_id, note=None):
+    """Mark open penalties as paid; returns the ids that changed"""
+    rows = _run("""
+        UPDATE penalties
+        SET status = 'paid',
+            description = CASE
+                WHEN :note IS NULL THEN description
+                WHEN description IS NULL THEN :note
+                ELSE description || ' | Оплачено: ' || :note
+            END
+        WHERE id = ANY(CAST(:ids AS uuid[]))
+          AND organization_id = :org_id
+          AND status = 'open'
+        RETURNING id
+    """, {'ids': _ids(ids), 'org_id': organization_id, 'note': note or None})
+    return [row[0] for row in rows]
+
+
+def assign_penalties_to_team(ids, team_id, organization_id):
+    rows = _run("""
+        UPDATE penalties
+        SET team_id = CAST(:team_id AS uuid)
+        WHERE id = ANY(CAST(:ids AS uuid[]))
+          AND organization_id = :org_id
+          AND team_id IS DISTINCT FROM CAST(:team_id AS uuid)
+        RETURNING id
+    """, {'ids': _ids(ids), 'team_id': str(team_id), 'org_id': organization_id})
+    return [row[0] for row in rows]
+
+
+def delete_penalties(ids, organization_id):
+    """Delete penalties; returns [(vehicle_id, date)] of the deleted rows"""
+    return _run("""
+        DELETE FROM penalties
+        WHERE id = ANY(CAST(:ids AS uuid[]))
+          AND organization_id = :org_id
+        RETURNING vehicle_id, date
+    """, {'ids': _ids(ids), 'org_id': organization_id})
+
+
+def delete_expenses(ids, organization_id):
+    """Delete car expenses not created by a maintenance; returns [(vehicle_id, date)]"""
+    return _run("""
+        DELETE FROM car_expenses
+        WHERE id = ANY(CAST(:ids AS uuid[]))
+          AND organization_id = :org_id
+          AND maintenance_id IS NULL
+        RETURNING vehicle_id, date
+    """, {'ids': _ids(ids), 'org_id': organization_id})
+
+
+def affected_costs(rows):
+    """Split [(vehicle_id, date)] into distinct vehicle ids and dates for record_cost_change"""
+    return sorted({str(v) for v, _ in rows if v}), sorted({d for _, d in rows if d})
+
+
+def select_rows(records, columns, key):
+    """Show records as a table with multi-row selection; returns the selected ids
+
+    records are tuples whose first element is the id; columns names the
+    remaining elements.
+    """
+    if not records:
+        return []
+    df = pd.DataFrame([record[1:] for record in records], columns=columns)
+    event = st.dataframe(
+        df, hide_index=True, use_container_width=True, key=key,
+        on_select='rerun', selection_mode='multi-row'
+    )
+    if st.checkbox("Выбрать все / Alle auswählen", key=f"{key}_all"):
+        return [record[0] for record in records]
+    return [records[i][0] for i in event.selection.rows]
+
+
+def clear_selection(key):
+    """Forget a select_rows() selection (after its action was applied)"""
+    for state_key in (key, f"{key}_all", f"{key}_confirm"):
+        st.session_state.pop(state_key, None)
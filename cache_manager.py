@@ -16,14 +16,14 @@ def get_cached_vehicles():
     return execute_query("""
         SELECT id, name, license_plate, vin, status, model, year 
         FROM vehicles 
-        ORDER BY name
+        ORDER BY name_sort_key, name
     """)
 
 @st.cache_data(ttl=CACHE_TTL)
 def get_cached_teams():
     """Get all teams with caching"""
     return execute_query("""
-        SELECT id, name, leader_id 
+        SELECT id, name, lead_id 
         FROM teams 
         ORDER BY name
     """)
@@ -39,7 +39,7 @@ def get_cached_users():
 
 @st.cache_data(ttl=CACHE_TTL)
 def get_cached_materials():
-    """Get materials with caching"""
+    """Get materials with caching (assigned quantity from the inventory ledger balances)"""
     return execute_query("""
         SELECT 
             m.id,
@@ -48,10 +48,13 @@ def get_cached_materials():
             m.total_quantity,
             m.unit,
             m.unit_price,
-            COALESCE(SUM(CASE WHEN ma.status = 'active' THEN ma.quantity ELSE 0 END), 0) as assigned_quantity
+            COALESCE(b.assigned_quantity, 0) as assigned_quantity
         FROM materials m
-        LEFT JOIN material_assignments ma ON m.id = ma.material_id
-        GROUP BY m.id, m.name, m.category, m.total_quantity, m.unit, m.unit_price
+        LEFT JOIN (
+            SELECT material_id, SUM(active_quantity) as assigned_quantity
+            FROM inventory_balances
+            GROUP BY material_id
+        ) b ON b.material_id = m.id
         ORDER BY m.name
     """)
 
@@ -72,6 +75,16 @@ def get_dashboard_metrics():
         'open_penalties': open_penalties
     }
 
+@st.cache_data(ttl=CACHE_TTL)
+def get_vehicle_status_counts():
+    """Get vehicle count per status with caching (dashboard chart)"""
+    return execute_query("""
+        SELECT status, COUNT(*) as count 
+        FROM vehicles 
+        GROUP BY status
+        ORDER BY count DESC
+    """)
+
 @st.cache_data(ttl=CACHE_TTL)
 def get_vehicle_assignments():
     """Get vehicle assignments with caching"""
@@ -0,0 +1,222 @@
+"""
+Retention for soft-deleted vehicle and user documents
+
+Deleting a document only sets is_active = false and deleted_at, so it can
+be restored during the grace period. The compactor hard-deletes rows that
+have been inactive for longer than DOCUMENT_GRACE_DAYS, in batches of
+BATCH_ROWS (one transaction each), and removes their files once no
+remaining row references them. sweep_orphans() also removes files in the
+document upload directories that no row references at all (left over from
+failed saves), if they are older than the grace period.
+
+Runs daily in a background thread (start_compactor, started from Home.py)
+or by hand:
+
+    python document_retention.py [--grace-days 30] [--sweep] [--vacuum] [--dry-run]
+
+The report lists deleted rows, removed files and bytes freed on disk, and
+the tables' size and dead tuples, which VACUUM turns into reusable space.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from sqlalchemy import text
+from database import engine
+from query_metrics import background_thread_name
+from tenant_purge import UPLOADS_DIR, split_paths, upload_path
+
+GRACE_DAYS = int(os.getenv('DOCUMENT_GRACE_DAYS', '30'))
+BATCH_ROWS = 500
+COMPACT_INTERVAL = 24 * 3600
+# Document table -> upload directory used only by that table
+DOCUMENT_TABLES = {
+    'vehicle_documents': 'documents',
+    'user_documents': 'user_documents',
+}
+
+_compactor_thread = None
+_compactor_lock = threading.Lock()
+
+
+def table_stats(conn, table):
+    row = conn.execute(text("""
+        SELECT pg_total_relation_size(relid), n_live_tup, n_dead_tup
+        FROM pg_stat_user_tables
+        WHERE relid = to_regclass(:table)
+    """), {'table': table}).fetchone()
+    return {'bytes': row[0], 'live_rows': row[1], 'dead_rows': row[2]} if row else {}
+
+
+def referenced_paths(conn, paths):
+    """The subset of paths still referenced by any document row"""
+    if not paths:
+        return set()
+    patterns = [f"%{os.path.basename(p)}%" for p in paths]
+    rows = []
+    for table in DOCUMENT_TABLES:
+        rows += conn.execute(text(f"""
+            SELECT file_url FROM {table}
+            WHERE file_url LIKE ANY(CAST(:patterns AS text[]))
+        """), {'patterns': patterns}).fetchall()
+    still = {upload_path(p) for row in rows for p in split_paths(row[0])}
+    return {p for p in paths if p in still}
+
+
+def remove_files(paths, dry_run=False):
+    """Remove files; returns (count, bytes)"""
+    count = freed = 0
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+            count += 1
+            freed += size
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ Could not remove {path}: {e}")
+    return count, freed
+
+
+def compact_table(table, grace_days=GRACE_DAYS, batch_rows=BATCH_ROWS, dry_run=False):
+    """Hard-delete expired soft-deleted rows of one table in batches; returns a report"""
+    report = {'table': table, 'rows': 0, 'files': 0, 'file_bytes': 0}
+    with engine.connect() as conn:
+        report['before'] = table_stats(conn, table)
+        if dry_run:
+            rows = conn.execute(text(f"""
+                SELECT file_url FROM {table}
+                WHERE NOT is_active AND deleted_at < CURRENT_TIMESTAMP - make_interval(days => :days)
+            """), {'days': grace_days}).fetchall()
+            paths = {p for row in rows for p in map(upload_path, split_paths(row[0])) if p}
+            report['rows'] = len(rows)
+            report['files'], report['file_bytes'] = remove_files(sorted(paths), dry_run=True)
+            return report
+
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(f"""
+                DELETE FROM {table}
+                WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE NOT is_active AND deleted_at < CURRENT_TIMESTAMP - make_interval(days => :days)
+                    ORDER BY deleted_at
+                    LIMIT :batch
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING file_url
+            """), {'days': grace_days, 'batch': batch_rows}).fetchall()
+        if not rows:
+            break
+        report['rows'] += len(rows)
+        paths = {p for row in rows for p in map(upload_path, split_paths(row[0])) if p}
+        with engine.connect() as conn:
+            orphaned = paths - referenced_paths(conn, paths)
+        count, freed = remove_files(sorted(orphaned))
+        report['files'] += count
+        report['file_bytes'] += freed
+        if len(rows) < batch_rows:
+            break
+
+    with engine.connect() as conn:
+        report['after'] = table_stats(conn, table)
+    return report
+
+
+def sweep_orphans(grace_days=GRACE_DAYS, dry_run=False):
+    """Remove unreferenced files in the document upload directories; returns (count, bytes)"""
+    cutoff = time.time() - grace_days * 86400
+    candidates = set()
+    for directory in DOCUMENT_TABLES.values():
+        root = os.path.join(UPLOADS_DIR, directory)
+        if not os.path.isdir(root):
+            continue
+        for entry in os.scandir(root):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                candidates.add(os.path.realpath(entry.path))
+    if not candidates:
+        return 0, 0
+    with engine.connect() as conn:
+        rows = []
+        for table in DOCUMENT_TABLES:
+            rows += conn.execute(text(f"SELECT file_url FROM {table} WHERE file_url IS NOT NULL")).fetchall()
+    referenced = {upload_path(p) for row in rows for p in split_paths(row[0])}
+    return remove_files(sorted(candidates - referenced), dry_run)
+
+
+def vacuum(tables):
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in tables:
+            conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+
+
+def compact_documents(grace_days=GRACE_DAYS, sweep=False, run_vacuum=False, dry_run=False):
+    """Compact every document table; returns a list of per-table reports"""
+    reports = [compact_table(table, grace_days, dry_run=dry_run) for table in DOCUMENT_TABLES]
+    if sweep:
+        count, freed = sweep_orphans(grace_days, dry_run)
+        reports.append({'table': 'orphaned files', 'rows': 0, 'files': count, 'file_bytes': freed})
+    if run_vacuum and not dry_run:
+        vacuum(DOCUMENT_TABLES)
+        with engine.connect() as conn:
+            for report in reports:
+                if report['table'] in DOCUMENT_TABLES:
+                    report['after'] = table_stats(conn, report['table'])
+    return reports
+
+
+def _compactor_loop():
+    while True:
+        try:
+            for report in compact_documents(sweep=True):
+                if report['rows'] or report['files']:
+                    print(f"Document retention {report['table']}: {report['rows']} rows, "
+                          f"{report['files']} files, {report['file_bytes']} bytes")
+        except Exception as e:
+            print(f"Document retention failed: {e}")
+        time.sleep(COMPACT_INTERVAL)
+
+
+def start_compactor():
+    """Start the daily compactor thread once per process"""
+    global _compactor_thread
+    with _compactor_lock:
+        if _compactor_thread is None or not _compactor_thread.is_alive():
+            _compactor_thread = threading.Thread(
+                target=_compactor_loop, name=background_thread_name("document-retention"), daemon=True
+            )
+            _compactor_thread.start()
+
+
+def _format_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(value) < 1024 or unit == 'GB':
+            return f"{value:.1f} {unit}" if unit != 'B' else f"{value} B"
+        value /= 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hard-delete soft-deleted documents past the grace period")
+    parser.add_argument('--grace-days', type=int, default=GRACE_DAYS)
+    parser.add_argument('--sweep', action='store_true', help="also remove unreferenced files in the upload directories")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM the tables afterwards")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be removed")
+    options = parser.parse_args(argv)
+
+    reports = compact_documents(options.grace_days, options.sweep, options.vacuum, options.dry_run)
+    prefix = "would remove" if options.dry_run else "removed"
+    for report in reports:
+        print(f"{report['table']}: {prefix} {report['rows']} rows, {report['files']} files "
+              f"({_format_bytes(report['file_bytes'])} on disk)")
+        before, after = report.get('before'), report.get('after')
+        if before and after:
+            print(f"    table {_format_bytes(before['bytes'])} -> {_format_bytes(after['bytes'])}, "
+                  f"dead tuples {before['dead_rows']} -> {after['dead_rows']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
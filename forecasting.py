@@ -0,0 +1,225 @@
+"""
+Monthly fleet spend forecasting
+
+Additive Holt-Winters models (12-month season) are fitted in NumPy on the
+monthly spend series of every organization: the tenant total, each expense
+category (plus penalties) and each vehicle. All smoothing parameter
+candidates are evaluated at once as vectors, and the best fit's final state
+is stored in spend_forecast_models.
+
+Pages only read the stored state and extrapolate it, so no model is fitted
+during a request. Models are refit daily by a background thread started
+from Home.py; refresh manually with: python forecasting.py
+"""
+import json
+import threading
+import time
+from datetime import date
+from lazy_imports import lazy_module
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+from sqlalchemy import text
+from database import engine, execute_query
+from query_metrics import background_thread_name
+
+SEASON_LENGTH = 12
+# Months ahead shown in projections
+DEFAULT_HORIZON = 3
+# Width of the projection band (≈95%)
+BAND_Z = 1.96
+
+FORECAST_REFRESH_INTERVAL = 24 * 3600
+
+_refresh_thread = None
+_refresh_lock = threading.Lock()
+
+ALPHAS = (0.1, 0.3, 0.5, 0.7, 0.9)
+BETAS = (0.01, 0.1, 0.3)
+GAMMAS = (0.05, 0.2, 0.5)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def fit_holt_winters(values, season_length=SEASON_LENGTH):
+    """Fit an additive Holt-Winters model by grid search on one-step SSE
+
+    Falls back to Holt's linear trend with fewer than two seasons of data and
+    to the mean with fewer than three points. Returns a JSON-serializable state.
+    """
+    y = np.asarray(values, dtype=float)
+    n = len(y)
+    if n < 3:
+        return {'method': 'mean', 'level': float(y.mean()) if n else 0.0, 'trend': 0.0,
+                'season': [0.0], 'sigma': float(y.std()) if n else 0.0, 'n': n}
+
+    seasonal = n >= 2 * season_length
+    m = season_length if seasonal else 1
+    grid = np.array([(a, b, g) for a in ALPHAS for b in BETAS for g in (GAMMAS if seasonal else (0.0,))])
+    alpha, beta, gamma = grid[:, 0], grid[:, 1], grid[:, 2]
+    candidates = len(grid)
+
+    if seasonal:
+        first, second = y[:m].mean(), y[m:2 * m].mean()
+        level = np.full(candidates, first)
+        trend = np.full(candidates, (second - first) / m)
+        season = np.tile(y[:m] - first, (candidates, 1))
+    else:
+        level = np.full(candidates, y[0])
+        trend = np.full(candidates, y[1] - y[0])
+        season = np.zeros((candidates, 1))
+
+    sse = np.zeros(candidates)
+    for t in range(n):
+        slot = t % m
+        s = season[:, slot]
+        error = y[t] - (level + trend + s)
+        sse += error ** 2
+        new_level = alpha * (y[t] - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        season[:, slot] = gamma * (y[t] - new_level) + (1 - gamma) * s
+        level = new_level
+
+    best = int(np.argmin(sse))
+    return {
+        'method': 'holt_winters' if seasonal else 'holt',
+        'alpha': float(alpha[best]),
+        'beta': float(beta[best]),
+        'gamma': float(gamma[best]),
+        'level': float(level[best]),
+        'trend': float(trend[best]),
+        'season': [float(v) for v in season[best]],
+        'sigma': float(np.sqrt(sse[best] / n)),
+        'n': n
+    }
+
+
+def project(model, horizon=DEFAULT_HORIZON):
+    """Extrapolate a stored model: list of (month, value, lower, upper)"""
+    last_month = date.fromisoformat(model['last_month'])
+    season = model['season']
+    points = []
+    for h in range(1, horizon + 1):
+        value = model['level'] + h * model['trend'] + season[(model['n'] + h - 1) % len(season)]
+        spread = BAND_Z * model['sigma'] * h ** 0.5
+        points.append((
+            _add_months(last_month, h),
+            max(value, 0.0),
+            max(value - spread, 0.0),
+            max(value + spread, 0.0)
+        ))
+    return points
+
+
+def load_monthly_spend(org_id, before_month):
+    """Load complete months of spend per category and vehicle as a DataFrame"""
+    rows = execute_query("""
+        SELECT DATE_TRUNC('month', date)::date as month, category, vehicle_id, SUM(amount) as amount
+        FROM car_expenses
+        WHERE organization_id = :org_id AND date < :before_month
+        GROUP BY DATE_TRUNC('month', date), category, vehicle_id
+        UNION ALL
+        SELECT DATE_TRUNC('month', date)::date as month, 'penalties' as category, vehicle_id, SUM(amount) as amount
+        FROM penalties
+        WHERE organization_id = :org_id AND date < :before_month
+        GROUP BY DATE_TRUNC('month', date), vehicle_id
+    """, {'org_id': org_id, 'before_month': before_month}) or []
+    df = pd.DataFrame(rows, columns=['month', 'category', 'vehicle_id', 'amount'])
+    df['amount'] = df['amount'].astype(float)
+    return df
+
+
+def _continuous_series(df, column, last_month):
+    """Pivot to one zero-filled monthly series per value of column"""
+    first_month = df['month'].min()
+    months = pd.date_range(first_month, last_month, freq='MS').date
+    pivot = df.pivot_table(index='month', columns=column, values='amount', aggfunc='sum')
+    return pivot.reindex(months, fill_value=0).fillna(0)
+
+
+def fit_tenant_models(org_id, today=None):
+    """Fit tenant, category and vehicle models for one organization"""
+    current_month = (today or date.today()).replace(day=1)
+    last_month = _add_months(current_month, -1)
+    df = load_monthly_spend(org_id, current_month)
+    if df.empty:
+        return []
+
+    df['total'] = 'all'
+    df['vehicle_id'] = df['vehicle_id'].astype(str)
+    models = []
+    for scope, column in (('tenant', 'total'), ('category', 'category'), ('vehicle', 'vehicle_id')):
+        series = _continuous_series(df, column, last_month)
+        for key in series.columns:
+            model = fit_holt_winters(series[key].values)
+            model['last_month'] = last_month.isoformat()
+            models.append((scope, str(key), model))
+    return models
+
+
+def refresh_forecasts(org_id=None):
+    """Refit and store models for one or all active organizations"""
+    if org_id:
+        organizations = [(org_id,)]
+    else:
+        organizations = execute_query(
+            "SELECT id FROM organizations WHERE subscription_status = 'active'"
+        ) or []
+
+    fitted = 0
+    for org in organizations:
+        models = fit_tenant_models(org[0])
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM spend_forecast_models WHERE organization_id = :org_id"),
+                         {'org_id': org[0]})
+            if models:
+                conn.execute(text("""
+                    INSERT INTO spend_forecast_models (organization_id, scope, scope_key, model, fitted_at)
+                    VALUES (:org_id, :scope, :scope_key, CAST(:model AS jsonb), CURRENT_TIMESTAMP)
+                """), [
+                    {'org_id': org[0], 'scope': scope, 'scope_key': key, 'model': json.dumps(model)}
+                    for scope, key, model in models
+                ])
+        fitted += len(models)
+    return fitted
+
+
+def _refresh_loop():
+    while True:
+        try:
+            refresh_forecasts()
+        except Exception as e:
+            print(f"Forecast refresh failed: {e}")
+        time.sleep(FORECAST_REFRESH_INTERVAL)
+
+
+def start_forecast_refresh():
+    """Start the daily forecast refit thread once per process"""
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is None or not _refresh_thread.is_alive():
+            _refresh_thread = threading.Thread(
+                target=_refresh_loop, name=background_thread_name("forecast-refresh"), daemon=True
+            )
+            _refresh_thread.start()
+
+
+def get_forecast(org_id, scope='tenant', scope_key='all', horizon=DEFAULT_HORIZON):
+    """Get the projection of a stored model, or [] if none was fitted yet"""
+    result = execute_query("""
+        SELECT model FROM spend_forecast_models
+        WHERE organization_id = :org_id AND scope = :scope AND scope_key = :scope_key
+    """, {'org_id': org_id, 'scope': scope, 'scope_key': scope_key})
+    if not result:
+        return []
+    model = result[0][0]
+    if isinstance(model, str):
+        model = json.loads(model)
+    return project(model, horizon)
+
+
+if __name__ == "__main__":
+    count = refresh_forecasts()
+    print(f"✅ Fitted {count} spend forecast models")
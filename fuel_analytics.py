@@ -0,0 +1,248 @@
+"""
+Batch fuel consumption analytics over car_expenses
+
+Each vehicle's refuel sequence (category 'fuel' with liters and odometer) is
+processed in one vectorized pandas pass: distance since the previous refuel,
+L/100km, a rolling baseline of the preceding refuels and z-score/IQR outlier
+flags. Results go to fuel_consumption_stats.
+
+Runs are incremental: only vehicles whose refuels were added, edited or
+deleted since the last run (detected by diffing car_expenses against the
+stored stats) are recomputed, in batches of vehicles to bound memory.
+
+A background thread started from Home.py runs this daily; run manually
+with: python fuel_analytics.py
+"""
+import math
+import threading
+import time
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
+from sqlalchemy import text
+from database import engine, execute_query
+from query_metrics import background_thread_name
+
+# Number of preceding refuels forming the rolling baseline
+BASELINE_WINDOW = 10
+# Minimum preceding refuels before a refuel can be flagged
+MIN_HISTORY = 4
+# |z| above this marks an anomaly
+Z_THRESHOLD = 3.0
+# Tukey fences: Q1 - k*IQR / Q3 + k*IQR
+IQR_FACTOR = 1.5
+# Vehicles recomputed per batch
+VEHICLE_BATCH = 500
+
+FUEL_STATS_REFRESH_INTERVAL = 24 * 3600
+
+_refresh_thread = None
+_refresh_lock = threading.Lock()
+
+
+def find_touched_vehicles(org_id=None):
+    """Return ids of vehicles whose refuels differ from the stored stats"""
+    org_filter = "AND organization_id = :org_id" if org_id else ""
+    rows = execute_query(f"""
+        SELECT DISTINCT ce.vehicle_id, s.vehicle_id
+        FROM (
+            SELECT id, vehicle_id, date, odometer_reading, liters
+            FROM car_expenses
+            WHERE category = 'fuel'
+              AND odometer_reading IS NOT NULL
+              AND liters IS NOT NULL
+              {org_filter}
+        ) ce
+        FULL OUTER JOIN (
+            SELECT expense_id, vehicle_id, date, odometer_reading, liters
+            FROM fuel_consumption_stats
+            WHERE 1=1 {org_filter}
+        ) s ON s.expense_id = ce.id
+        WHERE ce.id IS NULL
+           OR s.expense_id IS NULL
+           OR (ce.vehicle_id, ce.date, ce.odometer_reading, ce.liters)
+              IS DISTINCT FROM (s.vehicle_id, s.date, s.odometer_reading, s.liters)
+    """, {'org_id': org_id} if org_id else None) or []
+
+    touched = set()
+    for row in rows:
+        touched.update(str(v) for v in row if v)
+    return sorted(touched)
+
+
+def load_refuels(vehicle_ids):
+    """Load the refuel sequences of the given vehicles as a DataFrame"""
+    rows = execute_query("""
+        SELECT id, organization_id, vehicle_id, date, odometer_reading, liters
+        FROM car_expenses
+        WHERE category = 'fuel'
+          AND vehicle_id = ANY(CAST(:vehicle_ids AS uuid[]))
+          AND odometer_reading IS NOT NULL
+          AND liters IS NOT NULL
+        ORDER BY vehicle_id, date, odometer_reading
+    """, {'vehicle_ids': list(vehicle_ids)}) or []
+
+    df = pd.DataFrame(rows, columns=['expense_id', 'organization_id', 'vehicle_id', 'date', 'odometer_reading', 'liters'])
+    df['odometer_reading'] = df['odometer_reading'].astype(float)
+    df['liters'] = df['liters'].astype(float)
+    return df
+
+
+def compute_consumption(df):
+    """Compute distance, L/100km, rolling baseline and outlier flags per vehicle
+
+    Each refuel's liters are attributed to the distance driven since the
+    previous refuel (full-tank method). Baselines only use earlier refuels.
+    """
+    df = df.sort_values(['vehicle_id', 'date', 'odometer_reading'], kind='stable').reset_index(drop=True)
+    by_vehicle = df.groupby('vehicle_id', sort=False)
+
+    df['distance_km'] = df['odometer_reading'] - by_vehicle['odometer_reading'].shift(1)
+    df['l_per_100km'] = (df['liters'] / df['distance_km'] * 100).where(df['distance_km'] > 0)
+
+    previous = by_vehicle['l_per_100km'].shift(1)
+    rolling = previous.groupby(df['vehicle_id'], sort=False).rolling(BASELINE_WINDOW, min_periods=MIN_HISTORY)
+
+    def aligned(series):
+        return series.reset_index(level=0, drop=True)
+
+    df['baseline_l_per_100km'] = aligned(rolling.median())
+    mean = aligned(rolling.mean())
+    std = aligned(rolling.std())
+    q1 = aligned(rolling.quantile(0.25))
+    q3 = aligned(rolling.quantile(0.75))
+
+    df['z_score'] = ((df['l_per_100km'] - mean) / std).where(std > 0)
+    iqr = q3 - q1
+    df['is_iqr_outlier'] = (
+        (df['l_per_100km'] > q3 + IQR_FACTOR * iqr) | (df['l_per_100km'] < q1 - IQR_FACTOR * iqr)
+    ).fillna(False)
+    df['is_anomaly'] = (
+        df['is_iqr_outlier']
+        | (df['z_score'].abs() > Z_THRESHOLD).fillna(False)
+        | (df['distance_km'] < 0).fillna(False)  # odometer went backwards
+    )
+    return df
+
+
+def _to_records(df):
+    def clean(value):
+        return None if isinstance(value, float) and math.isnan(value) else value
+
+    records = []
+    for row in df.itertuples(index=False):
+        records.append({
+            'expense_id': str(row.expense_id),
+            'organization_id': str(row.organization_id),
+            'vehicle_id': str(row.vehicle_id),
+            'date': row.date,
+            'odometer_reading': int(row.odometer_reading),
+            'liters': row.liters,
+            'distance_km': None if math.isnan(row.distance_km) else int(row.distance_km),
+            'l_per_100km': clean(round(row.l_per_100km, 2)),
+            'baseline_l_per_100km': clean(round(row.baseline_l_per_100km, 2)),
+            'z_score': clean(round(row.z_score, 2)),
+            'is_iqr_outlier': bool(row.is_iqr_outlier),
+            'is_anomaly': bool(row.is_anomaly)
+        })
+    return records
+
+
+def _store(vehicle_ids, records):
+    """Replace the stats of a vehicle batch in one transaction"""
+    with engine.begin() as conn:
+        conn.execute(
+            text("DELETE FROM fuel_consumption_stats WHERE vehicle_id = ANY(CAST(:vehicle_ids AS uuid[]))"),
+            {'vehicle_ids': list(vehicle_ids)}
+        )
+        if records:
+            conn.execute(text("""
+                INSERT INTO fuel_consumption_stats (
+                    expense_id, organization_id, vehicle_id, date, odometer_reading, liters,
+                    distance_km, l_per_100km, baseline_l_per_100km, z_score,
+                    is_iqr_outlier, is_anomaly, computed_at
+                ) VALUES (
+                    :expense_id, :organization_id, :vehicle_id, :date, :odometer_reading, :liters,
+                    :distance_km, :l_per_100km, :baseline_l_per_100km, :z_score,
+                    :is_iqr_outlier, :is_anomaly, CURRENT_TIMESTAMP
+                )
+            """), records)
+
+
+def run_fuel_analytics(org_id=None, vehicle_ids=None):
+    """Recompute fuel stats for touched vehicles (or the given ones)
+
+    Returns a summary dict with counts of vehicles, refuels and anomalies.
+    """
+    if vehicle_ids is None:
+        vehicle_ids = find_touched_vehicles(org_id)
+    vehicle_ids = [str(v) for v in vehicle_ids]
+
+    summary = {'vehicles': len(vehicle_ids), 'refuels': 0, 'anomalies': 0}
+    for start in range(0, len(vehicle_ids), VEHICLE_BATCH):
+        batch = vehicle_ids[start:start + VEHICLE_BATCH]
+        df = load_refuels(batch)
+        if not df.empty:
+            df = compute_consumption(df)
+            summary['refuels'] += len(df)
+            summary['anomalies'] += int(df['is_anomaly'].sum())
+        _store(batch, _to_records(df) if not df.empty else [])
+    return summary
+
+
+def _refresh_loop():
+    while True:
+        try:
+            run_fuel_analytics()
+        except Exception as e:
+            print(f"Fuel analytics refresh failed: {e}")
+        time.sleep(FUEL_STATS_REFRESH_INTERVAL)
+
+
+def start_fuel_stats_refresh():
+    """Start the daily fuel analytics thread once per process"""
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is None or not _refresh_thread.is_alive():
+            _refresh_thread = threading.Thread(
+                target=_refresh_loop, name=background_thread_name("fuel-analytics"), daemon=True
+            )
+            _refresh_thread.start()
+
+
+def get_fuel_anomalies(org_id, limit=100):
+    """Get the most recent anomalous refuels of an organization"""
+    return execute_query("""
+        SELECT
+            s.expense_id,
+            s.date,
+            v.name as vehicle_name,
+            v.license_plate,
+            s.liters,
+            s.distance_km,
+            s.l_per_100km,
+            s.baseline_l_per_100km,
+            s.z_score,
+            s.is_iqr_outlier
+        FROM fuel_consumption_stats s
+        JOIN vehicles v ON s.vehicle_id = v.id
+        WHERE s.organization_id = :org_id AND s.is_anomaly = TRUE
+        ORDER BY s.date DESC
+        LIMIT :limit
+    """, {'org_id': org_id, 'limit': limit}) or []
+
+
+def get_vehicle_consumption(vehicle_id):
+    """Get the computed refuel sequence of one vehicle"""
+    return execute_query("""
+        SELECT date, odometer_reading, liters, distance_km, l_per_100km,
+               baseline_l_per_100km, z_score, is_anomaly
+        FROM fuel_consumption_stats
+        WHERE vehicle_id = :vehicle_id
+        ORDER BY date, odometer_reading
+    """, {'vehicle_id': vehicle_id}) or []
+
+
+if __name__ == "__main__":
+    result = run_fuel_analytics()
+    print(f"✅ Fuel analytics: {result['vehicles']} vehicles, "
+          f"{result['refuels']} refuels, {result['anomalies']} anomalies")
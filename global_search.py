@@ -0,0 +1,294 @@
+"""
+Global search across vehicles, users, teams, team members, penalties,
+expenses and documents
+
+search_index holds one row per searchable entity (type, id, tenant, the
+vehicle it belongs to, a title and subtitle for display, the text as a
+'simple' tsvector and as a trigram-indexed string). AFTER triggers on the
+source tables keep it current on every write path (pages, imports, bulk
+actions, COPY); create_triggers() installs them from ENTITIES and
+rebuild() refills the index. The installed trigger version (a hash of the
+generated functions) is kept in the comment of search_index, so the
+migration only touches the source tables when ENTITIES changes: DROP and
+CREATE TRIGGER lock the busiest tables exclusively.
+
+search() matches the index once: full-text and trigram word similarity on
+the text, plus the normalized plate/VIN key, so "B-QZ 2812" finds the
+vehicle stored as "BQZ 2812". Documents, penalties and expenses of a
+matched vehicle and its current team are returned with it, ranked just
+below.
+
+    python global_search.py rebuild
+    python global_search.py <organization_id> <text>
+"""
+import argparse
+import hashlib
+import sys
+import time
+from sqlalchemy import text
+from database import engine
+from vehicle_search import normalize_key
+
+SEARCH_LIMIT = 30
+# Related rows of a matched vehicle rank at this share of the vehicle's score
+RELATED_WEIGHT = 0.8
+
+# table -> entity type, vehicle id, title, subtitle, searchable text and the
+# condition for a row to be indexed; {r} is the row (NEW in triggers)
+ENTITIES = {
+    'vehicles': {
+        'type': 'vehicle',
+        'vehicle': "{r}.id",
+        'title': "{r}.name",
+        'subtitle': "concat_ws(' · ', {r}.license_plate, {r}.model)",
+        'text': "concat_ws(' ', {r}.name, {r}.license_plate, {r}.plate_key, {r}.vin, {r}.model)",
+    },
+    'users': {
+        'type': 'user',
+        'vehicle': "NULL::uuid",
+        'title': "concat_ws(' ', {r}.first_name, {r}.last_name)",
+        'subtitle': "{r}.email",
+        'text': "concat_ws(' ', {r}.first_name, {r}.last_name, {r}.email, {r}.phone)",
+    },
+    'teams': {
+        'type': 'team',
+        'vehicle': "NULL::uuid",
+        'title': "{r}.name",
+        'subtitle': "NULL",
+        'text': "{r}.name",
+    },
+    'team_members': {
+        'type': 'team_member',
+        'vehicle': "NULL::uuid",
+        'title': "concat_ws(' ', {r}.first_name, {r}.last_name)",
+        'subtitle': "{r}.phone",
+        'text': "concat_ws(' ', {r}.first_name, {r}.last_name, {r}.phone)",
+    },
+    'penalties': {
+        'type': 'penalty',
+        'vehicle': "{r}.vehicle_id",
+        'title': "concat_ws(' ', to_char({r}.date, 'DD.MM.YYYY'), {r}.amount || ' €')",
+        'subtitle': "concat_ws(' · ', {r}.status::text, left({r}.description, 80))",
+        'text': "concat_ws(' ', {r}.description, {r}.amount, to_char({r}.date, 'DD.MM.YYYY'))",
+    },
+    'car_expenses': {
+        'type': 'expense',
+        'vehicle': "{r}.vehicle_id",
+        'title': "concat_ws(' ', to_char({r}.date, 'DD.MM.YYYY'), {r}.amount || ' €')",
+        'subtitle': "concat_ws(' · ', {r}.category, left({r}.description, 80))",
+        'text': "concat_ws(' ', {r}.category, {r}.description, {r}.amount, to_char({r}.date, 'DD.MM.YYYY'))",
+    },
+    'vehicle_documents': {
+        'type': 'vehicle_document',
+        'vehicle': "{r}.vehicle_id",
+        'title': "coalesce({r}.title, {r}.document_type)",
+        'subtitle': "concat_ws(' · ', {r}.document_type, to_char({r}.date_expiry, 'DD.MM.YYYY'))",
+        'text': "concat_ws(' ', {r}.title, {r}.document_type)",
+        'where': "{r}.is_active",
+    },
+    'user_documents': {
+        'type': 'user_document',
+        'vehicle': "NULL::uuid",
+        'title': "coalesce({r}.title, {r}.document_type)",
+        'subtitle': "{r}.document_type",
+        'text': "concat_ws(' ', {r}.title, {r}.document_type)",
+        'where': "{r}.is_active",
+    },
+}
+
+
+def _expressions(spec, row):
+    return {key: value.format(r=row) for key, value in spec.items() if key != 'type'}
+
+
+def trigger_function(table, spec):
+    """plpgsql trigger function keeping one table's rows in search_index"""
+    e = _expressions(spec, 'NEW')
+    where = e.get('where', 'true')
+    return f"""
+        CREATE OR REPLACE FUNCTION search_index_{table}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM search_index WHERE entity_type = '{spec['type']}' AND entity_id = OLD.id;
+                RETURN OLD;
+            END IF;
+            IF NOT coalesce({where}, false) THEN
+                DELETE FROM search_index WHERE entity_type = '{spec['type']}' AND entity_id = NEW.id;
+                RETURN NEW;
+            END IF;
+            INSERT INTO search_index (entity_type, entity_id, organization_id, vehicle_id,
+                                      title, subtitle, search_text, document, updated_at)
+            VALUES ('{spec['type']}', NEW.id, NEW.organization_id, {e['vehicle']},
+                    {e['title']}, {e['subtitle']}, {e['text']}, to_tsvector('simple', {e['text']}),
+                    CURRENT_TIMESTAMP)
+            ON CONFLICT (entity_type, entity_id) DO UPDATE SET
+                organization_id = EXCLUDED.organization_id,
+                vehicle_id = EXCLUDED.vehicle_id,
+                title = EXCLUDED.title,
+                subtitle = EXCLUDED.subtitle,
+                search_text = EXCLUDED.search_text,
+                document = EXCLUDED.document,
+                updated_at = EXCLUDED.updated_at;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """
+
+
+def backfill_statement(table, spec):
+    e = _expressions(spec, 't')
+    return f"""
+        INSERT INTO search_index (entity_type, entity_id, organization_id, vehicle_id,
+                                  title, subtitle, search_text, document)
+        SELECT '{spec['type']}', t.id, t.organization_id, {e['vehicle']},
+               {e['title']}, {e['subtitle']}, {e['text']}, to_tsvector('simple', {e['text']})
+        FROM {table} t
+        WHERE coalesce({e.get('where', 'true')}, false)
+        ON CONFLICT (entity_type, entity_id) DO NOTHING
+    """
+
+
+def trigger_version():
+    """Hash of the generated trigger functions; changes whenever ENTITIES does"""
+    sql = ''.join(trigger_function(table, spec) for table, spec in sorted(ENTITIES.items()))
+    return hashlib.sha256(sql.encode('utf-8')).hexdigest()[:16]
+
+
+def installed_version(conn):
+    comment = conn.execute(text("SELECT obj_description(to_regclass('search_index'), 'pg_class')")).scalar()
+    return (comment or '').removeprefix('triggers ')
+
+
+def indexed_tables(conn):
+    return [table for table in ENTITIES
+            if conn.execute(text("SELECT to_regclass(:t)"), {'t': table}).scalar()]
+
+
+def create_triggers(conn):
+    """(Re)install the trigger functions and triggers; returns the indexed tables"""
+    tables = []
+    for table in indexed_tables(conn):
+        # A trigger referencing a missing column would break every write to the table
+        try:
+            with conn.begin_nested():
+                e = _expressions(ENTITIES[table], 't')
+                conn.execute(text(f"SELECT {e['vehicle']}, {e['title']}, {e['subtitle']}, {e['text']}, "
+                                  f"{e.get('where', 'true')} FROM {table} t LIMIT 0"))
+        except Exception as error:
+            print(f"⚠️ {table} not indexed for search: {error}")
+            continue
+        tables.append(table)
+        conn.execute(text(trigger_function(table, ENTITIES[table])))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS trg_search_index ON {table}"))
+        conn.execute(text(f"""
+            CREATE TRIGGER trg_search_index
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION search_index_{table}()
+        """))
+    conn.execute(text(f"COMMENT ON TABLE search_index IS 'triggers {trigger_version()}'"))
+    return tables
+
+
+def rebuild(conn):
+    """Refill search_index from the source tables; returns the indexed row count"""
+    conn.execute(text("TRUNCATE search_index"))
+    for table in create_triggers(conn):
+        conn.execute(text(backfill_statement(table, ENTITIES[table])))
+    return conn.execute(text("SELECT COUNT(*) FROM search_index")).scalar()
+
+
+def search(organization_id, query, limit=SEARCH_LIMIT, entity_types=None):
+    """[{entity_type, entity_id, vehicle_id, title, subtitle, score, via_vehicle}] best first"""
+    query = (query or '').strip()
+    if not query:
+        return []
+    key = normalize_key(query)
+    params = {
+        'org_id': organization_id,
+        'q': query,
+        'like': f"%{query}%",
+        'key_like': f"%{key}%" if len(key) >= 3 else None,
+        'weight': RELATED_WEIGHT,
+        'types': list(entity_types) if entity_types else None,
+        'limit': limit
+    }
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            WITH matched AS (
+                SELECT s.entity_type, s.entity_id, s.vehicle_id, s.title, s.subtitle,
+                       ts_rank(s.document, plainto_tsquery('simple', :q))
+                       + word_similarity(:q, s.search_text)
+                       + CASE WHEN s.search_text ILIKE :like OR s.search_text LIKE :key_like THEN 1 ELSE 0 END
+                       AS score
+                FROM search_index s
+                WHERE s.organization_id = :org_id
+                  AND (s.document @@ plainto_tsquery('simple', :q)
+                       OR :q <% s.search_text
+                       OR s.search_text ILIKE :like
+                       OR s.search_text LIKE :key_like)
+                ORDER BY score DESC
+                LIMIT 200
+            ),
+            vehicles AS (
+                SELECT entity_id AS vehicle_id, score FROM matched WHERE entity_type = 'vehicle'
+            ),
+            related AS (
+                SELECT s.entity_type, s.entity_id, s.vehicle_id, s.title, s.subtitle,
+                       v.score * :weight AS score
+                FROM vehicles v
+                JOIN search_index s ON s.vehicle_id = v.vehicle_id AND s.entity_type <> 'vehicle'
+                WHERE s.organization_id = :org_id
+                UNION ALL
+                SELECT s.entity_type, s.entity_id, va.vehicle_id, s.title, s.subtitle,
+                       v.score * :weight AS score
+                FROM vehicles v
+                JOIN vehicle_assignments va ON va.vehicle_id = v.vehicle_id AND va.end_date IS NULL
+                JOIN search_index s ON s.entity_type = 'team' AND s.entity_id = va.team_id
+                WHERE s.organization_id = :org_id
+            ),
+            ranked AS (
+                SELECT DISTINCT ON (entity_type, entity_id)
+                       entity_type, entity_id, vehicle_id, title, subtitle, score, via_vehicle
+                FROM (
+                    SELECT *, false AS via_vehicle FROM matched
+                    UNION ALL
+                    SELECT *, true AS via_vehicle FROM related
+                ) candidates
+                WHERE CAST(:types AS text[]) IS NULL OR entity_type = ANY(CAST(:types AS text[]))
+                ORDER BY entity_type, entity_id, score DESC
+            )
+            SELECT entity_type, entity_id, vehicle_id, title, subtitle, score, via_vehicle
+            FROM ranked
+            ORDER BY score DESC, title
+            LIMIT :limit
+        """), params).fetchall()
+    keys = ('entity_type', 'entity_id', 'vehicle_id', 'title', 'subtitle', 'score', 'via_vehicle')
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild or query the global search index")
+    parser.add_argument('organization_id', help="organization to search, or 'rebuild'")
+    parser.add_argument('text', nargs='?')
+    parser.add_argument('--limit', type=int, default=SEARCH_LIMIT)
+    options = parser.parse_args(argv)
+
+    if options.organization_id == 'rebuild':
+        with engine.begin() as conn:
+            count = rebuild(conn)
+        print(f"✅ Indexed {count} rows")
+        return 0
+
+    started = time.perf_counter()
+    results = search(options.organization_id, options.text, options.limit)
+    elapsed = (time.perf_counter() - started) * 1000
+    for result in results:
+        via = ' (via vehicle)' if result['via_vehicle'] else ''
+        print(f"{result['score']:5.2f}  {result['entity_type']:<16} {result['title'] or ''}"
+              f"  {result['subtitle'] or ''}{via}")
+    print(f"{len(results)} results in {elapsed:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
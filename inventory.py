@@ -0,0 +1,119 @@
+"""
+Equipment inventory ledger
+
+Every movement of a material between the stock and a team is appended to
+inventory_events, and the running per-material, per-team totals are kept in
+inventory_balances in the same transaction. Availability and team holdings
+are therefore point lookups on the balance table, independent of how long the
+assignment history is.
+
+Event -> balance change:
+- assigned:          active += quantity
+- marked_for_return: active -= quantity, pending_return += quantity
+- returned:          pending_return -= quantity, returned += quantity
+- broken:            pending_return -= quantity, broken += quantity
+"""
+from datetime import date
+from sqlalchemy import text
+from database import execute_query
+
+# (active, pending_return, returned, broken) deltas per unit of quantity
+BALANCE_DELTAS = {
+    'assigned': (1, 0, 0, 0),
+    'marked_for_return': (-1, 1, 0, 0),
+    'returned': (0, -1, 1, 0),
+    'broken': (0, -1, 0, 1),
+}
+
+
+def record_event(conn, organization_id, material_id, team_id, event, quantity,
+                 assignment_id=None, notes=None, event_date=None):
+    """Append a ledger event and apply it to the balance (inside conn's transaction)"""
+    active, pending, returned, broken = (d * quantity for d in BALANCE_DELTAS[event])
+    params = {
+        'organization_id': organization_id,
+        'material_id': material_id,
+        'team_id': team_id,
+        'assignment_id': assignment_id,
+        'event': event,
+        'quantity': quantity,
+        'date': event_date or date.today(),
+        'notes': notes,
+        'active': active,
+        'pending': pending,
+        'returned': returned,
+        'broken': broken
+    }
+    conn.execute(text("""
+        INSERT INTO inventory_events (
+            organization_id, material_id, team_id, assignment_id, event, quantity, date, notes
+        ) VALUES (
+            :organization_id, :material_id, :team_id, :assignment_id, :event, :quantity, :date, :notes
+        )
+    """), params)
+    conn.execute(text("""
+        INSERT INTO inventory_balances (
+            organization_id, material_id, team_id, active_quantity,
+            pending_return_quantity, returned_quantity, broken_quantity, updated_at
+        ) VALUES (
+            :organization_id, :material_id, :team_id, :active,
+            :pending, :returned, :broken, CURRENT_TIMESTAMP
+        )
+        ON CONFLICT (material_id, team_id) DO UPDATE SET
+            active_quantity = inventory_balances.active_quantity + EXCLUDED.active_quantity,
+            pending_return_quantity = inventory_balances.pending_return_quantity + EXCLUDED.pending_return_quantity,
+            returned_quantity = inventory_balances.returned_quantity + EXCLUDED.returned_quantity,
+            broken_quantity = inventory_balances.broken_quantity + EXCLUDED.broken_quantity,
+            updated_at = EXCLUDED.updated_at
+    """), params)
+
+
+def get_material_availability(material_id):
+    """Get (active, pending_return) quantities of a material across all teams"""
+    result = execute_query("""
+        SELECT COALESCE(SUM(active_quantity), 0), COALESCE(SUM(pending_return_quantity), 0)
+        FROM inventory_balances
+        WHERE material_id = :material_id
+    """, {'material_id': material_id})
+    return tuple(result[0]) if result else (0, 0)
+
+
+def get_team_holdings(team_id):
+    """Get materials currently held by a team"""
+    return execute_query("""
+        SELECT
+            b.material_id,
+            m.name,
+            m.type,
+            b.active_quantity,
+            b.pending_return_quantity
+        FROM inventory_balances b
+        JOIN materials m ON b.material_id = m.id
+        WHERE b.team_id = :team_id
+          AND (b.active_quantity > 0 OR b.pending_return_quantity > 0)
+        ORDER BY m.name
+    """, {'team_id': team_id}) or []
+
+
+def get_return_events(organization_id, limit=100):
+    """Get the latest completed equipment returns from the ledger"""
+    return execute_query("""
+        SELECT
+            e.assignment_id::text,
+            m.name as material_name,
+            m.type,
+            m.unit,
+            t.name as team_name,
+            e.quantity,
+            e.date,
+            e.event,
+            e.notes
+        FROM inventory_events e
+        JOIN materials m ON e.material_id = m.id
+        JOIN teams t ON e.team_id = t.id
+        WHERE e.organization_id = :organization_id
+          AND e.event IN ('returned', 'broken')
+          AND m.type = 'equipment'
+        ORDER BY e.created_at DESC
+        LIMIT :limit
+    """, {'organization_id': organization_id, 'limit': limit}) or []
@@ -0,0 +1,57 @@
+"""
+Deferred imports for heavy libraries
+
+    pd = lazy_module('pandas')
+
+binds a placeholder module that imports the real one on first attribute
+access, so a page only pays for pandas/plotly when a code path actually uses
+them (the login page never does). Load times are recorded for
+startup_benchmark.py.
+"""
+import importlib
+import threading
+import time
+import types
+
+_lock = threading.Lock()
+_load_times = {}
+
+
+class LazyModule(types.ModuleType):
+    """Module placeholder that imports the named module when first used"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            with _lock:
+                module = self.__dict__['_lazy_module']
+                if module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self.__name__)
+                    _load_times.setdefault(self.__name__, time.perf_counter() - started)
+                    self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def load_times():
+    """Seconds spent importing each lazily loaded module in this process"""
+    with _lock:
+        return dict(_load_times)
@@ -0,0 +1,360 @@
+"""
+Concurrent-user load test against a running Streamlit server
+
+Each virtual user opens its own websocket session (like a browser tab),
+logs in and then replays a dispatcher's routine until the level ends:
+vehicles list, search/status filter, a vehicle's documents and one document,
+and the expense analytics page. Concurrency is increased level by level and
+every level reports throughput, step latency percentiles, errors, the
+server's connection pool waits and its resident memory.
+
+Pool numbers come from the server's query metrics snapshot, so the server
+must run with QUERY_METRICS_DUMP. --start-server launches one configured
+that way:
+
+    python synthetic_data.py --tenants 1
+    python load_test.py --start-server --levels 1,5,10,20,40 --duration 60
+
+Users log in as user1..userN of the first synthetic tenant (password
+'synthetic'); see --email-pattern.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from synthetic_data import SYNTHETIC_PASSWORD
+
+FINISHED_EARLY_FOR_RERUN = ForwardMsg.ScriptFinishedStatus.Value('FINISHED_EARLY_FOR_RERUN')
+# Seconds a single rerun may take before it counts as failed
+RERUN_TIMEOUT = 60
+# Pause between a virtual user's steps (a dispatcher reading the screen)
+THINK_TIME = 1.0
+
+VEHICLES_PAGE = 'Автомобили'
+ANALYTICS_PAGE = 'Аналитика расходов'
+# st.form key of the login form in auth.show_login_page
+LOGIN_FORM = 'login_form'
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def process_rss_kb(pid):
+    """Resident set size of a process in KB (Linux /proc), or None"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def read_server_metrics(path):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class RerunFailed(Exception):
+    pass
+
+
+class StreamlitSession:
+    """Minimal Streamlit websocket client: reruns pages and presses widgets"""
+
+    def __init__(self, base_url):
+        self.url = base_url.rstrip('/').replace('http://', 'ws://').replace('https://', 'wss://') + '/_stcore/stream'
+        self.connection = None
+        self.pages = {}
+        self.page_hash = ''
+        self.elements = []
+
+    async def connect(self):
+        self.connection = await websocket_connect(self.url, max_message_size=256 * 1024 * 1024)
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+
+    async def rerun(self, page=None, widgets=None):
+        """Run the current (or given) page with the given widget states"""
+        if page is not None:
+            self.page_hash = self.pages[page]
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.page_script_hash = self.page_hash
+        for widget in widgets or []:
+            message.rerun_script.widget_states.widgets.append(widget)
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+
+        elements, errors = [], []
+        while True:
+            raw = await asyncio.wait_for(self.connection.read_message(), RERUN_TIMEOUT)
+            if raw is None:
+                raise RerunFailed("connection closed")
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof('type')
+            if kind == 'navigation':
+                self.pages = {page.page_name.replace('_', ' '): page.page_script_hash
+                              for page in forward.navigation.app_pages}
+            elif kind == 'new_session':
+                elements, errors = [], []
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                elements.append(element)
+                if element.WhichOneof('type') == 'exception':
+                    errors.append(element.exception.message)
+            elif kind == 'script_finished' and forward.script_finished != FINISHED_EARLY_FOR_RERUN:
+                break
+        self.elements = elements
+        if errors:
+            raise RerunFailed(errors[0])
+        return elements
+
+    def widgets(self, kind):
+        return [getattr(e, kind) for e in self.elements if e.WhichOneof('type') == kind]
+
+    def find_button(self, key_prefix):
+        return next((b for b in self.widgets('button') if f"-{key_prefix}" in b.id), None)
+
+
+def string_state(widget_id, value):
+    state = WidgetState()
+    state.id = widget_id
+    state.string_value = value
+    return state
+
+
+def trigger_state(widget_id):
+    state = WidgetState()
+    state.id = widget_id
+    state.trigger_value = True
+    return state
+
+
+async def login(session, email, password):
+    await session.rerun()
+    # The register form has a "Password" field too; only take the login form's widgets
+    inputs = [t for t in session.widgets('text_input') if t.form_id == LOGIN_FORM]
+    email_input = next((t for t in inputs if t.label == 'Email'), None)
+    password_input = next((t for t in inputs if 'Password' in t.label), None)
+    submit = next((b for b in session.widgets('button')
+                   if b.is_form_submitter and b.form_id == LOGIN_FORM), None)
+    if email_input is None or password_input is None or submit is None:
+        raise RerunFailed("login form not found")
+    await session.rerun(widgets=[
+        string_state(email_input.id, email),
+        string_state(password_input.id, password),
+        trigger_state(submit.id)
+    ])
+    if any(t.label == 'Email' for t in session.widgets('text_input')):
+        raise RerunFailed(f"login failed for {email}")
+
+
+async def open_vehicles(session):
+    await session.rerun(page=VEHICLES_PAGE)
+
+
+async def filter_vehicles(session):
+    search = session.widgets('text_input')
+    status = session.widgets('selectbox')
+    widgets = []
+    if search:
+        widgets.append(string_state(search[0].id, '1'))
+    if status and len(status[0].options) > 1:
+        widgets.append(string_state(status[0].id, status[0].options[1]))
+    await session.rerun(widgets=widgets)
+
+
+async def open_document(session):
+    await session.rerun()
+    docs = session.find_button('docs_')
+    if docs is None:
+        return
+    await session.rerun(widgets=[trigger_state(docs.id)])
+    view = session.find_button('view_doc_')
+    if view is not None:
+        await session.rerun(widgets=[trigger_state(view.id)])
+
+
+async def open_analytics(session):
+    await session.rerun(page=ANALYTICS_PAGE)
+
+
+ROUTINE = [
+    ('vehicles', open_vehicles),
+    ('filter', filter_vehicles),
+    ('document', open_document),
+    ('analytics', open_analytics),
+]
+
+
+async def virtual_user(number, options, deadline, samples):
+    session = StreamlitSession(options.url)
+    email = options.email_pattern.format(n=number % options.user_count + 1)
+
+    async def timed(step, action):
+        started = time.perf_counter()
+        try:
+            await action()
+            samples.append((step, time.perf_counter() - started, None))
+        except Exception as e:
+            samples.append((step, time.perf_counter() - started, str(e) or type(e).__name__))
+            return False
+        return True
+
+    try:
+        if not await timed('connect', session.connect):
+            return
+        if not await timed('login', lambda: login(session, email, options.password)):
+            return
+        while time.time() < deadline:
+            for step, action in ROUTINE:
+                if time.time() >= deadline:
+                    break
+                await timed(step, lambda: action(session))
+                await asyncio.sleep(THINK_TIME)
+    finally:
+        session.close()
+
+
+async def run_level(concurrency, options, server_pid):
+    """Run one concurrency level; returns its report row"""
+    before = read_server_metrics(options.metrics_file)
+    samples, rss = [], []
+    started = time.time()
+    deadline = started + options.duration
+
+    async def sample_rss():
+        while time.time() < deadline:
+            if server_pid:
+                value = process_rss_kb(server_pid)
+                if value:
+                    rss.append(value)
+            await asyncio.sleep(1)
+
+    # Ramp users in over a few seconds like real logins
+    async def delayed_user(number):
+        await asyncio.sleep(number * options.ramp / max(concurrency, 1))
+        await virtual_user(number, options, deadline, samples)
+
+    await asyncio.gather(sample_rss(), *(delayed_user(n) for n in range(concurrency)))
+    elapsed = time.time() - started
+    await asyncio.sleep(2.5)  # let the server write a fresh metrics snapshot
+    after = read_server_metrics(options.metrics_file)
+
+    latencies = [duration for step, duration, error in samples if error is None and step != 'connect']
+    errors = [error for _, _, error in samples if error]
+    row = {
+        'concurrency': concurrency,
+        'steps': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else '',
+        'rss_mb': max(rss) / 1024 if rss else None,
+        'per_step_p95_ms': {
+            step: percentile([d for s, d, e in samples if s == step and e is None], 0.95) * 1000
+            for step in ['login'] + [name for name, _ in ROUTINE]
+        }
+    }
+    if before and after:
+        checkouts = after['pool']['checkouts'] - before['pool']['checkouts']
+        row['pool_checkouts'] = checkouts
+        row['pool_wait_ms'] = (after['pool']['total_wait'] - before['pool']['total_wait']) * 1000
+        row['pool_wait_p95_ms'] = after['pool']['p95'] * 1000
+        row['queries'] = after['queries'] - before['queries']
+    return row
+
+
+def print_row(row):
+    pool = (f" pool wait {row['pool_wait_ms']:.0f} ms total / p95 {row['pool_wait_p95_ms']:.1f} ms,"
+            f" {row['queries']} queries" if 'pool_wait_ms' in row else "")
+    rss = f" RSS {row['rss_mb']:.0f} MB" if row['rss_mb'] else ""
+    print(f"  {row['concurrency']:>4} users: {row['throughput']:.2f} steps/s, "
+          f"p50 {row['p50_ms']:.0f} ms, p95 {row['p95_ms']:.0f} ms, p99 {row['p99_ms']:.0f} ms, "
+          f"{row['errors']} errors,{pool}{rss}")
+    if row['first_error']:
+        print(f"       first error: {row['first_error'][:200]}")
+
+
+def start_server(port, metrics_file):
+    env = dict(os.environ, QUERY_METRICS_DUMP=metrics_file)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', 'Home.py', '--server.port', str(port),
+         '--server.headless', 'true'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    time.sleep(5)
+    if process.poll() is not None:
+        raise RuntimeError("Streamlit server exited during startup")
+    return process
+
+
+async def main_async(options):
+    server = None
+    server_pid = options.server_pid
+    if options.start_server:
+        options.metrics_file = options.metrics_file or os.path.join(tempfile.gettempdir(), 'fleet_query_metrics.json')
+        server = start_server(options.port, options.metrics_file)
+        server_pid = server.pid
+        options.url = f"http://localhost:{options.port}"
+
+    report = []
+    try:
+        for concurrency in options.levels:
+            row = await run_level(concurrency, options, server_pid)
+            print_row(row)
+            report.append(row)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Streamlit app with concurrent websocket sessions")
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--levels', type=lambda v: [int(x) for x in v.split(',')], default=[1, 5, 10, 20])
+    parser.add_argument('--duration', type=int, default=60, help="seconds per level")
+    parser.add_argument('--ramp', type=float, default=5.0, help="seconds to bring all users of a level online")
+    parser.add_argument('--email-pattern', default='user{n}@tenant1.synthetic.test')
+    parser.add_argument('--user-count', type=int, default=300, help="distinct logins to rotate through")
+    parser.add_argument('--password', default=SYNTHETIC_PASSWORD)
+    parser.add_argument('--start-server', action='store_true', help="launch Home.py on --port for the run")
+    parser.add_argument('--port', type=int, default=8599)
+    parser.add_argument('--server-pid', type=int, help="pid of an already running server, for RSS")
+    parser.add_argument('--metrics-file', help="QUERY_METRICS_DUMP path of the server")
+    parser.add_argument('--json', help="write the report to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    report = asyncio.run(main_async(options))
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
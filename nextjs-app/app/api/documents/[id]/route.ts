@@ -50,10 +50,10 @@ export async function DELETE(
       return apiForbidden('У вас нет доступа к этому документу');
     }
 
-    // Soft delete - set is_active to false
+    // Soft delete - set is_active to false; deleted_at starts the retention grace period
     const { error } = await supabase
       .from('vehicle_documents')
-      .update({ is_active: false })
+      .update({ is_active: false, deleted_at: new Date().toISOString() })
       .eq('id', id);
 
     if (error) {
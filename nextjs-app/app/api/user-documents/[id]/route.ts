@@ -23,10 +23,10 @@ export async function DELETE(request: Request, { params }: RouteParams) {
 
     const userContext = getUserQueryContext(user);
 
-    // Soft delete - set is_active to false
+    // Soft delete - set is_active to false; deleted_at starts the retention grace period
     let query = supabase
       .from('user_documents')
-      .update({ is_active: false })
+      .update({ is_active: false, deleted_at: new Date().toISOString() })
       .eq('id', id);
 
     query = applyOrgFilter(query, userContext);
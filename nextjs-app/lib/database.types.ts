@@ -218,6 +218,7 @@ export interface Database {
           date_issued: string | null
           date_expiry: string | null
           is_active: boolean
+          deleted_at: string | null
           upload_date: string
         }
         Insert: {
@@ -229,6 +230,7 @@ export interface Database {
           date_issued?: string | null
           date_expiry?: string | null
           is_active?: boolean
+          deleted_at?: string | null
           upload_date?: string
         }
         Update: {
@@ -240,6 +242,7 @@ export interface Database {
           date_issued?: string | null
           date_expiry?: string | null
           is_active?: boolean
+          deleted_at?: string | null
           upload_date?: string
         }
       }
@@ -375,6 +378,7 @@ export interface Database {
           date_issued: string | null
           date_expiry: string | null
           is_active: boolean
+          deleted_at: string | null
           upload_date: string
         }
         Insert: {
@@ -386,6 +390,7 @@ export interface Database {
           date_issued?: string | null
           date_expiry?: string | null
           is_active?: boolean
+          deleted_at?: string | null
           upload_date?: string
         }
         Update: {
@@ -397,6 +402,7 @@ export interface Database {
           date_issued?: string | null
           date_expiry?: string | null
           is_active?: boolean
+          deleted_at?: string | null
           upload_date?: string
         }
       }
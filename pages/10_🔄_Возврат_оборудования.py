@@ -1,12 +1,19 @@
 import streamlit as st
 import uuid
 from datetime import datetime, date
-from database import execute_query
+from sqlalchemy import text
+from database import engine, execute_query
+from inventory import record_event, get_return_events
+from cache_manager import get_cached_materials
 from translations import get_text
 from utils import format_currency
-import pandas as pd
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
 from auth import require_auth, show_org_header
 
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 5
+
 # Page config
 st.set_page_config(
     page_title="Возврат оборудования",
@@ -62,56 +69,31 @@ def get_pending_returns():
     """)
 
 @st.cache_data(ttl=300)
-def get_return_history():
-    """Get equipment return history"""
-    return execute_query("""
-        SELECT 
-            ma.id::text,
-            m.name as material_name,
-            m.type,
-            m.unit,
-            t.name as team_name,
-            ma.quantity,
-            ma.date as assigned_date,
-            ma.status,
-            ma.notes
-        FROM material_assignments ma
-        JOIN materials m ON ma.material_id = m.id
-        JOIN teams t ON ma.team_id = t.id
-        WHERE ma.status IN ('returned', 'broken') AND m.type = 'equipment'
-        ORDER BY ma.date DESC
-        LIMIT 100
-    """)
+def get_return_history(organization_id):
+    """Get equipment return history from the inventory ledger"""
+    return get_return_events(organization_id, limit=100)
 
 def mark_for_return(assignment_id):
     """Mark equipment for return (first step)"""
     try:
-        # Get assignment details
-        assignment_data = execute_query("""
-            SELECT 
-                ma.material_id::text,
-                ma.team_id::text,
-                ma.quantity,
-                m.name,
-                t.name as team_name
-            FROM material_assignments ma
-            JOIN materials m ON ma.material_id = m.id
-            JOIN teams t ON ma.team_id = t.id
-            WHERE ma.id = :assignment_id AND ma.status = 'active'
-        """, {'assignment_id': assignment_id})
-        
-        if not assignment_data:
-            st.error("Назначение оборудования не найдено или уже обработано")
-            return False
-            
-        material_id, team_id, quantity, material_name, team_name = assignment_data[0]
-        
-        # Update assignment to pending_return status
-        execute_query("""
-            UPDATE material_assignments 
-            SET status = 'pending_return', notes = 'Ожидает подтверждения возврата'
-            WHERE id = :assignment_id
-        """, {'assignment_id': assignment_id})
+        with engine.begin() as conn:
+            # Claim the assignment; the status check guards against double clicks
+            assignment_data = conn.execute(text("""
+                UPDATE material_assignments ma
+                SET status = 'pending_return', notes = 'Ожидает подтверждения возврата'
+                FROM materials m, teams t
+                WHERE ma.id = :assignment_id AND ma.status = 'active'
+                  AND ma.material_id = m.id AND ma.team_id = t.id
+                RETURNING ma.organization_id, ma.material_id, ma.team_id, ma.quantity, m.name, t.name
+            """), {'assignment_id': assignment_id}).fetchone()
+
+            if not assignment_data:
+                st.error("Назначение оборудования не найдено или уже обработано")
+                return False
+
+            organization_id, material_id, team_id, quantity, material_name, team_name = assignment_data
+            record_event(conn, organization_id, material_id, team_id, 'marked_for_return', quantity,
+                         assignment_id=assignment_id)
         
         st.info(f"🔄 Оборудование '{material_name}' ({quantity} ед.) отмечено для возврата от бригады '{team_name}'")
         st.warning("⏳ Ожидает подтверждения возврата")
@@ -119,6 +101,7 @@ def mark_for_return(assignment_id):
         # Clear caches
         get_active_assignments.clear()
         get_pending_returns.clear()
+        get_cached_materials.clear()
         
         return True
         
@@ -129,74 +112,57 @@ def mark_for_return(assignment_id):
 def confirm_return(assignment_id, return_status):
     """Confirm return of equipment (second step)"""
     try:
-        # Get assignment details
-        assignment_data = execute_query("""
-            SELECT 
-                ma.material_id::text,
-                ma.team_id::text,
-                ma.quantity,
-                m.name,
-                m.unit_price,
-                t.name as team_name
-            FROM material_assignments ma
-            JOIN materials m ON ma.material_id = m.id
-            JOIN teams t ON ma.team_id = t.id
-            WHERE ma.id = :assignment_id AND ma.status = 'pending_return'
-        """, {'assignment_id': assignment_id})
-        
-        if not assignment_data:
-            st.error("Назначение не найдено или не ожидает подтверждения")
-            return False
-            
-        material_id, team_id, quantity, material_name, unit_price, team_name = assignment_data[0]
-        
-        # Update assignment status to final status
-        execute_query("""
-            UPDATE material_assignments 
-            SET status = :status, event = :event, notes = :notes
-            WHERE id = :assignment_id
-        """, {
-            'assignment_id': assignment_id,
-            'status': return_status,
-            'event': return_status,
-            'notes': f'Возврат подтвержден: {return_status}'
-        })
-        if return_status == 'returned':
-            # Equipment returned in good condition - decrease assigned quantity
-            execute_query("""
+        notes = f'Возврат подтвержден: {return_status}'
+        with engine.begin() as conn:
+            assignment_data = conn.execute(text("""
+                UPDATE material_assignments ma
+                SET status = :status, event = :event, notes = :notes
+                FROM materials m, teams t
+                WHERE ma.id = :assignment_id AND ma.status = 'pending_return'
+                  AND ma.material_id = m.id AND ma.team_id = t.id
+                RETURNING ma.organization_id, ma.material_id, ma.team_id, ma.quantity,
+                          m.name, m.unit_price, t.name
+            """), {
+                'assignment_id': assignment_id,
+                'status': return_status,
+                'event': return_status,
+                'notes': notes
+            }).fetchone()
+
+            if not assignment_data:
+                st.error("Назначение не найдено или не ожидает подтверждения")
+                return False
+
+            organization_id, material_id, team_id, quantity, material_name, unit_price, team_name = assignment_data
+
+            # Both outcomes take the equipment off the team's holdings
+            conn.execute(text("""
                 UPDATE materials 
                 SET assigned_quantity = COALESCE(assigned_quantity, 0) - :quantity 
                 WHERE id = :material_id
-            """, {'material_id': material_id, 'quantity': quantity})
-            
+            """), {'material_id': material_id, 'quantity': quantity})
+            record_event(conn, organization_id, material_id, team_id, return_status, quantity,
+                         assignment_id=assignment_id, notes=notes)
+
+            if return_status == 'broken':
+                # Create penalty for broken equipment
+                penalty_amount = float(unit_price or 0) * quantity
+                conn.execute(text("""
+                    INSERT INTO penalties 
+                    (id, organization_id, team_id, date, amount, status, description)
+                    VALUES (:id, :organization_id, :team_id, :date, :amount, 'open', :description)
+                """), {
+                    'id': str(uuid.uuid4()),
+                    'organization_id': st.session_state.get('organization_id'),
+                    'team_id': team_id,
+                    'date': date.today(),
+                    'amount': penalty_amount,
+                    'description': f"Поломка оборудования: {material_name} ({quantity} ед.)"
+                })
+
+        if return_status == 'returned':
             st.success(f"✅ Возврат подтвержден! Оборудование '{material_name}' ({quantity} ед.) успешно возвращено от бригады '{team_name}'")
-            
         elif return_status == 'broken':
-            # Equipment returned broken - decrease assigned quantity and create penalty
-            execute_query("""
-                UPDATE materials 
-                SET assigned_quantity = COALESCE(assigned_quantity, 0) - :quantity 
-                WHERE id = :material_id
-            """, {'material_id': material_id, 'quantity': quantity})
-            
-            # Create penalty for broken equipment
-            penalty_id = str(uuid.uuid4())
-            penalty_amount = float(unit_price or 0) * quantity
-            penalty_description = f"Поломка оборудования: {material_name} ({quantity} ед.)"
-            
-            execute_query("""
-                INSERT INTO penalties 
-                (id, organization_id, team_id, date, amount, status, description)
-                VALUES (:id, :organization_id, :team_id, :date, :amount, 'open', :description)
-            """, {
-                'id': penalty_id,
-                'organization_id': st.session_state.get('organization_id'),
-                'team_id': team_id,
-                'date': date.today(),
-                'amount': penalty_amount,
-                'description': penalty_description
-            })
-            
             st.error(f"💔 Подтверждена поломка оборудования '{material_name}' ({quantity} ед.)")
             st.info(f"💰 Создан штраф на сумму {format_currency(penalty_amount)} для бригады '{team_name}'")
             
@@ -204,6 +170,7 @@ def confirm_return(assignment_id, return_status):
         get_active_assignments.clear()
         get_pending_returns.clear()
         get_return_history.clear()
+        get_cached_materials.clear()
         
         return True
         
@@ -287,7 +254,7 @@ def show_return_history():
     """Show equipment return history"""
     st.subheader("📜 История возвратов / Return History")
     
-    history = get_return_history()
+    history = get_return_history(st.session_state.get('organization_id'))
     
     if not history:
         st.info("История возвратов пуста / No return history")
@@ -306,7 +273,7 @@ def show_return_history():
             "Оборудование": material_name,
             "Бригада": team_name,
             "Количество": f"{quantity} {unit}",
-            "Дата выдачи": assigned_date.strftime('%d.%m.%Y') if assigned_date else '',
+            "Дата": assigned_date.strftime('%d.%m.%Y') if assigned_date else '',
             "Примечания": notes if notes else ''
         })
     
@@ -4,6 +4,10 @@ from datetime import datetime
 from database import execute_query
 from translations import get_text
 from auth import require_auth, show_org_header, is_admin, can_delete_account, hash_password
+from tenant_purge import start_purge, get_job
+
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 12
 
 # Page config
 st.set_page_config(
@@ -23,6 +27,10 @@ def show_account_management():
     """Account management interface - only for account owners"""
     st.title("🏢 Управление аккаунтом / Account Management")
     
+    if st.session_state.get('purge_job_id'):
+        show_purge_progress()
+        return
+    
     # Check if current user is owner
     if not is_admin():
         st.error("❌ Доступ запрещен / Access Denied")
@@ -355,33 +363,52 @@ def show_account_settings():
             st.info("💡 Только владелец аккаунта может удалить организацию")
 
 def delete_account_permanently():
-    """Permanently delete the entire account"""
+    """Start the background purge of the entire account"""
     try:
-        org_id = st.session_state.get('organization_id')
-        
-        # Delete all organization data in correct order (respecting foreign keys)
-        tables = [
-            'user_documents', 'vehicle_documents', 'rental_contracts',
-            'material_assignments', 'material_history', 
-            'penalties', 'maintenances', 'car_expenses', 
-            'vehicle_assignments', 'users', 'materials',
-            'vehicles', 'teams', 'organizations'
-        ]
-        
-        for table in tables:
-            execute_query(f"DELETE FROM {table} WHERE organization_id = :org_id", {'org_id': org_id})
-        
+        st.session_state.purge_job_id = start_purge(
+            st.session_state.get('organization_id'),
+            requested_by=st.session_state.get('user_id'),
+            organization_name=st.session_state.get('organization_name')
+        )
+        st.rerun()
+    except Exception as e:
+        st.error(f"❌ Ошибка удаления аккаунта: {str(e)}")
+
+@st.fragment(run_every=2)
+def show_purge_progress():
+    """Progress of the account purge; logs out when it is finished"""
+    job = get_job(st.session_state.purge_job_id)
+    if not job:
+        st.error("❌ Задание удаления не найдено / Purge job not found")
+        return
+    
+    if job['status'] == 'failed':
+        st.error(f"❌ Ошибка удаления аккаунта: {job['error']}")
+        st.info("💡 Удаление можно повторить: данные удаляются повторно без ошибок")
+        if st.button("🔄 Повторить / Retry"):
+            st.session_state.purge_job_id = start_purge(
+                st.session_state.get('organization_id'),
+                requested_by=st.session_state.get('user_id'),
+                organization_name=st.session_state.get('organization_name')
+            )
+            st.rerun()
+        return
+    
+    total = job['total_rows'] or 0
+    done = job['deleted_rows'] or 0
+    st.progress(min(done / total, 1.0) if total else 0.0,
+                text=f"🗑️ Удаление аккаунта / Deleting account: {done} / {total}")
+    if job['current_table']:
+        st.caption(f"Таблица / Table: {job['current_table']}")
+    
+    if job['status'] == 'done':
+        st.success(f"✅ Аккаунт полностью удален (файлов удалено: {job['files_deleted'] or 0})")
         # Clear session
-        for key in ['authenticated', 'user_id', 'organization_id', 'user_role', 'organization_name']:
+        for key in ['authenticated', 'user_id', 'organization_id', 'user_role', 'organization_name', 'purge_job_id']:
             if key in st.session_state:
                 del st.session_state[key]
-        
-        st.success("✅ Аккаунт полностью удален")
         st.info("🔄 Перенаправление на страницу входа...")
-        st.rerun()
-        
-    except Exception as e:
-        st.error(f"❌ Ошибка удаления аккаунта: {str(e)}")
+        st.rerun(scope="app")
 
 # Main execution
 if __name__ == "__main__":
@@ -4,6 +4,9 @@ from datetime import datetime
 from telegram_bot import send_bug_report_sync
 from auth import require_auth, show_org_header
 
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 2
+
 # Page config
 st.set_page_config(
     page_title="Баг репорт",
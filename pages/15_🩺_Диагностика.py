@@ -0,0 +1,231 @@
+import streamlit as st
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
+from datetime import datetime
+from auth import require_auth, show_org_header, is_operator
+from query_metrics import metrics, ENABLED
+import profiler
+import session_inspector
+
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 2
+
+# Page config
+st.set_page_config(
+    page_title="Диагностика",
+    page_icon="🩺",
+    layout="wide"
+)
+
+# Require authentication
+require_auth()
+show_org_header()
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
+
+def show_top_queries():
+    """Show statement fingerprints ranked by total time"""
+    st.subheader("🐢 Топ запросов / Top Queries")
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        order_by = st.selectbox(
+            "Сортировка / Order by",
+            ['total_time', 'p95', 'max_time', 'count'],
+            format_func=lambda x: {
+                'total_time': 'Общее время / Total time',
+                'p95': 'p95',
+                'max_time': 'Максимум / Max',
+                'count': 'Количество / Count'
+            }[x]
+        )
+    with col2:
+        limit = st.number_input("Top N", min_value=5, max_value=200, value=20, step=5)
+
+    rows = metrics.top_queries(limit=int(limit), order_by=order_by)
+    if not rows:
+        st.info("Запросов пока нет / No queries recorded yet")
+        return
+
+    df = pd.DataFrame([{
+        'Fingerprint': r['fingerprint'],
+        'Вызовов': r['count'],
+        'Всего, мс': ms(r['total_time']),
+        'Среднее, мс': ms(r['avg_time']),
+        'p50, мс': ms(r['p50']),
+        'p95, мс': ms(r['p95']),
+        'p99, мс': ms(r['p99']),
+        'Макс, мс': ms(r['max_time']),
+        'Строк': r['rows'],
+        'Источник': r['top_caller'],
+        'Запрос': r['statement'][:300]
+    } for r in rows])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+def show_pool_stats():
+    """Show connection pool checkout wait"""
+    st.subheader("🔌 Пул соединений / Connection Pool")
+
+    pool = metrics.pool_summary()
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("Выдач соединений", pool['checkouts'])
+    with col2:
+        st.metric("Ожидание всего, мс", ms(pool['total_wait']))
+    with col3:
+        st.metric("p50, мс", ms(pool['p50']))
+    with col4:
+        st.metric("p95, мс", ms(pool['p95']))
+    with col5:
+        st.metric("p99, мс", ms(pool['p99']))
+
+def show_recent_queries():
+    """Show the most recent queries from the ring buffer"""
+    st.subheader("🕒 Последние запросы / Recent Queries")
+
+    recent = metrics.recent_queries(limit=200)
+    if not recent:
+        st.info("Запросов пока нет / No queries recorded yet")
+        return
+
+    df = pd.DataFrame([{
+        'Время': datetime.fromtimestamp(r['at']).strftime('%H:%M:%S'),
+        'Длительность, мс': ms(r['elapsed']),
+        'Строк': r['rows'],
+        'Страница': r['page'],
+        'Функция': r['function'],
+        'Запрос': r['statement'][:300]
+    } for r in recent])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+def show_profiler():
+    """Show per-page rerun timings from the script-run profiler"""
+    st.subheader("⏱️ Профилировщик перезапусков / Rerun Profiler")
+
+    if not profiler.ENABLED:
+        st.info("Профилировщик отключен. Запустите приложение с RERUN_PROFILER=1 / Profiler is disabled, start the app with RERUN_PROFILER=1")
+        return
+
+    pages = profiler.page_summary()
+    if not pages:
+        st.info("Перезапусков пока нет / No reruns recorded yet")
+        return
+
+    df = pd.DataFrame([{
+        'Страница': p['page'],
+        'Перезапусков': p['reruns'],
+        'Среднее, мс': round(p['avg_ms'], 1),
+        'p50, мс': round(p['p50_ms'], 1),
+        'p95, мс': round(p['p95_ms'], 1),
+        'Макс, мс': round(p['max_ms'], 1)
+    } for p in pages])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+    page = st.selectbox("Страница / Page", [p['page'] for p in pages])
+    selected = next(p for p in pages if p['page'] == page)
+    spans_df = pd.DataFrame([{
+        'Участок': key,
+        'Вызовов': stats['count'],
+        'Всего, мс': round(stats['total_ms'], 1),
+        'На перезапуск, мс': round(stats['per_rerun_ms'], 1)
+    } for key, stats in selected['spans'].items()])
+    if not spans_df.empty:
+        st.dataframe(spans_df.sort_values('Всего, мс', ascending=False), use_container_width=True, hide_index=True)
+
+    recent = profiler.recent_reruns(page)
+    if recent:
+        with st.expander("Последний перезапуск / Last rerun"):
+            st.json(recent[0]['tree'])
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("📥 JSON", profiler.export_json(), file_name="rerun_profile.json", mime="application/json", use_container_width=True)
+    with col2:
+        st.download_button("📥 Prometheus", profiler.export_prometheus(), file_name="rerun_profile.prom", mime="text/plain", use_container_width=True)
+    with col3:
+        if st.button("🔄 Сбросить профиль", use_container_width=True):
+            profiler.reset()
+            st.rerun()
+
+def show_sessions():
+    """Show session_state size per session of this server process"""
+    st.subheader("🧠 Сессии / Sessions")
+
+    sessions = session_inspector.server_sessions()
+    totals = session_inspector.server_totals(sessions)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Сессий (активных)", f"{totals['sessions']} ({totals['active']})")
+    with col2:
+        st.metric("Ключей всего", totals['keys'])
+    with col3:
+        st.metric("Размер, КБ", round(totals['bytes'] / 1024, 1))
+    with col4:
+        st.metric("Растущих сессий", totals['growing'])
+
+    if sessions:
+        df = pd.DataFrame([{
+            'Сессия': s['session_id'][:8],
+            'Активна': '✅' if s['active'] else '—',
+            'Организация': s['organization'],
+            'Перезапусков': s['reruns'],
+            'Ключей': s['keys'],
+            'Временных ключей': s['transient_keys'],
+            'Размер, КБ': round(s['bytes'] / 1024, 1),
+            'Рост': '⚠️' if s['growing'] else ''
+        } for s in sessions])
+        st.dataframe(df, use_container_width=True, hide_index=True)
+
+    with st.expander("Текущая сессия по ключам / Current session by key"):
+        keys_df = pd.DataFrame([{
+            'Ключ': k['key'],
+            'Тип': k['type'],
+            'Размер, байт': k['bytes'],
+            'Pickle, байт': k['pickled'],
+            'Временный': '✅' if k['transient'] else ''
+        } for k in session_inspector.key_sizes(st.session_state.to_dict())])
+        st.dataframe(keys_df, use_container_width=True, hide_index=True)
+
+# Main page
+st.title("🩺 Диагностика / Diagnostics")
+
+# Metrics, profiles and sessions cover every organization served by this
+# process, so tenant admins must not see them
+if not is_operator():
+    st.error("❌ Доступ запрещен. Диагностика доступна только операторам сервера (OPERATOR_USER_IDS).")
+    st.stop()
+
+if not ENABLED:
+    st.warning("Сбор метрик запросов отключен (QUERY_METRICS_ENABLED=0) / Query metrics are disabled")
+
+col1, col2 = st.columns([3, 1])
+with col1:
+    st.caption(f"Метрики процесса с {datetime.fromtimestamp(metrics.started_at).strftime('%d.%m.%Y %H:%M:%S')}")
+with col2:
+    if st.button("🔄 Сбросить / Reset", use_container_width=True):
+        metrics.reset()
+        st.rerun()
+
+tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    "🐢 Топ запросов",
+    "🔌 Пул соединений",
+    "🕒 Последние запросы",
+    "⏱️ Профилировщик",
+    "🧠 Сессии"
+])
+
+with tab1:
+    show_top_queries()
+
+with tab2:
+    show_pool_stats()
+
+with tab3:
+    show_recent_queries()
+
+with tab4:
+    show_profiler()
+
+with tab5:
+    show_sessions()
@@ -1,5 +1,6 @@
 import streamlit as st
-import pandas as pd
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
 from database import execute_query
 from translations import get_text
 from utils import export_to_csv, upload_file, upload_multiple_files, display_file, get_document_types, get_documents_with_sort, delete_document
@@ -7,6 +8,15 @@ from pagination import paginate_data
 from datetime import datetime
 import uuid
 from auth import require_auth, show_org_header
+from tco_report import record_cost_change
+from vehicle_import import read_file, import_vehicles
+from cache_manager import get_cached_vehicles, get_cached_teams, get_vehicle_status_counts, get_vehicle_assignments, get_dashboard_metrics
+from analytics_cache import invalidate_analytics_cache
+from vehicle_search import search_filter
+from bulk_actions import VEHICLE_STATUSES, select_rows, clear_selection, set_vehicle_status, assign_vehicles_to_team, delete_vehicles, affected_costs
+
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 30
 
 # Page config
 st.set_page_config(
@@ -110,24 +120,29 @@ def show_vehicles_list():
         """
         params = {}
         
-        if search_term:
-            query += """ AND (
-                name ILIKE :search OR 
-                license_plate ILIKE :search OR 
-                vin ILIKE :search
-            )"""
-            params['search'] = f"%{search_term}%"
+        search_score = None
+        if search_term and search_term.strip():
+            # Trigram search on name and normalized plate/VIN ("B-FD 5555" finds "BFD5555")
+            condition, search_params, search_score = search_filter(search_term, alias='')
+            query += f" AND {condition}"
+            params.update(search_params)
         
         if status_filter != 'all':
             query += " AND status = :status"
             params['status'] = status_filter
         
-        # Sort by name as number (for numeric names like 1, 2, 10, 11)
-        query += " ORDER BY CAST(NULLIF(regexp_replace(name, '[^0-9]', '', 'g'), '') AS INTEGER) ASC NULLS LAST, name ASC"
+        if search_score:
+            # Best matches first
+            query += f" ORDER BY {search_score} DESC, name ASC"
+        else:
+            # Natural name order (1, 2, 10, 11) via the persisted, indexed name_sort_key
+            query += " ORDER BY name_sort_key, name"
         
         vehicles = execute_query(query, params)
         
         if vehicles:
+            show_vehicle_bulk_actions(vehicles)
+            
             # Pagination  
             paginated_vehicles = paginate_data(vehicles, 20, 'vehicles_list')
             
@@ -348,6 +363,7 @@ def show_add_vehicle_form():
                         VALUES (:id, :organization_id, :name, :license_plate, :vin, :status, :model, :year, :photo_url, 
                                :is_rental, :rental_start_date, :rental_end_date, :rental_monthly_price)
                     """, params)
+                    record_cost_change(vehicle_id)
                     
                     st.success(f"✅ {get_text('success_save', language)}")
                     st.success("✅ Fahrzeug erfolgreich gespeichert")
@@ -367,6 +383,45 @@ def show_add_vehicle_form():
                 st.error("❌ Название и гос.номер обязательны")
                 st.error("❌ Name und Kennzeichen sind erforderlich")
 
+def show_import_vehicles():
+    """Bulk import vehicles from a CSV/XLSX file"""
+    st.subheader("📥 Импорт автомобилей / Fahrzeugimport")
+    st.caption("Колонки как в экспорте / Spalten wie im Export: name, license_plate, vin, status, model, year, "
+               "is_rental, rental_start_date, rental_end_date, rental_monthly_price")
+
+    uploaded = st.file_uploader("CSV / XLSX", type=['csv', 'xlsx'], key="vehicle_import_file")
+    if not uploaded:
+        return
+
+    try:
+        df = read_file(uploaded)
+        preview = import_vehicles(df, st.session_state.organization_id, dry_run=True)
+    except Exception as e:
+        st.error(f"❌ Не удалось прочитать файл / Datei konnte nicht gelesen werden: {str(e)}")
+        return
+
+    valid_count = int((preview['result'] == 'valid').sum())
+    error_count = len(preview) - valid_count
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Готово к импорту / Importierbar", valid_count)
+    with col2:
+        st.metric("Ошибки / Fehler", error_count)
+    st.dataframe(preview, use_container_width=True, hide_index=True)
+
+    if valid_count and st.button(f"📥 Импортировать {valid_count} / Importieren", type="primary"):
+        try:
+            report = import_vehicles(df, st.session_state.organization_id)
+        except Exception as e:
+            st.error(f"❌ Ошибка импорта / Importfehler: {str(e)}")
+            return
+        counts = report['result'].value_counts()
+        st.success(f"✅ Добавлено / Neu: {counts.get('inserted', 0)}, "
+                   f"обновлено / Aktualisiert: {counts.get('updated', 0)}, "
+                   f"ошибок / Fehler: {counts.get('error', 0)}")
+        st.dataframe(report, use_container_width=True, hide_index=True)
+        get_cached_vehicles.clear()
+
 def show_edit_vehicle_form(vehicle_id):
     """Show form to edit existing vehicle"""
     try:
@@ -578,6 +633,7 @@ def show_edit_vehicle_form(vehicle_id):
                                 'rental_end_date': rental_end_date,
                                 'rental_monthly_price': rental_monthly_price
                             })
+                            record_cost_change(vehicle_id)
                             st.success("Автомобиль обновлен / Fahrzeug aktualisiert")
                             del st.session_state.edit_vehicle_id
                             st.rerun()
@@ -598,6 +654,81 @@ def show_edit_vehicle_form(vehicle_id):
                 del st.session_state.edit_vehicle_id
             st.rerun()
 
+def show_vehicle_bulk_actions(vehicles):
+    """Status change, team assignment and deletion for many vehicles at once"""
+    with st.expander("☑️ Массовые действия / Sammelaktionen"):
+        selected = select_rows(
+            [(v[0], v[1], v[2], v[3], v[4]) for v in vehicles],
+            ["Название/Name", "Гос. номер/Kennzeichen", "VIN", "Статус/Status"],
+            "vehicles_bulk"
+        )
+        st.write(f"Выбрано/Ausgewählt: {len(selected)}")
+        
+        action = st.selectbox(
+            "Действие/Aktion",
+            options=['status', 'team', 'delete'],
+            format_func=lambda x: {
+                'status': "Изменить статус/Status ändern",
+                'team': "Назначить бригаду/Team zuweisen",
+                'delete': "Удалить/Löschen"
+            }[x],
+            key="vehicles_bulk_action"
+        )
+        org_id = st.session_state.get('organization_id')
+        
+        if action == 'status':
+            status = st.selectbox(
+                get_text('status', language),
+                options=VEHICLE_STATUSES,
+                format_func=lambda x: get_text(x, language) if x != 'rented' else 'Аренда / Miete',
+                key="vehicles_bulk_status"
+            )
+        elif action == 'team':
+            teams = get_cached_teams() or []
+            if not teams:
+                st.warning("Нет бригад/Keine Teams")
+                return
+            team_id = st.selectbox(
+                "Бригада/Team",
+                options=[t[0] for t in teams],
+                format_func=lambda x: next((t[1] for t in teams if t[0] == x), x),
+                key="vehicles_bulk_team"
+            )
+        else:
+            confirmed = st.checkbox(
+                "Подтверждаю удаление выбранных автомобилей / Löschen bestätigen",
+                key="vehicles_bulk_confirm"
+            )
+        
+        if st.button("Применить/Anwenden", key="vehicles_bulk_apply", disabled=not selected):
+            try:
+                if action == 'status':
+                    changed = set_vehicle_status(selected, status, org_id)
+                    get_vehicle_status_counts.clear()
+                elif action == 'team':
+                    changed = assign_vehicles_to_team(selected, team_id, org_id)
+                    get_vehicle_assignments.clear()
+                elif confirmed:
+                    # Expenses, penalties, documents and TCO rows cascade with the vehicles
+                    changed, dates = affected_costs(delete_vehicles(selected, org_id))
+                    invalidate_analytics_cache(org_id, dates)
+                    get_documents_cached.clear()
+                    get_vehicle_status_counts.clear()
+                    get_vehicle_assignments.clear()
+                    get_dashboard_metrics.clear()
+                else:
+                    st.warning("Подтвердите удаление / Bitte Löschen bestätigen")
+                    return
+                get_cached_vehicles.clear()
+                clear_selection("vehicles_bulk")
+                st.session_state.vehicles_bulk_result = f"✅ Обработано/Verarbeitet: {len(changed)}"
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+        
+        if 'vehicles_bulk_result' in st.session_state:
+            st.success(st.session_state.pop('vehicles_bulk_result'))
+
 def delete_vehicle(vehicle_id):
     """Delete vehicle"""
     try:
@@ -1150,7 +1281,7 @@ def delete_vehicle_document(document_id):
     try:
         execute_query("""
             UPDATE vehicle_documents 
-            SET is_active = false 
+            SET is_active = false, deleted_at = CURRENT_TIMESTAMP 
             WHERE id = :id
         """, {'id': document_id})
         st.success("Документ удален")
@@ -1184,7 +1315,7 @@ def show_all_documents_list():
         
         with col1:
             # Vehicle filter
-            vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY CAST(NULLIF(regexp_replace(name, '[^0-9]', '', 'g'), '') AS INTEGER) ASC NULLS LAST, name ASC")
+            vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name_sort_key, name")
             vehicle_options = ['all'] + [v[0] for v in vehicles] if vehicles else ['all']
             
             vehicle_filter = st.selectbox(
@@ -1571,7 +1702,7 @@ def show_add_assignment_form():
             SELECT id, name, license_plate 
             FROM vehicles 
             WHERE organization_id = :organization_id
-            ORDER BY name
+            ORDER BY name_sort_key, name
         """, {
             'organization_id': st.session_state.get('organization_id')
         })
@@ -1748,12 +1879,13 @@ else:
     
     # Only show main tabs if no special views are active
     if not document_viewer_active:
-        tab1, tab2, tab3, tab4, tab5 = st.tabs([
+        tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
             get_text('vehicles', language),
             "📄 Все документы",
             "⚠️ Истекающие документы", 
             "👥 Назначения автомобилей",
-            get_text('add', language)
+            get_text('add', language),
+            "📥 Импорт"
         ])
 
         with tab1:
@@ -1769,4 +1901,7 @@ else:
             show_vehicle_assignments()
 
         with tab5:
-            show_add_vehicle_form()
\ No newline at end of file
+            show_add_vehicle_form()
+
+        with tab6:
+            show_import_vehicles()
@@ -1,6 +1,7 @@
 import streamlit as st
 import uuid
-import pandas as pd
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
 from database import execute_query, SessionLocal
 from translations import get_text
 from utils import export_to_csv
@@ -8,6 +9,9 @@ from datetime import datetime, date
 from auth import require_auth, show_org_header
 from models import TeamMember, Team, WorkerCategory, TeamMemberDocument
 
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 10
+
 # Page config
 st.set_page_config(
     page_title="Бригады",
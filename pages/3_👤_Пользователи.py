@@ -7,6 +7,9 @@ import hashlib
 from utils import upload_file
 from auth import require_auth, show_org_header, is_admin, can_manage_users, is_owner
 
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 20
+
 # Page config
 st.set_page_config(
     page_title="Пользователи платформы",
@@ -691,7 +694,7 @@ def show_add_user_document_form():
 def delete_user_document(doc_id):
     """Delete user document"""
     try:
-        execute_query("UPDATE user_documents SET is_active = false WHERE id = :id", {'id': doc_id})
+        execute_query("UPDATE user_documents SET is_active = false, deleted_at = CURRENT_TIMESTAMP WHERE id = :id", {'id': doc_id})
         st.success("Документ удален")
         get_user_documents_cached.clear()
         st.rerun()
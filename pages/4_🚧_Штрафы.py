@@ -5,6 +5,11 @@ from database import execute_query
 from translations import get_text
 from utils import format_currency, upload_file, upload_multiple_files
 from auth import require_auth, show_org_header
+from tco_report import record_cost_change
+from bulk_actions import select_rows, clear_selection, mark_penalties_paid, assign_penalties_to_team, delete_penalties, affected_costs
+
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 18
 
 # Page config
 st.set_page_config(
@@ -184,6 +189,8 @@ def show_penalties_list():
             with col3:
                 st.metric("К оплате/Zu zahlen", format_currency(open_amount))
             
+            show_penalty_bulk_actions(penalties)
+            
             st.divider()
             
             # Display penalties
@@ -242,7 +249,7 @@ def show_add_penalty_form():
         
         with col1:
             # Vehicle selection
-            vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name")
+            vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name_sort_key, name")
             if not vehicles:
                 st.warning("Необходимо создать автомобили")
                 return
@@ -338,6 +345,7 @@ def show_add_penalty_form():
                 })
                 st.success(get_text('success_save', language))
                 get_penalties_cached.clear()  # Clear cache
+                record_cost_change(vehicle_id, [penalty_date])
                 st.rerun()
             except Exception as e:
                 st.error(f"Error: {str(e)}")
@@ -460,7 +468,7 @@ def show_edit_penalty_form(penalty_id):
             
             with col1:
                 # Vehicle selection
-                vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name")
+                vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name_sort_key, name")
                 if not vehicles:
                     st.warning("Необходимо создать автомобили")
                     return
@@ -605,6 +613,8 @@ def show_edit_penalty_form(penalty_id):
                         })
                         st.success("Штраф обновлен / Strafe aktualisiert")
                         get_penalties_cached.clear()  # Clear cache
+                        record_cost_change(current_penalty[0], [current_penalty[3]])
+                        record_cost_change(vehicle_id, [penalty_date])
                         del st.session_state.edit_penalty_id
                         st.rerun()
                     except Exception as e:
@@ -622,12 +632,80 @@ def show_edit_penalty_form(penalty_id):
                 del st.session_state.edit_penalty_id
             st.rerun()
 
+def show_penalty_bulk_actions(penalties):
+    """Mark paid, assign a team or delete many penalties at once"""
+    with st.expander("☑️ Массовые действия / Sammelaktionen"):
+        selected = select_rows(
+            [(p[0], p[1], p[2], p[3], float(p[5]), get_text(p[6], language)) for p in penalties],
+            ["Дата/Datum", "Автомобиль/Fahrzeug", "Гос. номер/Kennzeichen", "Сумма/Betrag", "Статус/Status"],
+            "penalties_bulk"
+        )
+        st.write(f"Выбрано/Ausgewählt: {len(selected)}")
+        
+        action = st.selectbox(
+            "Действие/Aktion",
+            options=['paid', 'team', 'delete'],
+            format_func=lambda x: {
+                'paid': "Отметить оплаченными/Als bezahlt markieren",
+                'team': "Назначить бригаду/Team zuweisen",
+                'delete': "Удалить/Löschen"
+            }[x],
+            key="penalties_bulk_action"
+        )
+        org_id = st.session_state.get('organization_id')
+        
+        if action == 'paid':
+            note = st.text_input("Примечание к оплате/Zahlungsnotiz", key="penalties_bulk_note")
+        elif action == 'team':
+            teams = execute_query("SELECT id, name FROM teams ORDER BY name")
+            if not teams:
+                st.warning("Нет бригад/Keine Teams")
+                return
+            team_id = st.selectbox(
+                "Бригада/Team",
+                options=[t[0] for t in teams],
+                format_func=lambda x: next((t[1] for t in teams if t[0] == x), x),
+                key="penalties_bulk_team"
+            )
+        else:
+            confirmed = st.checkbox(
+                "Подтверждаю удаление выбранных штрафов / Löschen bestätigen",
+                key="penalties_bulk_confirm"
+            )
+        
+        if st.button("Применить/Anwenden", key="penalties_bulk_apply", disabled=not selected):
+            try:
+                if action == 'paid':
+                    changed = mark_penalties_paid(selected, org_id, note)
+                elif action == 'team':
+                    changed = assign_penalties_to_team(selected, team_id, org_id)
+                elif confirmed:
+                    changed = delete_penalties(selected, org_id)
+                    vehicle_ids, dates = affected_costs(changed)
+                    if vehicle_ids:
+                        record_cost_change(vehicle_ids, dates)
+                else:
+                    st.warning("Подтвердите удаление / Bitte Löschen bestätigen")
+                    return
+                get_penalties_cached.clear()
+                clear_selection("penalties_bulk")
+                st.session_state.penalties_bulk_result = f"✅ Обработано/Verarbeitet: {len(changed)}"
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+        
+        if 'penalties_bulk_result' in st.session_state:
+            st.success(st.session_state.pop('penalties_bulk_result'))
+
 def delete_penalty(penalty_id):
     """Delete penalty"""
     try:
+        penalty = execute_query("SELECT vehicle_id, date FROM penalties WHERE id = :id", {'id': penalty_id})
         execute_query("DELETE FROM penalties WHERE id = :id", {'id': penalty_id})
         st.success(get_text('success_delete', language))
         get_penalties_cached.clear()  # Clear cache
+        if penalty:
+            record_cost_change(penalty[0][0], [penalty[0][1]])
         st.rerun()
     except Exception as e:
         st.error(f"Error: {str(e)}")
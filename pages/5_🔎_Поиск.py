@@ -0,0 +1,71 @@
+import streamlit as st
+from auth import require_auth, show_org_header
+from global_search import search
+
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 3
+
+# Page config
+st.set_page_config(
+    page_title="Поиск",
+    page_icon="🔎",
+    layout="wide"
+)
+
+# Require authentication
+require_auth()
+show_org_header()
+
+ENTITY_LABELS = {
+    'vehicle': ("🚗", "Автомобиль / Fahrzeug"),
+    'user': ("👤", "Пользователь / Benutzer"),
+    'team': ("👷", "Бригада / Team"),
+    'team_member': ("🧑‍🔧", "Член бригады / Teammitglied"),
+    'penalty': ("🚧", "Штраф / Strafe"),
+    'expense': ("💰", "Расход / Ausgabe"),
+    'vehicle_document': ("📄", "Документ авто / Fahrzeugdokument"),
+    'user_document': ("🪪", "Документ пользователя / Benutzerdokument"),
+}
+
+@st.cache_data(ttl=60)
+def search_cached(organization_id, query, entity_types):
+    """Ranked search results with caching"""
+    return search(organization_id, query, entity_types=entity_types)
+
+def show_search():
+    """Single search box over vehicles, people, teams, penalties, expenses and documents"""
+    st.title("🔎 Поиск / Suche")
+
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        query = st.text_input(
+            "Номер, VIN, имя, бригада, документ… / Kennzeichen, VIN, Name, Team, Dokument…",
+            key="global_search_query"
+        )
+    with col2:
+        entity_types = st.multiselect(
+            "Только / Nur",
+            list(ENTITY_LABELS),
+            format_func=lambda t: f"{ENTITY_LABELS[t][0]} {ENTITY_LABELS[t][1]}"
+        )
+
+    if not query or not query.strip():
+        st.info("Введите запрос / Suchbegriff eingeben")
+        return
+
+    results = search_cached(
+        st.session_state.get('organization_id'), query.strip(), tuple(entity_types) or None
+    )
+    if not results:
+        st.warning("Ничего не найдено / Keine Treffer")
+        return
+
+    st.caption(f"Найдено: {len(results)} / Treffer: {len(results)}")
+    for result in results:
+        icon, label = ENTITY_LABELS.get(result['entity_type'], ("•", result['entity_type']))
+        via = " · ↳ по автомобилю / über Fahrzeug" if result['via_vehicle'] else ""
+        with st.container(border=True):
+            st.markdown(f"{icon} **{result['title'] or '—'}**")
+            st.caption(f"{label}{via}" + (f" · {result['subtitle']}" if result['subtitle'] else ""))
+
+show_search()
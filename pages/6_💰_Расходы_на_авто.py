@@ -5,6 +5,13 @@ from database import execute_query
 from translations import get_text
 from utils import format_currency, upload_file, upload_multiple_files
 from auth import require_auth, show_org_header
+from tco_report import record_cost_change
+from analytics_cache import invalidate_analytics_cache
+from statement_import import import_statement, assign_card
+from bulk_actions import select_rows, clear_selection, delete_expenses, affected_costs
+
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 10
 
 # Page config
 st.set_page_config(
@@ -56,6 +63,8 @@ def show_expenses_list():
             total_amount = sum(float(e[4]) if e[4] is not None else 0 for e in expenses)
             
             st.metric("Общие расходы/Gesamtausgaben", format_currency(total_amount))
+            show_expense_bulk_actions(expenses)
+            
             st.divider()
             
             # Display expenses
@@ -108,7 +117,7 @@ def show_add_expense_form():
         
         with col1:
             # Vehicle selection
-            vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name")
+            vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name_sort_key, name")
             if not vehicles:
                 st.warning("Необходимо создать автомобили")
                 return
@@ -180,6 +189,8 @@ def show_add_expense_form():
                     })
                     st.success(get_text('success_save', language))
                     get_car_expenses_cached.clear()  # Clear cache
+                    invalidate_analytics_cache(st.session_state.get('organization_id'), [expense_date])
+                    record_cost_change(vehicle_id, [expense_date])
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
@@ -218,7 +229,7 @@ def show_edit_expense_form(expense_id):
             
             with col1:
                 # Vehicle selection
-                vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name")
+                vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name_sort_key, name")
                 if not vehicles:
                     st.warning("Необходимо создать автомобили")
                     return
@@ -317,6 +328,12 @@ def show_edit_expense_form(expense_id):
                             })
                             st.success("Расход обновлен / Ausgabe aktualisiert")
                             get_car_expenses_cached.clear()  # Clear cache
+                            invalidate_analytics_cache(
+                                st.session_state.get('organization_id'),
+                                [current_expense[1], expense_date]
+                            )
+                            record_cost_change(current_expense[0], [current_expense[1]])
+                            record_cost_change(vehicle_id, [expense_date])
                             del st.session_state.edit_expense_id
                             st.rerun()
                         except Exception as e:
@@ -336,26 +353,135 @@ def show_edit_expense_form(expense_id):
                 del st.session_state.edit_expense_id
             st.rerun()
 
+def show_expense_bulk_actions(expenses):
+    """Delete many expenses at once (expenses created by maintenance are kept)"""
+    with st.expander("☑️ Массовые действия / Sammelaktionen"):
+        selected = select_rows(
+            [(e[0], e[1], e[2], get_text(e[3], language), float(e[4] or 0), e[5] or '')
+             for e in expenses if not e[7]],
+            ["Дата/Datum", "Автомобиль/Fahrzeug", "Категория/Kategorie", "Сумма/Betrag", "Описание/Beschreibung"],
+            "expenses_bulk"
+        )
+        st.write(f"Выбрано/Ausgewählt: {len(selected)}")
+        confirmed = st.checkbox(
+            "Подтверждаю удаление выбранных расходов / Löschen bestätigen",
+            key="expenses_bulk_confirm"
+        )
+        
+        if st.button("🗑️ Удалить/Löschen", key="expenses_bulk_delete", disabled=not (selected and confirmed)):
+            try:
+                org_id = st.session_state.get('organization_id')
+                deleted = delete_expenses(selected, org_id)
+                vehicle_ids, dates = affected_costs(deleted)
+                get_car_expenses_cached.clear()
+                invalidate_analytics_cache(org_id, dates)
+                if vehicle_ids:
+                    record_cost_change(vehicle_ids, dates)
+                clear_selection("expenses_bulk")
+                st.session_state.expenses_bulk_result = f"✅ Удалено/Gelöscht: {len(deleted)}"
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+        
+        if 'expenses_bulk_result' in st.session_state:
+            st.success(st.session_state.pop('expenses_bulk_result'))
+
 def delete_expense(expense_id):
     """Delete expense"""
     try:
+        expense = execute_query("SELECT vehicle_id, date FROM car_expenses WHERE id = :id", {'id': expense_id})
         execute_query("DELETE FROM car_expenses WHERE id = :id", {'id': expense_id})
         st.success(get_text('success_delete', language))
         get_car_expenses_cached.clear()  # Clear cache
+        invalidate_analytics_cache(st.session_state.get('organization_id'), [expense[0][1]] if expense else None)
+        if expense:
+            record_cost_change(expense[0][0], [expense[0][1]])
         st.rerun()
     except Exception as e:
         st.error(f"Error: {str(e)}")
 
+def show_statement_import():
+    """Import a fuel card / bank statement (CSV or CAMT XML) into car expenses"""
+    st.subheader("📥 Импорт выписки / Kontoauszug importieren")
+    st.caption("CSV топливных карт или CAMT.053 XML банка / Tankkarten-CSV oder CAMT.053-XML der Bank")
+
+    uploaded = st.file_uploader("CSV / XML", type=['csv', 'xml'], key="statement_import_file")
+    if not uploaded:
+        return
+
+    org_id = st.session_state.get('organization_id')
+    try:
+        uploaded.seek(0)
+        preview, _ = import_statement(uploaded, org_id, dry_run=True)
+    except Exception as e:
+        st.error(f"❌ Не удалось прочитать выписку / Auszug konnte nicht gelesen werden: {str(e)}")
+        return
+    if preview.empty:
+        st.info(get_text('no_data', language))
+        return
+
+    counts = preview['result'].value_counts()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Новые / Neu", int(counts.get('new', 0)))
+    with col2:
+        st.metric("Уже внесены / Bereits gebucht", int(counts.get('duplicate', 0)))
+    with col3:
+        st.metric("Без автомобиля / Ohne Fahrzeug", int(counts.get('unmatched', 0)))
+    with col4:
+        st.metric("Ошибки / Fehler", int(counts.get('error', 0)))
+    st.dataframe(preview, use_container_width=True, hide_index=True)
+
+    # Cards that matched no vehicle can be assigned once and match from then on
+    unmatched_cards = sorted({c for c in preview.loc[preview['result'] == 'unmatched', 'card'] if c})[:20]
+    if unmatched_cards:
+        vehicles = execute_query("SELECT id, name, license_plate FROM vehicles WHERE organization_id = :org_id ORDER BY name_sort_key, name",
+                                 {'org_id': org_id}) or []
+        with st.form("assign_fuel_cards"):
+            st.write("💳 **Назначить карты / Karten zuordnen**")
+            assignments = {}
+            for card in unmatched_cards:
+                assignments[card] = st.selectbox(
+                    card,
+                    options=[None] + [v[0] for v in vehicles],
+                    format_func=lambda x: '—' if x is None else next((f"{v[1]} ({v[2]})" for v in vehicles if v[0] == x), x),
+                    key=f"assign_card_{card}"
+                )
+            if st.form_submit_button("💾 Сохранить карты / Karten speichern"):
+                for card, vehicle_id in assignments.items():
+                    if vehicle_id:
+                        assign_card(vehicle_id, card)
+                st.rerun()
+
+    new_count = int(counts.get('new', 0))
+    if new_count and st.button(f"📥 Импортировать {new_count} / Importieren", type="primary"):
+        try:
+            uploaded.seek(0)
+            report, inserted = import_statement(uploaded, org_id)
+        except Exception as e:
+            st.error(f"❌ Ошибка импорта / Importfehler: {str(e)}")
+            return
+        st.success(f"✅ Импортировано / Importiert: {len(inserted)}")
+        if inserted:
+            days = sorted({line['date'] for line in inserted})
+            get_car_expenses_cached.clear()
+            invalidate_analytics_cache(org_id, days)
+            record_cost_change(sorted({line['vehicle_id'] for line in inserted}), days)
+
 # Main page
 st.title(f"🚗💰 {get_text('car_expenses', language)}")
 
-tab1, tab2 = st.tabs([
+tab1, tab2, tab3 = st.tabs([
     "Расходы/Ausgaben",
-    get_text('add', language)
+    get_text('add', language),
+    "📥 Импорт выписки"
 ])
 
 with tab1:
     show_expenses_list()
 
 with tab2:
-    show_add_expense_form()
\ No newline at end of file
+    show_add_expense_form()
+
+with tab3:
+    show_statement_import()
@@ -1,12 +1,16 @@
 import streamlit as st
 from datetime import datetime, timedelta
 from database import execute_query
-from translations import get_text
+from translations import get_text, translate_series
 from utils import format_currency
-import pandas as pd
-import plotly.express as px
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
+px = lazy_module('plotly.express')
 from auth import require_auth, show_org_header
 
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 6
+
 # Page config
 st.set_page_config(
     page_title="Расходы",
@@ -76,7 +80,7 @@ try:
         st.subheader("🚗 Расходы на автомобили / Fahrzeugausgaben")
         if car_expenses:
             df_car = pd.DataFrame(car_expenses, columns=['Type', 'Category', 'Total', 'Count'])
-            df_car['Category_Translated'] = df_car['Category'].apply(lambda x: get_text(x, language))
+            df_car['Category_Translated'] = translate_series(df_car['Category'], language)
             
             fig_car = px.pie(
                 df_car,
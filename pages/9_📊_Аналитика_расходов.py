@@ -1,14 +1,20 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
+px = lazy_module('plotly.express')
+go = lazy_module('plotly.graph_objects')
 from database import execute_query
 from translations import get_text
 from utils import format_currency
 from datetime import datetime, timedelta
 import uuid
 from auth import require_auth, show_org_header
+from analytics_cache import get_vehicle_analytics, start_prewarm
+from forecasting import get_forecast
+from tco_report import get_tco_ranking, has_tco_data, rebuild_tco, tco_dataframe, tco_to_csv
+
+# SQL statements allowed per rerun (checked by query_budget.py)
+QUERY_BUDGET = 15
 
 # Page config
 st.set_page_config(
@@ -20,6 +26,7 @@ st.set_page_config(
 # Require authentication
 require_auth()
 show_org_header()
+start_prewarm()
 
 # Language from session state
 language = st.session_state.get('language', 'ru')
@@ -142,29 +149,10 @@ def show_vehicle_analytics():
             help="Конечная дата для анализа"
         )
     
-    # Get vehicle statistics
-    vehicle_stats = execute_query("""
-        SELECT 
-            v.id,
-            v.name,
-            v.license_plate,
-            v.photo_url,
-            COUNT(ce.id) as expense_count,
-            COALESCE(SUM(ce.amount), 0) as total_amount,
-            COALESCE(AVG(ce.amount), 0) as avg_amount,
-            SUM(CASE WHEN ce.category = 'fuel' THEN ce.amount ELSE 0 END) as fuel_cost,
-            SUM(CASE WHEN ce.category = 'repair' THEN ce.amount ELSE 0 END) as repair_cost,
-            SUM(CASE WHEN ce.category = 'maintenance' THEN ce.amount ELSE 0 END) as maintenance_cost,
-            SUM(CASE WHEN ce.category = 'insurance' THEN ce.amount ELSE 0 END) as insurance_cost,
-            SUM(CASE WHEN ce.category = 'other' THEN ce.amount ELSE 0 END) as other_cost
-        FROM vehicles v
-        LEFT JOIN car_expenses ce ON v.id = ce.vehicle_id 
-            AND ce.date BETWEEN :date_from AND :date_to
-        GROUP BY v.id, v.name, v.license_plate, v.photo_url
-        HAVING COALESCE(SUM(ce.amount), 0) > 0
-        ORDER BY total_amount DESC
-        LIMIT 20
-    """, {'date_from': date_from, 'date_to': date_to})
+    # Get vehicle statistics (assembled from cached daily aggregates)
+    vehicle_stats = get_vehicle_analytics(
+        st.session_state.get('organization_id'), date_from, date_to
+    )
     
     if vehicle_stats:
         # Summary metrics
@@ -654,6 +642,55 @@ def show_comparative_analytics():
     else:
         st.info("📊 Нет данных о расходах за последние 30 дней")
         st.write("Для отображения трендов необходимы данные о расходах")
+    
+    st.divider()
+    
+    # Projection from the nightly fitted models (no fitting during the request)
+    st.subheader("🔮 Прогноз расходов")
+    
+    forecast_scope = st.selectbox(
+        "Ряд для прогноза",
+        options=['all', 'fuel', 'repair', 'maintenance', 'insurance', 'other', 'penalties'],
+        format_func=lambda x: {
+            'all': 'Все расходы', 'fuel': 'Топливо', 'repair': 'Ремонт',
+            'maintenance': 'Обслуживание', 'insurance': 'Страховка',
+            'other': 'Прочее', 'penalties': 'Штрафы'
+        }[x],
+        key="forecast_scope"
+    )
+    forecast = get_forecast(
+        st.session_state.get('organization_id'),
+        scope='tenant' if forecast_scope == 'all' else 'category',
+        scope_key=forecast_scope,
+        horizon=6
+    )
+    
+    if forecast:
+        forecast_months = [m for m, _, _, _ in forecast]
+        
+        fig_forecast = go.Figure()
+        fig_forecast.add_trace(go.Scatter(
+            x=forecast_months, y=[upper for _, _, _, upper in forecast],
+            line=dict(width=0), showlegend=False, hoverinfo='skip'
+        ))
+        fig_forecast.add_trace(go.Scatter(
+            x=forecast_months, y=[lower for _, _, lower, _ in forecast],
+            line=dict(width=0), fill='tonexty', fillcolor='rgba(69, 183, 209, 0.25)',
+            name='Диапазон (95%)'
+        ))
+        fig_forecast.add_trace(go.Scatter(
+            x=forecast_months, y=[value for _, value, _, _ in forecast],
+            line=dict(color='#45B7D1', width=3, dash='dash'), name='Прогноз'
+        ))
+        fig_forecast.update_layout(
+            title="Прогноз расходов по месяцам",
+            xaxis_title="Месяц",
+            yaxis_title="Расходы (€)",
+            height=400
+        )
+        st.plotly_chart(fig_forecast, use_container_width=True)
+    else:
+        st.info("🔮 Прогноз ещё не рассчитан — модели обновляются ночью")
 
 # Main page
 st.title("📊 Комплексная аналитика расходов")
@@ -811,13 +848,78 @@ def show_user_statistics():
             fig_users.update_layout(yaxis={'categoryorder': 'total ascending'})
             st.plotly_chart(fig_users, use_container_width=True)
 
+def show_tco_report():
+    """Show total cost of ownership ranking per vehicle"""
+    st.subheader("💶 Полная стоимость владения (TCO)")
+    
+    organization_id = st.session_state.get('organization_id')
+    
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        date_from = st.date_input(
+            "С месяца",
+            value=datetime.now().replace(month=1, day=1),
+            help="Учитываются целые месяцы",
+            key="tco_date_from"
+        )
+    with col2:
+        date_to = st.date_input(
+            "По месяц",
+            value=datetime.now(),
+            key="tco_date_to"
+        )
+    with col3:
+        st.write("")
+        rebuild = st.button("🔄 Пересчитать", help="Полный пересчёт TCO по всем автомобилям")
+    
+    if rebuild or not has_tco_data(organization_id):
+        with st.spinner("Расчёт TCO..."):
+            rebuild_tco(organization_id)
+    
+    tco_rows = get_tco_ranking(organization_id, date_from, date_to)
+    
+    if not tco_rows:
+        st.info("📊 Нет данных о стоимости владения за выбранный период")
+        return
+    
+    df_tco = tco_dataframe(tco_rows)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Автомобилей", len(df_tco))
+    with col2:
+        st.metric("Общая TCO", format_currency(df_tco['Итого TCO'].sum()))
+    with col3:
+        st.metric("Средняя TCO на автомобиль", format_currency(df_tco['Итого TCO'].mean()))
+    
+    top = df_tco.head(10)
+    fig = px.bar(
+        top,
+        x='Название',
+        y=['Топливо', 'Ремонт', 'Обслуживание', 'Страховка', 'Прочее', 'Штрафы', 'Аренда', 'Налог'],
+        title="🏆 ТОП-10 автомобилей по TCO",
+        labels={'value': 'Сумма (€)', 'variable': 'Категория'}
+    )
+    fig.update_layout(height=400)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.dataframe(df_tco.drop(columns=['ID']), use_container_width=True, hide_index=True)
+    
+    st.download_button(
+        label="📥 CSV",
+        data=tco_to_csv(tco_rows),
+        file_name=f"tco_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        mime="text/csv"
+    )
+
 # Tabs for different analytics
-tab1, tab2, tab3, tab4, tab5 = st.tabs([
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
     "🚗 По автомобилям",
     "👥 По бригадам", 
     "📊 Статистика штрафов",
     "👤 По водителям",
-    "⚖️ Сравнительная аналитика"
+    "⚖️ Сравнительная аналитика",
+    "💶 TCO"
 ])
 
 with tab1:
@@ -833,4 +935,7 @@ with tab4:
     show_user_statistics()
 
 with tab5:
-    show_comparative_analytics()
\ No newline at end of file
+    show_comparative_analytics()
+
+with tab6:
+    show_tco_report()
\ No newline at end of file
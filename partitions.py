@@ -0,0 +1,332 @@
+"""
+Monthly range partitioning of car_expenses and penalties
+
+Both tables are append-heavy and every analytics query filters by date, so
+they are partitioned by month on `date` (<table>_YYYY_MM, plus
+<table>_default for dates outside the created range). Queries on a recent
+window then only scan the recent partitions.
+
+- convert_table() is the one-time migration (called from
+  database.migrate_partitioned_tables): the table is renamed, a partitioned
+  copy is created with partitions for all months in use, the rows are moved
+  and the old table's foreign keys, indexes, row level security policies and
+  grants are recreated on the new parent. The primary key becomes
+  (id, date), as PostgreSQL requires the partition key in it.
+- ensure_partitions() creates the coming FUTURE_MONTHS partitions; rows that
+  already landed in the default partition are moved into the new one.
+  split_default() gives every month found in the default partition (history
+  loaded after the conversion, imports, backfills) its own partition.
+  maintain_partitions() runs both, daily in a background thread
+  (start_maintenance) or with `python partitions.py ensure`.
+- archive_partitions() detaches partitions older than RETENTION_MONTHS,
+  writes them to ARCHIVE_DIR as gzipped CSV with a SHA-256 file and drops
+  them.
+
+    python partitions.py status
+    python partitions.py ensure
+    python partitions.py archive [--retention-months 120] [--dry-run]
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from datetime import date
+from sqlalchemy import text
+from database import engine
+from query_metrics import background_thread_name
+
+# Partitioned table -> partition key
+PARTITIONED_TABLES = {'car_expenses': 'date', 'penalties': 'date'}
+FUTURE_MONTHS = 3
+# Bookkeeping records are kept for ten years before they are archived
+RETENTION_MONTHS = int(os.getenv('PARTITION_RETENTION_MONTHS', '120'))
+ARCHIVE_DIR = os.getenv('PARTITION_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+MAINTENANCE_INTERVAL = 24 * 3600
+
+_PARTITION_NAME = re.compile(r'_(\d{4})_(\d{2})$')
+_maintenance_thread = None
+_maintenance_lock = threading.Lock()
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_{month:%Y_%m}"
+
+
+def is_partitioned(conn, table):
+    return conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"),
+                        {'table': table}).scalar()
+
+
+def list_partitions(conn, table):
+    """[(partition, month or None for the default partition, rows)] oldest first"""
+    rows = conn.execute(text("""
+        SELECT c.relname, c.reltuples::BIGINT
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table)
+        ORDER BY c.relname
+    """), {'table': table}).fetchall()
+    partitions = []
+    for name, estimate in rows:
+        match = _PARTITION_NAME.search(name)
+        month = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+        partitions.append((name, month, max(estimate, 0)))
+    return partitions
+
+
+def _create_partition(conn, table, column, month):
+    """Create the month's partition unless it exists; returns True if created"""
+    name = partition_name(table, month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar():
+        return False
+    bounds = {'start': month, 'end': add_months(month, 1)}
+    default = f"{table}_default"
+    in_default = False
+    if conn.execute(text("SELECT to_regclass(:name)"), {'name': default}).scalar():
+        in_default = conn.execute(text(f"""
+            SELECT EXISTS (SELECT 1 FROM {default} WHERE {column} >= :start AND {column} < :end)
+        """), bounds).scalar()
+
+    if not in_default:
+        conn.execute(text(f"""
+            CREATE TABLE {name} PARTITION OF {table}
+            FOR VALUES FROM ('{month}') TO ('{bounds['end']}')
+        """))
+        return True
+    # Attaching checks that the default partition holds no rows of the new range
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {default} WHERE {column} >= :start AND {column} < :end RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), bounds)
+    conn.execute(text(f"""
+        ALTER TABLE {table} ATTACH PARTITION {name}
+        FOR VALUES FROM ('{month}') TO ('{bounds['end']}')
+    """))
+    return True
+
+
+def ensure_partitions(conn, table, first=None, last=None):
+    """Create monthly partitions from first to last (default: now + FUTURE_MONTHS)"""
+    column = PARTITIONED_TABLES[table]
+    month = month_start(first or date.today())
+    last = month_start(last or add_months(date.today(), FUTURE_MONTHS))
+    created = []
+    while month <= last:
+        if _create_partition(conn, table, column, month):
+            created.append(partition_name(table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def split_default(conn, table):
+    """Move months that landed in the default partition (backfills, imports) into their own partitions"""
+    column = PARTITIONED_TABLES[table]
+    default = f"{table}_default"
+    if not conn.execute(text("SELECT to_regclass(:name)"), {'name': default}).scalar():
+        return []
+    months = conn.execute(text(f"""
+        SELECT DISTINCT DATE_TRUNC('month', {column})::date
+        FROM {default}
+        WHERE {column} IS NOT NULL
+        ORDER BY 1
+    """)).scalars().all()
+    created = []
+    for month in months:
+        if _create_partition(conn, table, column, month):
+            created.append(partition_name(table, month))
+    return created
+
+
+def _recreate_dependencies(conn, table, legacy):
+    """Foreign keys, indexes, policies and grants of the legacy table on the new parent"""
+    foreign_keys = conn.execute(text("""
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = to_regclass(:legacy) AND contype = 'f'
+    """), {'legacy': legacy}).fetchall()
+    indexes = conn.execute(text("""
+        SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        WHERE i.indrelid = to_regclass(:legacy) AND NOT i.indisprimary
+    """), {'legacy': legacy}).fetchall()
+    policies = conn.execute(text("""
+        SELECT policyname, permissive, array_to_string(roles, ', '), cmd, qual, with_check
+        FROM pg_policies
+        WHERE schemaname = current_schema() AND tablename = :legacy
+    """), {'legacy': legacy}).fetchall()
+    row_security = conn.execute(text("SELECT relrowsecurity FROM pg_class WHERE oid = to_regclass(:legacy)"),
+                                {'legacy': legacy}).scalar()
+    grants = conn.execute(text("""
+        SELECT grantee, string_agg(privilege_type, ', ')
+        FROM information_schema.role_table_grants
+        WHERE table_schema = current_schema() AND table_name = :legacy
+          AND grantee <> current_user
+        GROUP BY grantee
+    """), {'legacy': legacy}).fetchall()
+
+    conn.execute(text(f"DROP TABLE {legacy}"))
+
+    for name, definition in foreign_keys:
+        conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"))
+    for name, definition in indexes:
+        if ' UNIQUE ' in definition:
+            print(f"⚠️ {table}: unique index {name} dropped (must include the partition key)")
+            continue
+        conn.execute(text(re.sub(rf" ON (\w+\.)?{legacy} ", f" ON {table} ", definition)))
+    for name, permissive, roles, cmd, qual, with_check in policies:
+        statement = f'CREATE POLICY "{name}" ON {table} AS {permissive} FOR {cmd} TO {roles}'
+        if qual:
+            statement += f" USING ({qual})"
+        if with_check:
+            statement += f" WITH CHECK ({with_check})"
+        conn.execute(text(statement))
+    if row_security:
+        conn.execute(text(f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY"))
+    for grantee, privileges in grants:
+        conn.execute(text(f'GRANT {privileges} ON {table} TO "{grantee}"'))
+
+
+def convert_table(conn, table):
+    """Turn a plain table into a monthly partitioned one with the same rows; no-op if done"""
+    if is_partitioned(conn, table) or not conn.execute(text("SELECT to_regclass(:t)"), {'t': table}).scalar():
+        return False
+    column = PARTITIONED_TABLES[table]
+    legacy = f"{table}_unpartitioned"
+    conn.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    first, last = conn.execute(text(f"SELECT MIN({column}), MAX({column}) FROM {table}")).fetchone()
+
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    conn.execute(text(f"""
+        CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE ({column})
+    """))
+    conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+    ensure_partitions(conn, table, first or date.today(),
+                      max(last or date.today(), add_months(date.today(), FUTURE_MONTHS)))
+    conn.execute(text(f"INSERT INTO {table} SELECT * FROM {legacy}"))
+
+    _recreate_dependencies(conn, table, legacy)
+    conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})"))
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_org_{column} ON {table} (organization_id, {column})"))
+    return True
+
+
+def maintain_partitions():
+    """Create the coming months' partitions of every partitioned table and split
+    months out of the default partition"""
+    created = []
+    with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(conn, table):
+                created += split_default(conn, table)
+                created += ensure_partitions(conn, table)
+    return created
+
+
+def _maintenance_loop():
+    while True:
+        try:
+            created = maintain_partitions()
+            if created:
+                print(f"Created partitions: {', '.join(created)}")
+        except Exception as e:
+            print(f"Partition maintenance failed: {e}")
+        time.sleep(MAINTENANCE_INTERVAL)
+
+
+def start_maintenance():
+    """Start the daily partition maintenance thread once per process"""
+    global _maintenance_thread
+    with _maintenance_lock:
+        if _maintenance_thread is None or not _maintenance_thread.is_alive():
+            _maintenance_thread = threading.Thread(
+                target=_maintenance_loop, name=background_thread_name("partition-maintenance"), daemon=True
+            )
+            _maintenance_thread.start()
+
+
+def archive_partitions(retention_months=RETENTION_MONTHS, archive_dir=ARCHIVE_DIR, dry_run=False):
+    """Detach, export and drop partitions older than the retention; returns archive paths"""
+    cutoff = add_months(month_start(date.today()), -retention_months)
+    archived = []
+    for table in PARTITIONED_TABLES:
+        with engine.connect() as conn:
+            if not is_partitioned(conn, table):
+                continue
+            old = [name for name, month, _ in list_partitions(conn, table) if month and month < cutoff]
+        for name in old:
+            path = os.path.join(archive_dir, table, f"{name}.csv.gz")
+            if dry_run:
+                archived.append(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Export while attached, then detach and drop in one short transaction
+            with engine.begin() as conn:
+                cursor = conn.connection.dbapi_connection.cursor()
+                with open(path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                    cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+                exported = cursor.rowcount
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(chunk)
+            with open(f"{path}.sha256", 'w') as f:
+                f.write(f"{sha256.hexdigest()}  {os.path.basename(path)}\n")
+            with engine.begin() as conn:
+                conn.execute(text(f"LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE"))
+                rows = conn.execute(text(f"SELECT COUNT(*) FROM {name}")).scalar()
+                if rows != exported:
+                    raise RuntimeError(f"{name} changed during the export ({exported} -> {rows} rows); run again")
+                conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+            archived.append(path)
+    return archived
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions of car_expenses and penalties")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help="list partitions with estimated row counts")
+    commands.add_parser('ensure', help=f"split the default partition and create the next {FUTURE_MONTHS} months")
+    archive = commands.add_parser('archive', help="export and drop partitions past the retention")
+    archive.add_argument('--retention-months', type=int, default=RETENTION_MONTHS)
+    archive.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    archive.add_argument('--dry-run', action='store_true')
+    options = parser.parse_args(argv)
+
+    if options.command == 'status':
+        with engine.connect() as conn:
+            for table in PARTITIONED_TABLES:
+                if not is_partitioned(conn, table):
+                    print(f"{table}: not partitioned")
+                    continue
+                print(f"{table}:")
+                for name, _, rows in list_partitions(conn, table):
+                    print(f"  {name:<32} ~{rows}")
+    elif options.command == 'ensure':
+        created = maintain_partitions()
+        print(f"✅ Created {len(created)} partitions" + (f": {', '.join(created)}" if created else ""))
+    else:
+        for path in archive_partitions(options.retention_months, options.archive_dir, options.dry_run):
+            print(f"{'would archive' if options.dry_run else '✅ archived'} {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
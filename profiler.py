@@ -0,0 +1,281 @@
+"""
+Script-run profiler
+
+Records a span tree for every Streamlit rerun: the rerun itself is the root,
+authentication, each SQL statement, each chart and any code wrapped with
+span()/@profiled become children. Finished reruns update rolling per-page
+aggregates, which can be exported as JSON or Prometheus text format.
+
+Enable with RERUN_PROFILER=1. When disabled span() returns a shared no-op
+context manager, @profiled returns the function unchanged and no hooks are
+installed.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+ENABLED = os.getenv('RERUN_PROFILER') == '1'
+# Finished span trees kept for inspection
+RECENT_RERUNS = 50
+# Rerun durations kept per page for percentiles
+PAGE_SAMPLES = 500
+
+_NULL_SPAN = nullcontext()
+_local = threading.local()
+_lock = threading.Lock()
+_installed = False
+
+_recent = deque(maxlen=RECENT_RERUNS)
+_pages = {}
+
+
+class Span:
+    __slots__ = ('name', 'start', 'end', 'children')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'duration_ms': round(self.duration * 1000, 3),
+            'children': [child.to_dict() for child in self.children]
+        }
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def _span(name):
+    stack = _stack()
+    if not stack:
+        # Outside a rerun (e.g. batch jobs): nothing to attach to
+        yield
+        return
+    current = Span(name)
+    stack[-1].children.append(current)
+    stack.append(current)
+    try:
+        yield current
+    finally:
+        current.end = time.perf_counter()
+        stack.pop()
+
+
+def span(name):
+    """Context manager timing a block as a child of the current span"""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _span(name)
+
+
+def profiled(name=None):
+    """Decorator timing every call of a function as a span"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def begin_rerun():
+    """Start the root span of a rerun in the current script thread"""
+    _local.stack = [Span('rerun')]
+
+
+def end_rerun(page):
+    """Close the current rerun and fold it into the per-page aggregates"""
+    stack = getattr(_local, 'stack', None)
+    if not stack:
+        return
+    root = stack[0]
+    root.end = time.perf_counter()
+    _local.stack = []
+
+    totals = {}
+
+    def collect(node, path):
+        key = f"{path}/{node.name}" if path else node.name
+        count, total = totals.get(key, (0, 0.0))
+        totals[key] = (count + 1, total + node.duration)
+        for child in node.children:
+            collect(child, key)
+
+    for child in root.children:
+        collect(child, '')
+
+    with _lock:
+        stats = _pages.setdefault(page, {'reruns': 0, 'total': 0.0, 'samples': deque(maxlen=PAGE_SAMPLES), 'spans': {}})
+        stats['reruns'] += 1
+        stats['total'] += root.duration
+        stats['samples'].append(root.duration)
+        for key, (count, total) in totals.items():
+            span_count, span_total = stats['spans'].get(key, (0, 0.0))
+            stats['spans'][key] = (span_count + count, span_total + total)
+        _recent.append({'page': page, 'at': time.time(), 'tree': root.to_dict()})
+
+
+def _quantile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def page_summary():
+    """Rolling aggregates per page, slowest average first"""
+    with _lock:
+        rows = []
+        for page, stats in _pages.items():
+            samples = list(stats['samples'])
+            rows.append({
+                'page': page,
+                'reruns': stats['reruns'],
+                'avg_ms': stats['total'] / stats['reruns'] * 1000,
+                'p50_ms': _quantile(samples, 0.5) * 1000,
+                'p95_ms': _quantile(samples, 0.95) * 1000,
+                'max_ms': max(samples) * 1000 if samples else 0.0,
+                'spans': {
+                    key: {'count': count, 'total_ms': total * 1000, 'per_rerun_ms': total * 1000 / stats['reruns']}
+                    for key, (count, total) in stats['spans'].items()
+                }
+            })
+    rows.sort(key=lambda r: r['avg_ms'], reverse=True)
+    return rows
+
+
+def recent_reruns(page=None):
+    with _lock:
+        reruns = list(_recent)
+    return [r for r in reversed(reruns) if page is None or r['page'] == page]
+
+
+def reset():
+    with _lock:
+        _pages.clear()
+        _recent.clear()
+
+
+def export_json():
+    return json.dumps({'pages': page_summary(), 'recent': recent_reruns()}, ensure_ascii=False, indent=2)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def export_prometheus():
+    """Render the per-page aggregates in Prometheus text exposition format"""
+    lines = [
+        '# HELP streamlit_rerun_seconds Duration of Streamlit script reruns per page.',
+        '# TYPE streamlit_rerun_seconds summary'
+    ]
+    summary = page_summary()
+    for row in summary:
+        page = _label(row['page'])
+        lines.append(f'streamlit_rerun_seconds{{page="{page}",quantile="0.5"}} {row["p50_ms"] / 1000:.6f}')
+        lines.append(f'streamlit_rerun_seconds{{page="{page}",quantile="0.95"}} {row["p95_ms"] / 1000:.6f}')
+        lines.append(f'streamlit_rerun_seconds_sum{{page="{page}"}} {row["avg_ms"] * row["reruns"] / 1000:.6f}')
+        lines.append(f'streamlit_rerun_seconds_count{{page="{page}"}} {row["reruns"]}')
+    lines += [
+        '# HELP streamlit_span_seconds Time spent in profiled spans per page.',
+        '# TYPE streamlit_span_seconds summary'
+    ]
+    for row in summary:
+        page = _label(row['page'])
+        for key, stats in sorted(row['spans'].items()):
+            labels = f'page="{page}",span="{_label(key)}"'
+            lines.append(f'streamlit_span_seconds_sum{{{labels}}} {stats["total_ms"] / 1000:.6f}')
+            lines.append(f'streamlit_span_seconds_count{{{labels}}} {stats["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _page_name(ctx):
+    try:
+        page_hash = ctx.pages_manager.current_page_script_hash
+        page = ctx.pages_manager.get_pages().get(page_hash) or {}
+        return page.get('page_name') or os.path.basename(page.get('script_path') or '') or 'unknown'
+    except Exception:
+        return 'unknown'
+
+
+def _instrument_engine(engine):
+    from sqlalchemy import event
+    from query_metrics import normalize_statement
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        stack = _stack()
+        if stack:
+            current = Span('sql: ' + normalize_statement(statement)[:80])
+            stack[-1].children.append(current)
+            conn.info.setdefault('profiler_spans', []).append(current)
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get('profiler_spans')
+        if spans:
+            spans.pop().end = time.perf_counter()
+
+    def on_error(context):
+        spans = context.connection.info.get('profiler_spans') if context.connection is not None else None
+        if spans:
+            spans.pop().end = time.perf_counter()
+
+    event.listen(engine, 'before_cursor_execute', before)
+    event.listen(engine, 'after_cursor_execute', after)
+    event.listen(engine, 'handle_error', on_error)
+
+
+def install(engine=None):
+    """Hook rerun start/finish, chart rendering and SQL (only when enabled)"""
+    global _installed
+    if not ENABLED or _installed:
+        return
+    _installed = True
+
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import script_runner
+    from streamlit.runtime.scriptrunner_utils.script_run_context import ScriptRunContext
+
+    original_reset = ScriptRunContext.reset
+    original_finished = script_runner.ScriptRunner._on_script_finished
+
+    @functools.wraps(original_reset)
+    def reset(self, *args, **kwargs):
+        begin_rerun()
+        return original_reset(self, *args, **kwargs)
+
+    @functools.wraps(original_finished)
+    def on_script_finished(self, ctx, *args, **kwargs):
+        end_rerun(_page_name(ctx))
+        return original_finished(self, ctx, *args, **kwargs)
+
+    ScriptRunContext.reset = reset
+    script_runner.ScriptRunner._on_script_finished = on_script_finished
+
+    for chart in ('plotly_chart', 'dataframe', 'altair_chart', 'pyplot'):
+        setattr(st, chart, profiled(f'chart: {chart}')(getattr(st, chart)))
+
+    if engine is not None:
+        _instrument_engine(engine)
@@ -0,0 +1,120 @@
+"""
+Query-count budgets per page render
+
+Every page declares how many SQL statements one rerun may issue:
+
+    QUERY_BUDGET = 20
+
+This renders each page with streamlit.testing.v1.AppTest against a seeded
+database (see synthetic_data.py), logged in as an organization owner and
+with st.cache_data cleared, counts the statements sent through the engine
+and fails when a page exceeds its budget. The report also lists identical
+statements (same SQL and parameters) issued more than once in the same
+rerun, which are candidates for request-scoped memoization.
+
+    python query_budget.py [--page 4_] [--json report.json]
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from sqlalchemy import event
+from database import engine
+from benchmark import ROOT, login_session, render_page
+from query_metrics import is_background_thread, normalize_statement
+
+
+def page_scripts():
+    return [os.path.join(ROOT, 'Home.py')] + sorted(glob.glob(os.path.join(ROOT, 'pages', '*.py')))
+
+
+def declared_budget(path):
+    """Return the page's QUERY_BUDGET constant, or None when it declares none"""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in tree.body:
+        if (isinstance(node, ast.Assign)
+                and any(isinstance(t, ast.Name) and t.id == 'QUERY_BUDGET' for t in node.targets)
+                and isinstance(node.value, ast.Constant)):
+            return node.value.value
+    return None
+
+
+@contextmanager
+def record_statements():
+    """Record (statement, parameters) of every statement from foreground threads"""
+    statements = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if not is_background_thread():
+            statements.append((statement, repr(parameters)))
+
+    event.listen(engine, 'before_cursor_execute', before)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before)
+
+
+def check_page(path, session):
+    """Render one page and compare its statement count with its budget"""
+    budget = declared_budget(path)
+    error = None
+    with record_statements() as statements:
+        try:
+            render_page(path, session)
+        except Exception as e:
+            error = str(e)
+
+    duplicates = [
+        {'statement': normalize_statement(statement)[:200], 'times': times}
+        for (statement, _), times in Counter(statements).most_common()
+        if times > 1
+    ]
+    return {
+        'page': os.path.relpath(path, ROOT),
+        'queries': len(statements),
+        'budget': budget,
+        'over_budget': budget is not None and len(statements) > budget,
+        'duplicates': duplicates,
+        'error': error
+    }
+
+
+def print_report(results):
+    for result in results:
+        budget = result['budget'] if result['budget'] is not None else '—'
+        mark = '❌' if result['over_budget'] or result['error'] else '✅'
+        print(f"{mark} {result['page']}: {result['queries']} queries (budget {budget})")
+        if result['error']:
+            print(f"     error: {result['error']}")
+        for duplicate in result['duplicates'][:10]:
+            print(f"     {duplicate['times']}× {duplicate['statement']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check per-page SQL statement budgets with AppTest")
+    parser.add_argument('--page', help="only pages whose file name contains this text")
+    parser.add_argument('--org-id', help="organization to render pages for")
+    parser.add_argument('--json', help="also write the report to this file")
+    options = parser.parse_args(argv)
+
+    session = login_session(options.org_id)
+    results = [
+        check_page(path, session)
+        for path in page_scripts()
+        if not options.page or options.page in os.path.basename(path)
+    ]
+    print_report(results)
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if any(r['over_budget'] or r['error'] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
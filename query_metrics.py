@@ -0,0 +1,261 @@
+"""
+Per-query instrumentation for the SQLAlchemy engine
+
+before_cursor_execute/after_cursor_execute listeners record every statement's
+latency, row count, normalized fingerprint and calling page/function. Recent
+queries are kept in a bounded ring buffer and every fingerprint keeps running
+totals plus a bounded sample of latencies for percentiles. Pool checkout wait
+is measured by TimedQueuePool.
+
+Everything is process-local and in memory. Disable with QUERY_METRICS_ENABLED=0.
+Set QUERY_METRICS_DUMP=<path> to have a snapshot written to a JSON file every
+few seconds, so external tools (load_test.py) can read a running server's
+numbers.
+"""
+import math
+import os
+import re
+import sys
+import threading
+import time
+import hashlib
+import json
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+ENABLED = os.getenv('QUERY_METRICS_ENABLED', '1') != '0'
+# Recent queries kept for the diagnostics page
+RING_SIZE = 2000
+# Latency samples kept per fingerprint for percentiles
+SAMPLE_SIZE = 512
+# Distinct fingerprints tracked; further ones are counted under 'other'
+MAX_FINGERPRINTS = 1000
+DUMP_PATH = os.getenv('QUERY_METRICS_DUMP')
+# Seconds between snapshots written to DUMP_PATH
+DUMP_INTERVAL = 2
+# Every background thread's name starts with this, so per-page statement
+# counts (benchmark.py, query_budget.py) can leave their work out
+BACKGROUND_THREAD_PREFIX = 'background-'
+
+_PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = {os.path.abspath(__file__), os.path.join(_PROJECT_ROOT, 'database.py')}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_BIND_PARAM = re.compile(r"%\([^)]+\)s|%s|(?<!:):\w+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def background_thread_name(name):
+    """Thread name for background work started by this process"""
+    return BACKGROUND_THREAD_PREFIX + name
+
+
+def is_background_thread(thread=None):
+    return (thread or threading.current_thread()).name.startswith(BACKGROUND_THREAD_PREFIX)
+
+
+def normalize_statement(statement):
+    """Reduce a statement to its shape: literals and parameters become ?"""
+    normalized = _STRING_LITERAL.sub('?', statement)
+    normalized = _BIND_PARAM.sub('?', normalized)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _IN_LIST.sub('(?)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def find_caller():
+    """Return (page, function) of the first project frame outside the DB layer"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PROJECT_ROOT) and os.path.abspath(filename) not in _SKIP_FILES:
+            return os.path.relpath(filename, _PROJECT_ROOT), frame.f_code.co_name
+        frame = frame.f_back
+    return 'unknown', 'unknown'
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+class QueryStats:
+    """Running totals for one statement fingerprint"""
+
+    def __init__(self, normalized):
+        self.statement = normalized
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.total_rows = 0
+        self.callers = {}
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def add(self, elapsed, rows, caller):
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.total_rows += max(rows, 0)
+        self.callers[caller] = self.callers.get(caller, 0) + 1
+        self.samples.append(elapsed)
+
+
+class QueryMetrics:
+    """Thread-safe store of recent queries, per-fingerprint stats and pool waits"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.recent = deque(maxlen=RING_SIZE)
+            self.stats = {}
+            self.pool_waits = deque(maxlen=SAMPLE_SIZE)
+            self.pool_wait_total = 0.0
+            self.pool_checkouts = 0
+            self.started_at = time.time()
+
+    def record_query(self, statement, elapsed, rows, caller):
+        normalized = normalize_statement(statement)
+        key = fingerprint(normalized)
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                if len(self.stats) >= MAX_FINGERPRINTS:
+                    key, normalized = 'other', 'other'
+                    stats = self.stats.setdefault(key, QueryStats(normalized))
+                else:
+                    stats = self.stats[key] = QueryStats(normalized)
+            stats.add(elapsed, rows, caller)
+            self.recent.append({
+                'at': time.time(),
+                'fingerprint': key,
+                'statement': normalized,
+                'elapsed': elapsed,
+                'rows': rows,
+                'page': caller[0],
+                'function': caller[1]
+            })
+
+    def record_pool_wait(self, elapsed):
+        with self._lock:
+            self.pool_waits.append(elapsed)
+            self.pool_wait_total += elapsed
+            self.pool_checkouts += 1
+
+    def top_queries(self, limit=20, order_by='total_time'):
+        """Per-fingerprint summaries sorted by total_time, count or max_time"""
+        with self._lock:
+            rows = []
+            for key, stats in self.stats.items():
+                samples = list(stats.samples)
+                rows.append({
+                    'fingerprint': key,
+                    'statement': stats.statement,
+                    'count': stats.count,
+                    'total_time': stats.total_time,
+                    'avg_time': stats.total_time / stats.count if stats.count else 0.0,
+                    'p50': percentile(samples, 50),
+                    'p95': percentile(samples, 95),
+                    'p99': percentile(samples, 99),
+                    'max_time': stats.max_time,
+                    'rows': stats.total_rows,
+                    'top_caller': '%s:%s' % max(stats.callers, key=stats.callers.get) if stats.callers else ''
+                })
+        rows.sort(key=lambda r: r[order_by], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def recent_queries(self, limit=100):
+        with self._lock:
+            return list(self.recent)[-limit:][::-1]
+
+    def snapshot(self):
+        """Pool summary and statement totals as a JSON-serializable dict"""
+        with self._lock:
+            queries = sum(stats.count for stats in self.stats.values())
+            query_time = sum(stats.total_time for stats in self.stats.values())
+        return {'at': time.time(), 'pid': os.getpid(), 'queries': queries,
+                'query_time': query_time, 'pool': self.pool_summary()}
+
+    def pool_summary(self):
+        with self._lock:
+            samples = list(self.pool_waits)
+            return {
+                'checkouts': self.pool_checkouts,
+                'total_wait': self.pool_wait_total,
+                'p50': percentile(samples, 50),
+                'p95': percentile(samples, 95),
+                'p99': percentile(samples, 99),
+                'max': max(samples) if samples else 0.0
+            }
+
+
+metrics = QueryMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each connection checkout waited"""
+
+    def _do_get(self):
+        if not ENABLED:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.record_pool_wait(time.perf_counter() - start)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    metrics.record_query(statement, elapsed, cursor.rowcount, find_caller())
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None:
+        starts = context.connection.info.get('query_start')
+        if starts:
+            starts.pop()
+
+
+def _dump_loop(path):
+    while True:
+        try:
+            temporary = f"{path}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(metrics.snapshot(), f)
+            os.replace(temporary, path)
+        except Exception as e:
+            print(f"Query metrics dump failed: {e}")
+        time.sleep(DUMP_INTERVAL)
+
+
+def instrument_engine(engine):
+    """Attach the query listeners to an engine (no-op when disabled)"""
+    if not ENABLED or event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    if DUMP_PATH:
+        threading.Thread(target=_dump_loop, args=(DUMP_PATH,), name=background_thread_name("query-metrics-dump"), daemon=True).start()
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
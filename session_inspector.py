@@ -0,0 +1,209 @@
+"""
+Session-state accounting and expiry of transient UI keys
+
+Pages keep per-row UI flags in st.session_state under generated keys
+(view_document_<id>, reassign_member_<id>, ...). track_rerun() runs on every
+authenticated rerun (from require_auth) and
+
+- expires transient keys once the user is on another page than the one that
+  set them, or when they have not changed for TRANSIENT_TTL seconds,
+- records the session's key count (every rerun) and deep size (every
+  SIZE_SAMPLE_EVERY reruns) and warns when the key count keeps growing.
+
+server_sessions() measures every session of this server process for the
+diagnostics page.
+"""
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict, deque
+
+ENABLED = os.getenv('SESSION_INSPECTOR_ENABLED', '1') != '0'
+# Prefixes of per-row flags set by pages; safe to drop when no longer shown
+TRANSIENT_PREFIXES = (
+    'view_document_',
+    'view_doc_',
+    'view_tm_doc_',
+    'view_penalty_photo_',
+    'reassign_member_',
+    'show_payment_',
+)
+# Lifetime of an unchanged transient key, even on the page that set it
+TRANSIENT_TTL = int(os.getenv('SESSION_TRANSIENT_TTL', '3600'))
+# Deep size is measured on every n-th rerun of a session
+SIZE_SAMPLE_EVERY = 10
+# Samples kept per session and sessions tracked per process
+HISTORY_SIZE = 50
+MAX_TRACKED_SESSIONS = 1000
+# Warn when the key count rose by this much without ever shrinking
+GROWTH_WARN_KEYS = 50
+GROWTH_WINDOW = 10
+
+_REGISTRY_KEY = '_transient_keys'
+_PAGE_KEY = '_transient_page'
+
+_lock = threading.Lock()
+_history = OrderedDict()
+_warned = set()
+
+
+def deep_size(value):
+    """Deep memory footprint in bytes (pympler asizeof, vendored by Streamlit)"""
+    from streamlit.vendor.pympler.asizeof import asizeof
+    try:
+        return asizeof(value)
+    except Exception:
+        return 0
+
+
+def pickled_size(value):
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return None
+
+
+def is_transient(key):
+    return isinstance(key, str) and key.startswith(TRANSIENT_PREFIXES)
+
+
+def _marker(value):
+    """Cheap fingerprint telling whether a key was written since the last rerun"""
+    return repr(value)[:100]
+
+
+def expire_transient_keys(state, page, now=None):
+    """Drop transient keys set on another page or unchanged for TRANSIENT_TTL
+
+    The registry (key -> (page, last change, value marker)) lives in the
+    session itself. A key that is new or changed since the previous rerun
+    was just set by a click on the previous rerun's page and is kept.
+    Returns the expired keys.
+    """
+    now = now or time.time()
+    registry = state.get(_REGISTRY_KEY) or {}
+    previous_page = state.get(_PAGE_KEY, page)
+    expired = []
+    for key in [k for k in state.keys() if is_transient(k)]:
+        marker = _marker(state[key])
+        entry = registry.get(key)
+        if entry is None or len(entry) != 3 or entry[2] != marker:
+            registry[key] = (previous_page, now, marker)
+            continue
+        origin, last_changed, _ = entry
+        if origin != page or now - last_changed > TRANSIENT_TTL:
+            del state[key]
+            registry.pop(key, None)
+            expired.append(key)
+    for key in [k for k in registry if k not in state]:
+        registry.pop(key)
+    state[_REGISTRY_KEY] = registry
+    state[_PAGE_KEY] = page
+    return expired
+
+
+def _record(session_id, keys, size):
+    with _lock:
+        history = _history.get(session_id)
+        if history is None:
+            history = _history[session_id] = {'reruns': 0, 'samples': deque(maxlen=HISTORY_SIZE), 'bytes': None}
+            if len(_history) > MAX_TRACKED_SESSIONS:
+                _history.popitem(last=False)
+        _history.move_to_end(session_id)
+        history['reruns'] += 1
+        history['samples'].append((time.time(), keys))
+        if size is not None:
+            history['bytes'] = size
+        return list(history['samples']), history['reruns']
+
+
+def is_growing(samples):
+    """Key count rose by GROWTH_WARN_KEYS over the window without ever shrinking"""
+    counts = [keys for _, keys in samples[-GROWTH_WINDOW:]]
+    if len(counts) < GROWTH_WINDOW:
+        return False
+    never_shrinks = all(b >= a for a, b in zip(counts, counts[1:]))
+    return never_shrinks and counts[-1] - counts[0] >= GROWTH_WARN_KEYS
+
+
+def track_rerun():
+    """Expire transient keys and record this session's size (call once per rerun)"""
+    if not ENABLED:
+        return
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    page = ctx.pages_manager.current_page_script_hash
+    expire_transient_keys(st.session_state, page)
+
+    keys = len(st.session_state)
+    reruns = _history.get(ctx.session_id, {}).get('reruns', 0) + 1
+    size = deep_size(st.session_state.to_dict()) if reruns % SIZE_SAMPLE_EVERY == 1 else None
+    samples, _ = _record(ctx.session_id, keys, size)
+
+    if is_growing(samples) and ctx.session_id not in _warned:
+        _warned.add(ctx.session_id)
+        print(f"⚠️ Session {ctx.session_id} session_state keeps growing: "
+              f"{samples[-GROWTH_WINDOW][1]} -> {keys} keys")
+
+
+def key_sizes(state):
+    """Per-key deep and pickled sizes of a state dict, largest first"""
+    rows = [{
+        'key': key,
+        'type': type(value).__name__,
+        'bytes': deep_size(value),
+        'pickled': pickled_size(value),
+        'transient': is_transient(key)
+    } for key, value in state.items()]
+    rows.sort(key=lambda r: r['bytes'], reverse=True)
+    return rows
+
+
+def server_sessions():
+    """Size and growth of every session in this server process"""
+    from streamlit.runtime import Runtime
+    if not Runtime.exists():
+        return []
+    # Private Streamlit API; report nothing rather than fail if it changes
+    session_mgr = getattr(Runtime.instance(), '_session_mgr', None)
+    if session_mgr is None or not hasattr(session_mgr, 'list_sessions'):
+        return []
+
+    rows = []
+    for info in session_mgr.list_sessions():
+        try:
+            state = dict(info.session.session_state.filtered_state)
+        except Exception:
+            continue
+        with _lock:
+            history = _history.get(info.session.id)
+            samples = list(history['samples']) if history else []
+            reruns = history['reruns'] if history else info.script_run_count
+        rows.append({
+            'session_id': info.session.id,
+            'active': info.client is not None,
+            'keys': len(state),
+            'transient_keys': sum(1 for key in state if is_transient(key)),
+            'bytes': deep_size(state),
+            'reruns': reruns,
+            'growing': is_growing(samples),
+            'user_id': str(state.get('user_id') or ''),
+            'organization': state.get('organization_name') or ''
+        })
+    rows.sort(key=lambda r: r['bytes'], reverse=True)
+    return rows
+
+
+def server_totals(sessions):
+    return {
+        'sessions': len(sessions),
+        'active': sum(1 for s in sessions if s['active']),
+        'keys': sum(s['keys'] for s in sessions),
+        'bytes': sum(s['bytes'] for s in sessions),
+        'growing': sum(1 for s in sessions if s['growing'])
+    }
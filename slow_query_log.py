@@ -0,0 +1,293 @@
+"""
+Slow-query log with automatic plan capture
+
+Statements slower than SLOW_QUERY_MS are queued, and a background thread
+re-runs them with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and the same bound
+parameters on its own connection (outside the application pool) inside a
+rolled-back transaction. The plan, fingerprint, parameters and caller are
+stored in slow_query_plans.
+
+Only read statements (SELECT / WITH ... SELECT) are explained, since ANALYZE
+executes the statement. A fingerprint is explained at most once per
+SLOW_QUERY_COOLDOWN seconds and only a SLOW_QUERY_SAMPLE fraction of slow
+executions is considered, so a hot slow query does not double the load.
+
+    python slow_query_log.py list [--days 7]
+    python slow_query_log.py regressions [--ratio 1.5]
+    python slow_query_log.py show <id>
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import NullPool
+from query_metrics import background_thread_name, find_caller, fingerprint, normalize_statement
+
+ENABLED = os.getenv('SLOW_QUERY_LOG_ENABLED', '1') != '0'
+# Statements slower than this (milliseconds) are candidates for EXPLAIN
+THRESHOLD_MS = float(os.getenv('SLOW_QUERY_MS', '500'))
+# Fraction of slow executions that are explained
+SAMPLE_RATE = float(os.getenv('SLOW_QUERY_SAMPLE', '1.0'))
+# Minimum seconds between two plans of the same fingerprint
+COOLDOWN = int(os.getenv('SLOW_QUERY_COOLDOWN', '600'))
+# Upper bound for the EXPLAIN ANALYZE re-run itself
+EXPLAIN_TIMEOUT_MS = 30000
+# Pending captures; further slow queries are dropped while the worker is busy
+QUEUE_SIZE = 50
+# Parameter names whose values are never stored
+REDACTED_PARAMS = re.compile(r'password|token|secret', re.IGNORECASE)
+
+_READ_STATEMENT = re.compile(r'^\s*(select|with)\b', re.IGNORECASE)
+_WRITE_KEYWORD = re.compile(r'\b(insert|update|delete|merge|for\s+update|for\s+share)\b', re.IGNORECASE)
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_last_capture = {}
+_lock = threading.Lock()
+_installed = False
+
+
+def is_explainable(statement):
+    return bool(_READ_STATEMENT.match(statement)) and not _WRITE_KEYWORD.search(statement)
+
+
+def redact(parameters):
+    if isinstance(parameters, dict):
+        return {key: '***' if REDACTED_PARAMS.search(str(key)) else value
+                for key, value in parameters.items()}
+    return parameters
+
+
+def plan_shape(plan):
+    """Node types and relations of a plan, ignoring costs and timings"""
+    node = plan.get('Plan', plan)
+    parts = [node.get('Node Type', '')]
+    for key in ('Relation Name', 'Index Name', 'Join Type', 'Strategy'):
+        if key in node:
+            parts.append(f"{key}={node[key]}")
+    children = [plan_shape(child) for child in node.get('Plans', [])]
+    return '(' + ' '.join(parts + children) + ')'
+
+
+def _should_capture(key):
+    if random.random() >= SAMPLE_RATE:
+        return False
+    now = time.time()
+    with _lock:
+        if now - _last_capture.get(key, 0) < COOLDOWN:
+            return False
+        _last_capture[key] = now
+        return True
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('slow_query_start')
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    if elapsed_ms < THRESHOLD_MS or executemany or not is_explainable(statement):
+        return
+    normalized = normalize_statement(statement)
+    key = fingerprint(normalized)
+    if not _should_capture(key):
+        return
+    page, function = find_caller()
+    try:
+        _queue.put_nowait({
+            'fingerprint': key,
+            'statement': statement,
+            'normalized': normalized,
+            'parameters': parameters,
+            'elapsed_ms': elapsed_ms,
+            'page': page,
+            'function': function
+        })
+    except queue.Full:
+        pass
+
+
+def _handle_error(context):
+    if context.connection is not None:
+        starts = context.connection.info.get('slow_query_start')
+        if starts:
+            starts.pop()
+
+
+def capture_plan(explain_engine, item):
+    """EXPLAIN ANALYZE one slow statement and store the plan"""
+    with explain_engine.connect() as conn:
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+        result = conn.exec_driver_sql(
+            "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + item['statement'],
+            item['parameters'] or None
+        )
+        plan = result.scalar()
+        conn.rollback()
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        plan = plan[0]
+        conn.execute(text("""
+            INSERT INTO slow_query_plans (
+                fingerprint, statement, parameters, page, function,
+                elapsed_ms, execution_ms, plan_shape, plan
+            ) VALUES (
+                :fingerprint, :statement, CAST(:parameters AS jsonb), :page, :function,
+                :elapsed_ms, :execution_ms, :plan_shape, CAST(:plan AS jsonb)
+            )
+        """), {
+            'fingerprint': item['fingerprint'],
+            'statement': item['normalized'],
+            'parameters': json.dumps(redact(item['parameters']), default=str, ensure_ascii=False),
+            'page': item['page'],
+            'function': item['function'],
+            'elapsed_ms': item['elapsed_ms'],
+            'execution_ms': plan.get('Execution Time'),
+            'plan_shape': plan_shape(plan),
+            'plan': json.dumps(plan)
+        })
+        conn.commit()
+
+
+def _worker(explain_engine):
+    while True:
+        item = _queue.get()
+        try:
+            capture_plan(explain_engine, item)
+        except Exception as e:
+            print(f"⚠️ Could not capture plan for {item['fingerprint']}: {e}")
+
+
+def install(engine):
+    """Attach the slow-query listeners to an engine and start the EXPLAIN worker"""
+    global _installed
+    if not ENABLED or _installed:
+        return
+    _installed = True
+    # Own connections, so EXPLAIN never waits on or is counted in the app pool
+    explain_engine = create_engine(engine.url, poolclass=NullPool)
+    threading.Thread(target=_worker, args=(explain_engine,), name=background_thread_name("slow-query-explain"), daemon=True).start()
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+# --- CLI ---------------------------------------------------------------------
+
+def list_slow_queries(days):
+    from database import execute_query
+    return execute_query("""
+        SELECT fingerprint, COUNT(*), MAX(captured_at), MAX(elapsed_ms),
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY execution_ms),
+               MIN(page || ':' || function), MIN(statement)
+        FROM slow_query_plans
+        WHERE captured_at >= CURRENT_TIMESTAMP - make_interval(days => :days)
+        GROUP BY fingerprint
+        ORDER BY MAX(elapsed_ms) DESC
+    """, {'days': days}) or []
+
+
+def find_regressions(ratio, days):
+    """Fingerprints whose latest plan is slower than the earlier median or changed shape"""
+    from database import execute_query
+    rows = execute_query("""
+        SELECT latest.id, latest.fingerprint, latest.captured_at, latest.execution_ms,
+               history.median_ms, NOT (latest.plan_shape = ANY(history.shapes)), latest.statement
+        FROM (
+            SELECT DISTINCT ON (fingerprint) id, fingerprint, captured_at, execution_ms, plan_shape, statement
+            FROM slow_query_plans
+            WHERE captured_at >= CURRENT_TIMESTAMP - make_interval(days => :days)
+            ORDER BY fingerprint, captured_at DESC
+        ) latest
+        JOIN LATERAL (
+            SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY earlier.execution_ms) AS median_ms,
+                   array_agg(DISTINCT earlier.plan_shape) AS shapes
+            FROM slow_query_plans earlier
+            WHERE earlier.fingerprint = latest.fingerprint
+              AND earlier.id <> latest.id
+              AND earlier.captured_at >= CURRENT_TIMESTAMP - make_interval(days => :days)
+            HAVING COUNT(*) > 0
+        ) history ON TRUE
+        WHERE latest.execution_ms > history.median_ms * :ratio
+           OR NOT (latest.plan_shape = ANY(history.shapes))
+        ORDER BY latest.execution_ms / NULLIF(history.median_ms, 0) DESC NULLS LAST
+    """, {'days': days, 'ratio': ratio})
+    return rows or []
+
+
+def format_plan(node, depth=0):
+    """Indented text rendering of a JSON plan node"""
+    node = node.get('Plan', node)
+    label = node.get('Node Type', '?')
+    if 'Relation Name' in node:
+        label += f" on {node['Relation Name']}"
+    if 'Index Name' in node:
+        label += f" using {node['Index Name']}"
+    details = f"rows={node.get('Actual Rows')} time={node.get('Actual Total Time')} ms"
+    buffers = node.get('Shared Hit Blocks'), node.get('Shared Read Blocks')
+    if buffers[0] is not None:
+        details += f" buffers hit={buffers[0]} read={buffers[1]}"
+    lines = ["  " * depth + f"-> {label} ({details})"]
+    for child in node.get('Plans', []):
+        lines.extend(format_plan(child, depth + 1))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect captured slow-query plans")
+    commands = parser.add_subparsers(dest='command', required=True)
+    list_parser = commands.add_parser('list', help="slow fingerprints with captured plans")
+    list_parser.add_argument('--days', type=int, default=7)
+    regressions_parser = commands.add_parser('regressions', help="fingerprints whose latest plan got slower or changed")
+    regressions_parser.add_argument('--ratio', type=float, default=1.5)
+    regressions_parser.add_argument('--days', type=int, default=30)
+    show_parser = commands.add_parser('show', help="print one captured plan")
+    show_parser.add_argument('id', type=int)
+    options = parser.parse_args(argv)
+
+    if options.command == 'list':
+        for key, captures, last, worst, median, caller, statement in list_slow_queries(options.days):
+            print(f"{key}  {captures}× worst {worst:.0f} ms, plan median {median or 0:.0f} ms, "
+                  f"last {last:%d.%m.%Y %H:%M}  {caller}")
+            print(f"    {statement[:160]}")
+        return 0
+
+    if options.command == 'regressions':
+        rows = find_regressions(options.ratio, options.days)
+        for plan_id, key, captured_at, execution_ms, median_ms, shape_changed, statement in rows:
+            reason = "plan changed" if shape_changed or not median_ms else f"{execution_ms / median_ms:.1f}× slower"
+            print(f"❌ #{plan_id} {key}: {execution_ms:.0f} ms vs median {median_ms:.0f} ms ({reason}), "
+                  f"{captured_at:%d.%m.%Y %H:%M}")
+            print(f"    {statement[:160]}")
+        if not rows:
+            print("✅ No plan regressions")
+        return 1 if rows else 0
+
+    from database import execute_query
+    result = execute_query("""
+        SELECT fingerprint, captured_at, page, function, elapsed_ms, parameters, statement, plan
+        FROM slow_query_plans WHERE id = :id
+    """, {'id': options.id})
+    if not result:
+        print(f"No captured plan #{options.id}")
+        return 1
+    key, captured_at, page, function, elapsed_ms, parameters, statement, plan = result[0]
+    print(f"{key} at {captured_at:%d.%m.%Y %H:%M:%S} from {page}:{function}, {elapsed_ms:.0f} ms")
+    print(statement)
+    print(f"Parameters: {json.dumps(parameters, ensure_ascii=False)}")
+    print(f"Planning {plan.get('Planning Time')} ms, execution {plan.get('Execution Time')} ms")
+    print("\n".join(format_plan(plan)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
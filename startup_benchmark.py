@@ -0,0 +1,192 @@
+"""
+Cold-start benchmark for the Streamlit entry points
+
+For Home.py and every page, the script's top-level imports are executed in a
+fresh interpreter with `python -X importtime`. The report shows the import
+time, the slowest modules, and heavy libraries (pandas, plotly, numpy, PIL,
+pdf2image, telegram) that were imported eagerly although they are meant to
+load through lazy_imports. Modules that `import streamlit` loads by itself
+are not counted against a page.
+
+With --server, a Streamlit server is started, and the benchmark times how
+long it takes until it accepts connections and until the first page load
+(the login page, as the first visitor after a deploy sees it) is rendered.
+
+    python startup_benchmark.py [--server] [--json report.json]
+
+Exits with status 1 when a target is missed or a heavy module is imported
+eagerly.
+"""
+import argparse
+import ast
+import asyncio
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from benchmark import is_lazy_import
+from load_test import StreamlitSession
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Top-level import time of one entry point
+IMPORT_TARGET_MS = 1500
+# Server start until the first page is rendered
+COLD_START_TARGET_MS = 6000
+# Must only be imported by the code paths that use them
+HEAVY_MODULES = ('pandas', 'plotly', 'numpy', 'PIL', 'pdf2image', 'telegram')
+
+
+def entry_points():
+    return [os.path.join(ROOT, 'Home.py')] + sorted(glob.glob(os.path.join(ROOT, 'pages', '*.py')))
+
+
+def import_block(path):
+    """Source of a script's top-level imports and lazy_module assignments"""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    nodes = [node for node in tree.body
+             if isinstance(node, (ast.Import, ast.ImportFrom)) or is_lazy_import(node)]
+    return ast.unparse(ast.Module(body=nodes, type_ignores=[]))
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(parts[0]), int(parts[1]), depth))
+    return modules
+
+
+def run_importtime(source):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', source],
+        cwd=ROOT, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    )
+    return result, parse_importtime(result.stderr), (time.perf_counter() - started) * 1000
+
+
+def streamlit_modules():
+    """Modules Streamlit imports by itself (part of its own plotly/PIL support)"""
+    _, modules, _ = run_importtime('import streamlit')
+    return {name for name, _, _, _ in modules}
+
+
+def profile_imports(path, baseline=frozenset()):
+    """Import one entry point's top-level imports in a fresh interpreter"""
+    result, modules, wall_ms = run_importtime(import_block(path))
+    top_level = [m for m in modules if m[3] == 0]
+    eager = sorted({name.split('.')[0] for name, _, _, _ in modules
+                    if name.split('.')[0] in HEAVY_MODULES and name not in baseline})
+    return {
+        'entry_point': os.path.relpath(path, ROOT),
+        'import_ms': round(sum(m[1] for m in modules) / 1000, 1),
+        'wall_ms': round(wall_ms, 1),
+        'slowest': [{'module': name, 'cumulative_ms': round(cumulative / 1000, 1)}
+                    for name, _, cumulative, _ in sorted(top_level, key=lambda m: m[2], reverse=True)[:8]],
+        'eager_heavy_modules': eager,
+        'error': result.stderr.strip().splitlines()[-1] if result.returncode else None
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+async def first_page_load(port, started, timeout=60):
+    """Seconds from server spawn until it accepts a session and until Home is rendered"""
+    session = StreamlitSession(f"http://localhost:{port}")
+    while True:
+        try:
+            await session.connect()
+            break
+        except OSError:
+            if time.perf_counter() - started > timeout:
+                raise
+            await asyncio.sleep(0.05)
+    ready = time.perf_counter() - started
+    try:
+        await session.rerun()
+    finally:
+        session.close()
+    return ready, time.perf_counter() - started
+
+
+def measure_cold_start():
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', 'Home.py', '--server.port', str(port),
+         '--server.headless', 'true'],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        ready, first_page = asyncio.run(first_page_load(port, started))
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'server_ready_ms': round(ready * 1000, 1),
+        'first_page_ms': round(first_page * 1000, 1),
+        'first_rerun_ms': round((first_page - ready) * 1000, 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time and cold start of the Streamlit entry points")
+    parser.add_argument('--page', help="only entry points whose file name contains this text")
+    parser.add_argument('--server', action='store_true', help="also time a real server's first page load")
+    parser.add_argument('--import-target', type=float, default=IMPORT_TARGET_MS)
+    parser.add_argument('--cold-start-target', type=float, default=COLD_START_TARGET_MS)
+    parser.add_argument('--json', help="also write the report to this file")
+    options = parser.parse_args(argv)
+
+    failed = False
+    report = {'entry_points': []}
+    baseline = streamlit_modules()
+    for path in entry_points():
+        if options.page and options.page not in os.path.basename(path):
+            continue
+        result = profile_imports(path, baseline)
+        report['entry_points'].append(result)
+        over = result['import_ms'] > options.import_target
+        mark = '❌' if over or result['eager_heavy_modules'] or result['error'] else '✅'
+        failed = failed or mark == '❌'
+        print(f"{mark} {result['entry_point']}: imports {result['import_ms']:.0f} ms "
+              f"(interpreter {result['wall_ms']:.0f} ms, target {options.import_target:.0f} ms)")
+        if result['eager_heavy_modules']:
+            print(f"     eager heavy imports: {', '.join(result['eager_heavy_modules'])}")
+        if result['error']:
+            print(f"     error: {result['error']}")
+        for module in result['slowest'][:5]:
+            print(f"     {module['cumulative_ms']:>8.1f} ms  {module['module']}")
+
+    if options.server:
+        cold_start = measure_cold_start()
+        report['cold_start'] = cold_start
+        over = cold_start['first_page_ms'] > options.cold_start_target
+        failed = failed or over
+        print(f"{'❌' if over else '✅'} Cold start: server ready {cold_start['server_ready_ms']:.0f} ms, "
+              f"first page {cold_start['first_page_ms']:.0f} ms "
+              f"(first rerun {cold_start['first_rerun_ms']:.0f} ms, target {options.cold_start_target:.0f} ms)")
+
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
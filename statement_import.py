@@ -0,0 +1,287 @@
+"""
+Fuel-card / bank statement import into car_expenses
+
+Statements are read in chunks (CSV via pandas, CAMT.053 XML via iterparse),
+each line is matched to a vehicle through in-memory hash indexes of the
+organization's plates and fuel card numbers, and lines already booked are
+skipped by their (vehicle, date, amount) fingerprint. New lines are COPY'd
+into car_expenses in one transaction.
+
+Several identical lines on one day are legitimate (two refuels of the same
+amount), so the fingerprint comparison counts: only as many lines are
+skipped as car_expenses already holds for that fingerprint.
+"""
+import csv
+import io
+import re
+import uuid
+import xml.etree.ElementTree as ElementTree
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import text
+from database import engine, execute_query
+from lazy_imports import lazy_module
+from vehicle_import import parse_dates
+pd = lazy_module('pandas')
+
+# Statement lines parsed per chunk
+CHUNK_ROWS = 5000
+# Header names used by card providers and banks, per field
+COLUMN_ALIASES = {
+    'date': ['date', 'datum', 'transaction_date', 'transaktionsdatum', 'buchungsdatum', 'belegdatum', 'дата'],
+    'amount': ['amount', 'betrag', 'bruttobetrag', 'gesamtbetrag', 'total', 'sum', 'сумма'],
+    'plate': ['license_plate', 'kennzeichen', 'kfz-kennzeichen', 'plate', 'гос. номер', 'номер'],
+    'card': ['card', 'card_number', 'kartennummer', 'karte', 'karten-nr', 'pan', 'номер карты'],
+    'description': ['description', 'merchant', 'station', 'tankstelle', 'akzeptanzstelle', 'verwendungszweck', 'описание'],
+    'product': ['product', 'produkt', 'warenart', 'category', 'kategorie'],
+    'liters': ['liters', 'liter', 'menge', 'quantity', 'литры'],
+}
+# Product keywords -> car_expenses category; anything else is 'other'
+CATEGORY_KEYWORDS = [
+    ('fuel', ('diesel', 'benzin', 'super', 'e10', 'adblue', 'fuel', 'kraftstoff', 'lpg', 'топливо')),
+    ('toll', ('maut', 'toll', 'vignette', 'péage')),
+    ('car_wash', ('wäsche', 'wasch', 'wash', 'мойка')),
+]
+
+CAMT_DEBIT = 'DBIT'
+# Fewer digits than this (or a mask character) means the statement only shows
+# part of the card number
+FULL_CARD_DIGITS = 12
+
+
+def plate_key(plate):
+    return re.sub(r'[^0-9A-ZА-Я]', '', str(plate or '').upper())
+
+
+def card_key(card):
+    return re.sub(r'\D', '', str(card or ''))
+
+
+def is_masked_card(card):
+    """True for partial card numbers such as 4111********1234 or '1234'"""
+    raw = str(card or '')
+    return bool(re.search(r'[*Xx•]', raw)) or len(card_key(raw)) < FULL_CARD_DIGITS
+
+
+def parse_amount(value):
+    """Parse '1.234,56', '1234.56' or '-45,00' as a positive Decimal (None if invalid)"""
+    raw = str(value or '').strip().replace('€', '').replace(' ', '')
+    if ',' in raw and '.' in raw:
+        raw = raw.replace('.', '').replace(',', '.') if raw.rfind(',') > raw.rfind('.') else raw.replace(',', '')
+    else:
+        raw = raw.replace(',', '.')
+    try:
+        amount = abs(Decimal(raw))
+    except InvalidOperation:
+        return None
+    return amount.quantize(Decimal('0.01')) if amount else None
+
+
+def classify(product, description):
+    words = f"{product or ''} {description or ''}".lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(keyword in words for keyword in keywords):
+            return category
+    return 'other'
+
+
+class VehicleIndex:
+    """Hash indexes of an organization's vehicles by plate and fuel card"""
+
+    def __init__(self, organization_id):
+        vehicles = execute_query("""
+            SELECT id, name, license_plate, fuel_card_number
+            FROM vehicles
+            WHERE organization_id = :org_id
+        """, {'org_id': organization_id}) or []
+        self.names = {str(v[0]): f"{v[1]} ({v[2]})" for v in vehicles}
+        self.by_plate = {plate_key(v[2]): str(v[0]) for v in vehicles if v[2]}
+        self.by_card = {card_key(v[3]): str(v[0]) for v in vehicles if card_key(v[3])}
+        # Masked card numbers (4111********1234) only show the last digits
+        suffixes = Counter(card[-4:] for card in self.by_card)
+        self.by_card_suffix = {card[-4:]: vehicle_id for card, vehicle_id in self.by_card.items()
+                               if suffixes[card[-4:]] == 1}
+
+    def match(self, plate, card, description=''):
+        """Vehicle id for a statement line, by card, plate, or a plate inside the text"""
+        masked = is_masked_card(card)
+        card = card_key(card)
+        if card:
+            # A full number not on file is another card, even if its last digits match
+            vehicle_id = self.by_card.get(card) or (self.by_card_suffix.get(card[-4:]) if masked else None)
+            if vehicle_id:
+                return vehicle_id
+        vehicle_id = self.by_plate.get(plate_key(plate))
+        if vehicle_id or not description:
+            return vehicle_id
+        for token in re.findall(r'[A-ZÄÖÜА-Я]{1,3}[\s\-]?[A-Z]{1,2}[\s\-]?\d{1,4}[EH]?', str(description).upper()):
+            vehicle_id = self.by_plate.get(plate_key(token))
+            if vehicle_id:
+                return vehicle_id
+        return None
+
+
+def _find_columns(columns):
+    lowered = {str(c).strip().lower(): c for c in columns}
+    return {field: next((lowered[a] for a in aliases if a in lowered), None)
+            for field, aliases in COLUMN_ALIASES.items()}
+
+
+def read_csv_lines(source):
+    """Yield raw lines (dicts) of a CSV statement chunk by chunk"""
+    reader = pd.read_csv(source, dtype=str, keep_default_na=False, sep=None, engine='python',
+                         chunksize=CHUNK_ROWS)
+    line = 1
+    for chunk in reader:
+        columns = _find_columns(chunk.columns)
+        if columns['date'] is None or columns['amount'] is None:
+            raise ValueError("Нет колонок даты и суммы / Date and amount columns not found")
+        dates = parse_dates(chunk[columns['date']].str.strip())
+        for position, (_, row) in enumerate(chunk.iterrows()):
+            line += 1
+            yield {
+                'line': line,
+                'date': dates.iloc[position],
+                'amount': parse_amount(row[columns['amount']]),
+                **{field: row[column] if column else '' for field, column in columns.items()
+                   if field not in ('date', 'amount')}
+            }
+
+
+def read_camt_lines(source):
+    """Yield debit entries of a CAMT.053/054 statement without loading the whole XML"""
+    line = 0
+    for _, element in ElementTree.iterparse(source, events=('end',)):
+        if not element.tag.endswith('}Ntry') and element.tag != 'Ntry':
+            continue
+        line += 1
+
+        def find(path):
+            found = element.find('.//' + '/'.join(f"{{*}}{part}" for part in path.split('/')))
+            return found.text.strip() if found is not None and found.text else ''
+
+        if find('CdtDbtInd') == CAMT_DEBIT:
+            booked = find('BookgDt/Dt') or find('ValDt/Dt') or find('BookgDt/DtTm')[:10]
+            description = ' '.join(filter(None, [find('AddtlNtryInf'), find('RmtInf/Ustrd')]))
+            yield {
+                'line': line,
+                'date': parse_dates(pd.Series([booked])).iloc[0],
+                'amount': parse_amount(find('Amt')),
+                'plate': '',
+                'card': find('CardTx/Card/PlainCardData/Pan') or find('Card/PlainCardData/Pan'),
+                'description': description,
+                'product': '',
+                'liters': ''
+            }
+        element.clear()
+
+
+def read_statement(uploaded_file):
+    name = getattr(uploaded_file, 'name', str(uploaded_file)).lower()
+    return read_camt_lines(uploaded_file) if name.endswith('.xml') else read_csv_lines(uploaded_file)
+
+
+def match_lines(lines, index):
+    """Attach vehicle, category and status to parsed lines"""
+    matched = []
+    for line in lines:
+        line['vehicle_id'] = None
+        line['category'] = classify(line.get('product'), line.get('description'))
+        line['liters'] = parse_amount(line.get('liters'))
+        if pd.isna(line['date']) or line['amount'] is None:
+            line['result'], line['message'] = 'error', "неверная дата или сумма / invalid date or amount"
+        else:
+            line['date'] = line['date'].date()
+            line['vehicle_id'] = index.match(line.get('plate'), line.get('card'), line.get('description'))
+            line['vehicle_name'] = index.names.get(line['vehicle_id'], '')
+            if line['vehicle_id']:
+                line['result'], line['message'] = 'new', ''
+            else:
+                line['result'], line['message'] = 'unmatched', "автомобиль не найден / no vehicle for plate or card"
+        matched.append(line)
+    return matched
+
+
+def _existing_fingerprints(conn, organization_id, lines):
+    dates = [line['date'] for line in lines]
+    rows = conn.execute(text("""
+        SELECT vehicle_id, date, amount, COUNT(*)
+        FROM car_expenses
+        WHERE organization_id = :org_id
+          AND vehicle_id = ANY(CAST(:vehicle_ids AS uuid[]))
+          AND date BETWEEN :first AND :last
+        GROUP BY vehicle_id, date, amount
+    """), {
+        'org_id': organization_id,
+        'vehicle_ids': sorted({line['vehicle_id'] for line in lines}),
+        'first': min(dates),
+        'last': max(dates)
+    }).fetchall()
+    return Counter({(str(vehicle_id), day, Decimal(amount)): count for vehicle_id, day, amount, count in rows})
+
+
+def _mark_duplicates(lines, existing):
+    """Mark as many lines per fingerprint as are already booked; returns the new lines"""
+    seen = Counter()
+    new_lines = []
+    for line in lines:
+        fingerprint = (line['vehicle_id'], line['date'], line['amount'])
+        seen[fingerprint] += 1
+        if seen[fingerprint] <= existing[fingerprint]:
+            line['result'], line['message'] = 'duplicate', "уже внесено / already booked"
+        else:
+            new_lines.append(line)
+    return new_lines
+
+
+def import_statement(uploaded_file, organization_id, dry_run=False):
+    """Parse, match, dedup and (unless dry_run) insert a statement
+
+    Returns (report DataFrame, inserted lines).
+    """
+    lines = match_lines(read_statement(uploaded_file), VehicleIndex(organization_id))
+    candidates = [line for line in lines if line['result'] == 'new']
+    inserted = []
+
+    if candidates:
+        with engine.begin() as conn:
+            # Serialize imports per tenant so two uploads of one statement cannot both insert
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:org_id))"), {'org_id': str(organization_id)})
+            new_lines = _mark_duplicates(candidates, _existing_fingerprints(conn, organization_id, candidates))
+            if not dry_run and new_lines:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for line in new_lines:
+                    card = card_key(line.get('card'))
+                    description = ' '.join(filter(None, [line.get('description'), card and f"card …{card[-4:]}"]))
+                    writer.writerow([uuid.uuid4(), organization_id, line['vehicle_id'], line['date'], line['amount'],
+                                     line['category'], description[:500], line['liters'] or ''])
+                buffer.seek(0)
+                with conn.connection.dbapi_connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        "COPY car_expenses (id, organization_id, vehicle_id, date, amount, category, description, liters) "
+                        "FROM STDIN WITH (FORMAT csv)", buffer
+                    )
+                for line in new_lines:
+                    line['result'] = 'inserted'
+                inserted = new_lines
+
+    report = pd.DataFrame([{
+        'line': line['line'],
+        'date': line['date'],
+        'amount': float(line['amount']) if line['amount'] is not None else None,
+        'plate': line.get('plate') or '',
+        'card': line.get('card') or '',
+        'vehicle': line.get('vehicle_name', ''),
+        'category': line['category'],
+        'result': line['result'],
+        'message': line['message']
+    } for line in lines])
+    return report, inserted
+
+
+def assign_card(vehicle_id, card_number):
+    """Store a fuel card number on a vehicle so future statements match it"""
+    return execute_query("""
+        UPDATE vehicles SET fuel_card_number = :card WHERE id = :vehicle_id
+    """, {'card': card_key(card_number), 'vehicle_id': vehicle_id})
@@ -0,0 +1,378 @@
+"""
+Deterministic synthetic fleet data for benchmarking
+
+Generates tenants with vehicles, teams, users, years of car expenses,
+penalties, material assignments and documents with expiry dates, and
+bulk-loads them with COPY. The same seed and sizes always produce the same
+rows (including ids), so benchmark runs are comparable.
+
+Example (about 10M rows):
+    python synthetic_data.py --tenants 10 --vehicles 2500 --years 3 --expenses-per-month 10
+
+Only use against a dedicated benchmark database.
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import time
+import uuid
+from datetime import date, timedelta
+from sqlalchemy import text
+from database import engine, init_db
+from auth import hash_password
+from utils import get_document_types
+from partitions import PARTITIONED_TABLES, ensure_partitions, is_partitioned
+
+# Rows buffered per COPY round trip
+COPY_CHUNK = 100_000
+# Distinct placeholder files referenced by generated documents and receipts
+PLACEHOLDER_FILES = 50
+SYNTHETIC_PASSWORD = 'synthetic'
+
+# Columns the pages read and write on top of the init_db schema
+APP_COLUMNS = [
+    "ALTER TABLE vehicles ADD COLUMN IF NOT EXISTS model TEXT",
+    "ALTER TABLE vehicles ADD COLUMN IF NOT EXISTS year INTEGER",
+    "ALTER TABLE vehicles ADD COLUMN IF NOT EXISTS is_rental BOOLEAN DEFAULT FALSE",
+    "ALTER TABLE vehicles ADD COLUMN IF NOT EXISTS rental_start_date DATE",
+    "ALTER TABLE vehicles ADD COLUMN IF NOT EXISTS rental_end_date DATE",
+    "ALTER TABLE vehicles ADD COLUMN IF NOT EXISTS rental_monthly_price NUMERIC(10,2)",
+    "ALTER TABLE materials ADD COLUMN IF NOT EXISTS unit TEXT",
+    "ALTER TABLE vehicle_documents ADD COLUMN IF NOT EXISTS title TEXT",
+    "ALTER TABLE vehicle_documents ADD COLUMN IF NOT EXISTS date_issued DATE",
+    "ALTER TABLE vehicle_documents ADD COLUMN IF NOT EXISTS date_expiry DATE",
+    "ALTER TABLE vehicle_documents ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE",
+    "ALTER TABLE user_documents ADD COLUMN IF NOT EXISTS title TEXT",
+    "ALTER TABLE user_documents ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE",
+]
+
+MODELS = ['Mercedes-Benz Sprinter', 'Ford Transit', 'Renault Trafic', 'VW Crafter',
+          'VW Transporter', 'Opel Vivaro', 'Fiat Ducato', 'Iveco Daily', 'Citroen Jumper']
+CITY_CODES = ['B', 'HH', 'M', 'K', 'F', 'S', 'D', 'L', 'H', 'P']
+FIRST_NAMES = ['Alexander', 'Maria', 'Dmitri', 'Anna', 'Sergei', 'Olga', 'Thomas', 'Julia',
+               'Andrei', 'Elena', 'Michael', 'Natalia', 'Igor', 'Katharina', 'Pavel', 'Sabine']
+LAST_NAMES = ['Müller', 'Schmidt', 'Ivanov', 'Petrov', 'Schneider', 'Fischer', 'Smirnov',
+              'Weber', 'Kuznetsov', 'Wagner', 'Popov', 'Becker', 'Volkov', 'Hoffmann']
+EXPENSE_CATEGORIES = [('fuel', 60), ('repair', 10), ('maintenance', 12), ('insurance', 5), ('other', 13)]
+EXPENSE_AMOUNTS = {'fuel': (40, 160), 'repair': (150, 2500), 'maintenance': (80, 600),
+                   'insurance': (90, 400), 'other': (10, 200)}
+MATERIALS = [('Перфоратор Bosch', 'equipment', 'шт', 450), ('Лестница 3м', 'equipment', 'шт', 180),
+             ('Генератор', 'equipment', 'шт', 900), ('Сварочный аппарат', 'equipment', 'шт', 650),
+             ('Кабель NYM 3x1.5', 'material', 'м', 1.2), ('Дюбели 8мм', 'material', 'уп', 6.5),
+             ('Гипсокартон', 'material', 'лист', 9.8), ('Краска белая 10л', 'material', 'шт', 45)]
+USER_DOCUMENT_TYPES = ['passport', 'driving_license', 'medical_certificate', 'work_permit', 'visa', 'insurance']
+
+
+def make_uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def random_date(rng, first, last):
+    return first + timedelta(days=rng.randint(0, max((last - first).days, 0)))
+
+
+class CopyLoader:
+    """Buffers rows per table and flushes them with COPY ... FROM STDIN"""
+
+    def __init__(self, raw_connection):
+        self.connection = raw_connection
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, table, columns, row):
+        buffer = self.buffers.get(table)
+        if buffer is None:
+            buffer = self.buffers[table] = (columns, io.StringIO(), [0])
+        csv.writer(buffer[1]).writerow(row)
+        buffer[2][0] += 1
+        if buffer[2][0] >= COPY_CHUNK:
+            self.flush(table)
+
+    def flush(self, table=None):
+        """Flush one table (and every table buffered before it, for foreign keys) or all"""
+        names = list(self.buffers)
+        if table:
+            names = names[:names.index(table) + 1]
+        for name in names:
+            columns, data, pending = self.buffers[name]
+            if not pending[0]:
+                continue
+            data.seek(0)
+            with self.connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", data
+                )
+            self.counts[name] = self.counts.get(name, 0) + pending[0]
+            self.buffers[name] = (columns, io.StringIO(), [0])
+
+
+def write_placeholder_files(root='uploads'):
+    """Create a small pool of placeholder upload files; returns their urls by kind"""
+    files = {}
+    for kind, extension in (('documents', 'pdf'), ('user_documents', 'pdf'),
+                            ('car_expenses', 'png'), ('penalties', 'png')):
+        directory = os.path.join(root, kind)
+        os.makedirs(directory, exist_ok=True)
+        files[kind] = []
+        for i in range(PLACEHOLDER_FILES):
+            path = os.path.join(directory, f"synthetic-{i:03d}.{extension}")
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(b'%PDF-1.4\n% synthetic placeholder\n' if extension == 'pdf'
+                            else b'\x89PNG\r\n\x1a\n')
+            files[kind].append(path)
+    return files
+
+
+def history_start(options):
+    """First day of the generated history"""
+    return options.today.replace(day=1) - timedelta(days=365 * options.years)
+
+
+def generate_tenant(loader, index, options, files):
+    """Generate all rows of one tenant; returns its organization id"""
+    rng = random.Random(f"{options.seed}:{index}")
+    today = options.today
+    first_day = history_start(options)
+    org_id = make_uuid(rng)
+
+    loader.add('organizations', ['id', 'name', 'created_at', 'subscription_status'],
+               [org_id, f"Synthetic Fleet {index + 1:03d}", first_day, 'active'])
+
+    # Teams (leads are set after users exist)
+    teams = [make_uuid(rng) for _ in range(options.teams)]
+    for n, team_id in enumerate(teams):
+        loader.add('teams', ['id', 'organization_id', 'name', 'created_at'],
+                   [team_id, org_id, f"Бригада {n + 1}", first_day])
+
+    # Users: one owner, a few admins/managers, a lead per team, workers
+    password_hash = hash_password(SYNTHETIC_PASSWORD)
+    users = []
+    for n in range(options.users):
+        user_id = make_uuid(rng)
+        if n == 0:
+            role, team_id = 'owner', None
+        elif n < 3:
+            role, team_id = 'admin', None
+        elif n < 3 + len(teams):
+            role, team_id = 'team_lead', teams[n - 3]
+        elif n % 10 == 0:
+            role, team_id = 'manager', None
+        else:
+            role, team_id = 'worker', rng.choice(teams)
+        users.append((user_id, team_id))
+        loader.add('users', ['id', 'organization_id', 'email', 'password_hash', 'first_name',
+                             'last_name', 'phone', 'role', 'team_id', 'created_at'],
+                   [user_id, org_id, f"user{n + 1}@tenant{index + 1}.synthetic.test", password_hash,
+                    rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                    f"+49 15{rng.randint(10000000, 99999999)}", role, team_id, first_day])
+    workers_by_team = {}
+    for user_id, team_id in users:
+        if team_id:
+            workers_by_team.setdefault(team_id, []).append(user_id)
+
+    # Vehicles with team assignments
+    vehicles = []
+    plates = set()
+    for n in range(options.vehicles):
+        vehicle_id = make_uuid(rng)
+        plate = None
+        while plate is None or plate in plates:
+            plate = f"{rng.choice(CITY_CODES)}-{chr(65 + rng.randint(0, 25))}{chr(65 + rng.randint(0, 25))} {rng.randint(1, 9999)}"
+        plates.add(plate)
+        is_rental = rng.random() < 0.15
+        rental_start = random_date(rng, first_day, today) if is_rental else None
+        team_id = rng.choice(teams)
+        vehicles.append((vehicle_id, team_id))
+        loader.add('vehicles', ['id', 'organization_id', 'name', 'license_plate', 'vin', 'status',
+                                'model', 'year', 'is_rental', 'rental_start_date', 'rental_end_date',
+                                'rental_monthly_price', 'annual_tax_amount', 'created_at'],
+                   [vehicle_id, org_id, str(n + 1), plate,
+                    f"WDB{n:06d}{index:03d}{rng.randint(10000, 99999)}",
+                    rng.choices(['active', 'repair', 'unavailable'], [85, 10, 5])[0],
+                    rng.choice(MODELS), rng.randint(2010, 2024), is_rental, rental_start,
+                    rental_start + timedelta(days=rng.randint(90, 730)) if is_rental else None,
+                    round(rng.uniform(600, 1500), 2) if is_rental else None,
+                    round(rng.uniform(150, 600), 2), first_day])
+        loader.add('vehicle_assignments', ['id', 'vehicle_id', 'team_id', 'start_date'],
+                   [make_uuid(rng), vehicle_id, team_id, first_day])
+
+    # Car expenses: fuel refuels carry liters and a rising odometer
+    categories = [c for c, _ in EXPENSE_CATEGORIES]
+    weights = [w for _, w in EXPENSE_CATEGORIES]
+    months = options.years * 12
+    expense_columns = ['id', 'organization_id', 'vehicle_id', 'date', 'amount', 'category',
+                       'description', 'receipt_url', 'liters', 'odometer_reading']
+    for vehicle_id, _ in vehicles:
+        odometer = rng.randint(20000, 150000)
+        count = months * options.expenses_per_month
+        dates = sorted(random_date(rng, first_day, today) for _ in range(count))
+        for day in dates:
+            category = rng.choices(categories, weights)[0]
+            low, high = EXPENSE_AMOUNTS[category]
+            liters = odometer_reading = None
+            if category == 'fuel':
+                odometer += rng.randint(250, 700)
+                odometer_reading = odometer
+                liters = round(rng.uniform(35, 75), 2)
+                amount = round(liters * rng.uniform(1.6, 1.95), 2)
+            else:
+                amount = round(rng.uniform(low, high), 2)
+            loader.add('car_expenses', expense_columns,
+                       [make_uuid(rng), org_id, vehicle_id, day, amount, category, None,
+                        rng.choice(files['car_expenses']) if rng.random() < 0.3 else None,
+                        liters, odometer_reading])
+
+    # Penalties
+    for vehicle_id, team_id in vehicles:
+        for _ in range(int(months * options.penalties_per_month + rng.random())):
+            day = random_date(rng, first_day, today)
+            loader.add('penalties', ['id', 'organization_id', 'vehicle_id', 'user_id', 'team_id',
+                                     'date', 'amount', 'photo_url', 'description', 'status'],
+                       [make_uuid(rng), org_id, vehicle_id,
+                        rng.choice(workers_by_team.get(team_id) or [users[0][0]]), team_id, day,
+                        rng.choice([15, 25, 35, 55, 70, 100, 160, 240]),
+                        rng.choice(files['penalties']) if rng.random() < 0.5 else None,
+                        rng.choice(['Превышение скорости', 'Парковка', 'Красный свет', 'Штраф за стоянку']),
+                        'paid' if day < today - timedelta(days=60) or rng.random() < 0.4 else 'open'])
+
+    # Materials and assignments; older equipment has mostly come back
+    materials = []
+    for name, material_type, unit, price in MATERIALS:
+        material_id = make_uuid(rng)
+        materials.append((material_id, material_type))
+        loader.add('materials', ['id', 'organization_id', 'name', 'type', 'unit', 'unit_price', 'created_at'],
+                   [material_id, org_id, name, material_type, unit, price, first_day])
+    for team_id in teams:
+        for _ in range(months * options.assignments_per_month):
+            material_id, material_type = rng.choice(materials)
+            day = random_date(rng, first_day, today)
+            if material_type == 'material' or day > today - timedelta(days=30):
+                status = 'active'
+            else:
+                status = rng.choices(['returned', 'broken', 'active', 'pending_return'], [80, 5, 10, 5])[0]
+            loader.add('material_assignments', ['id', 'organization_id', 'material_id', 'team_id',
+                                                'quantity', 'status', 'event', 'date', 'notes'],
+                       [make_uuid(rng), org_id, material_id, team_id, rng.randint(1, 5), status,
+                        status if status in ('returned', 'broken') else 'assigned', day, None])
+
+    # Documents: a share expired or expiring within 30 days
+    document_types = list(get_document_types())
+    for vehicle_id, _ in vehicles:
+        for _ in range(options.documents_per_vehicle):
+            document_type = rng.choice(document_types)
+            issued = random_date(rng, first_day - timedelta(days=365), today)
+            expiry = issued + timedelta(days=rng.choice([180, 365, 730, 1095]))
+            loader.add('vehicle_documents', ['id', 'organization_id', 'vehicle_id', 'document_type',
+                                             'title', 'date_issued', 'date_expiry', 'file_url', 'is_active'],
+                       [make_uuid(rng), org_id, vehicle_id, document_type,
+                        f"{document_type} {issued.year}", issued, expiry,
+                        rng.choice(files['documents']), True])
+    for user_id, _ in users:
+        for _ in range(options.documents_per_user):
+            document_type = rng.choice(USER_DOCUMENT_TYPES)
+            issued = random_date(rng, first_day - timedelta(days=365 * 5), today)
+            loader.add('user_documents', ['id', 'organization_id', 'user_id', 'document_type', 'title',
+                                          'issue_date', 'expiry_date', 'file_url', 'is_active'],
+                       [make_uuid(rng), org_id, user_id, document_type, document_type,
+                        issued, issued + timedelta(days=rng.choice([365, 1825, 3650])),
+                        rng.choice(files['user_documents']), True])
+
+    return org_id
+
+
+def prepare_schema(first_day=None):
+    """Create the schema and the columns used by the pages
+
+    With first_day, the monthly partitions of car_expenses and penalties are
+    created from that month on, so the history is not loaded into the
+    default partition.
+    """
+    init_db()
+    with engine.begin() as conn:
+        for statement in APP_COLUMNS:
+            conn.execute(text(statement))
+        if first_day:
+            for table in PARTITIONED_TABLES:
+                if is_partitioned(conn, table):
+                    ensure_partitions(conn, table, first_day)
+
+
+def finalize(org_ids):
+    """Set team leads, derive the inventory ledger and refresh planner statistics"""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE teams t SET lead_id = (
+                SELECT u.id FROM users u WHERE u.team_id = t.id AND u.role = 'team_lead' LIMIT 1
+            )
+            WHERE t.organization_id = ANY(CAST(:org_ids AS uuid[]))
+        """), {'org_ids': org_ids})
+        conn.execute(text("""
+            INSERT INTO inventory_balances (
+                organization_id, material_id, team_id, active_quantity,
+                pending_return_quantity, returned_quantity, broken_quantity
+            )
+            SELECT organization_id, material_id, team_id,
+                   SUM(CASE WHEN status = 'active' THEN quantity ELSE 0 END),
+                   SUM(CASE WHEN status = 'pending_return' THEN quantity ELSE 0 END),
+                   SUM(CASE WHEN status = 'returned' THEN quantity ELSE 0 END),
+                   SUM(CASE WHEN status = 'broken' THEN quantity ELSE 0 END)
+            FROM material_assignments
+            WHERE organization_id = ANY(CAST(:org_ids AS uuid[]))
+            GROUP BY organization_id, material_id, team_id
+        """), {'org_ids': org_ids})
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE"))
+
+
+def generate(options):
+    """Generate and load all tenants; returns {table: rows loaded}"""
+    prepare_schema(history_start(options))
+    files = write_placeholder_files()
+    raw = engine.raw_connection()
+    org_ids = []
+    try:
+        loader = CopyLoader(raw)
+        for index in range(options.tenants):
+            started = time.time()
+            org_ids.append(generate_tenant(loader, index, options, files))
+            loader.flush()
+            raw.commit()
+            print(f"  tenant {index + 1}/{options.tenants} loaded in {time.time() - started:.1f}s")
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    finalize(org_ids)
+    return loader.counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load deterministic synthetic fleet data with COPY")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--tenants', type=int, default=3)
+    parser.add_argument('--vehicles', type=int, default=1000, help="vehicles per tenant")
+    parser.add_argument('--teams', type=int, default=40, help="teams per tenant")
+    parser.add_argument('--users', type=int, default=300, help="users per tenant")
+    parser.add_argument('--years', type=int, default=3, help="years of history")
+    parser.add_argument('--expenses-per-month', type=int, default=8, help="car expenses per vehicle and month")
+    parser.add_argument('--penalties-per-month', type=float, default=0.3, help="penalties per vehicle and month")
+    parser.add_argument('--assignments-per-month', type=int, default=6, help="material assignments per team and month")
+    parser.add_argument('--documents-per-vehicle', type=int, default=4)
+    parser.add_argument('--documents-per-user', type=int, default=2)
+    parser.add_argument('--today', type=date.fromisoformat, default=date(2025, 10, 1),
+                        help="end of the generated history (fixed for reproducibility)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args()
+    started = time.time()
+    counts = generate(options)
+    for table, count in sorted(counts.items()):
+        print(f"  {table}: {count:,}")
+    print(f"✅ Loaded {sum(counts.values()):,} rows in {time.time() - started:.1f}s "
+          f"(password for all users: '{SYNTHETIC_PASSWORD}')")
@@ -0,0 +1,325 @@
+"""
+Total cost of ownership (TCO) per vehicle
+
+Costs are kept per vehicle per month in vehicle_cost_months and refreshed
+incrementally whenever an expense, penalty or vehicle is written, so ranking
+the whole fleet only sums pre-aggregated monthly rows.
+
+Components per month:
+- car_expenses by category (fuel, repair, maintenance, insurance, other)
+- penalties
+- rental: active rental_contracts prorated by days covered, falling back to
+  vehicles.rental_monthly_price over the rental period, falling back to
+  car_expenses with category 'rental'
+- tax: vehicles.annual_tax_amount accrued monthly, falling back to car_expenses
+  with category 'tax' (the yearly tax cron books those)
+
+Accruals also change without a write (a new month starts, an open-ended
+rental runs on) and rental_contracts is written outside this app, so
+refresh_accruals() recomputes the previous and current month of every
+vehicle and the history of vehicles with rental contracts; it runs daily in
+a background thread (start_accrual_refresh, started from Home.py). Code that
+writes rental_contracts calls record_cost_change(vehicle_id).
+"""
+import threading
+import time
+from datetime import date, datetime, timedelta
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
+from sqlalchemy import text
+from database import engine, execute_query
+from query_metrics import background_thread_name
+
+ACCRUAL_REFRESH_INTERVAL = 24 * 3600
+
+_refresh_thread = None
+_refresh_lock = threading.Lock()
+
+TCO_COLUMNS = [
+    'ID', 'Название', 'Номер',
+    'Топливо', 'Ремонт', 'Обслуживание', 'Страховка', 'Прочее',
+    'Штрафы', 'Аренда', 'Налог', 'Итого TCO'
+]
+
+REFRESH_QUERY = """
+    INSERT INTO vehicle_cost_months (
+        organization_id, vehicle_id, month,
+        fuel_cost, repair_cost, maintenance_cost, insurance_cost,
+        tax_expense_cost, rental_expense_cost, other_expense_cost,
+        penalty_cost, rental_accrual, tax_accrual, updated_at
+    )
+    SELECT
+        m.organization_id,
+        m.vehicle_id,
+        m.month,
+        COALESCE(e.fuel_cost, 0),
+        COALESCE(e.repair_cost, 0),
+        COALESCE(e.maintenance_cost, 0),
+        COALESCE(e.insurance_cost, 0),
+        COALESCE(e.tax_expense_cost, 0),
+        COALESCE(e.rental_expense_cost, 0),
+        COALESCE(e.other_expense_cost, 0),
+        COALESCE(p.penalty_cost, 0),
+        COALESCE(rc.rental_accrual, vr.rental_accrual, 0),
+        CASE WHEN m.month >= DATE_TRUNC('month', m.created_at)
+             THEN COALESCE(m.annual_tax_amount, 0) / 12 ELSE 0 END,
+        CURRENT_TIMESTAMP
+    FROM (
+        SELECT
+            v.organization_id,
+            v.id as vehicle_id,
+            gs::date as month,
+            (gs + INTERVAL '1 month - 1 day')::date as month_end,
+            v.created_at,
+            v.is_rental,
+            v.rental_start_date,
+            v.rental_end_date,
+            v.rental_monthly_price,
+            v.annual_tax_amount
+        FROM vehicles v
+        CROSS JOIN generate_series(CAST(:month_from AS date), CAST(:month_to AS date), INTERVAL '1 month') gs
+        WHERE v.id = ANY(CAST(:vehicle_ids AS uuid[]))
+    ) m
+    LEFT JOIN (
+        SELECT
+            vehicle_id,
+            DATE_TRUNC('month', date)::date as month,
+            SUM(CASE WHEN category = 'fuel' THEN amount ELSE 0 END) as fuel_cost,
+            SUM(CASE WHEN category = 'repair' THEN amount ELSE 0 END) as repair_cost,
+            SUM(CASE WHEN category = 'maintenance' THEN amount ELSE 0 END) as maintenance_cost,
+            SUM(CASE WHEN category = 'insurance' THEN amount ELSE 0 END) as insurance_cost,
+            SUM(CASE WHEN category = 'tax' THEN amount ELSE 0 END) as tax_expense_cost,
+            SUM(CASE WHEN category = 'rental' THEN amount ELSE 0 END) as rental_expense_cost,
+            SUM(CASE WHEN category NOT IN ('fuel', 'repair', 'maintenance', 'insurance', 'tax', 'rental')
+                     THEN amount ELSE 0 END) as other_expense_cost
+        FROM car_expenses
+        WHERE vehicle_id = ANY(CAST(:vehicle_ids AS uuid[]))
+          AND date >= CAST(:month_from AS date)
+          AND date < CAST(:month_to AS date) + INTERVAL '1 month'
+        GROUP BY vehicle_id, DATE_TRUNC('month', date)
+    ) e ON e.vehicle_id = m.vehicle_id AND e.month = m.month
+    LEFT JOIN (
+        SELECT
+            vehicle_id,
+            DATE_TRUNC('month', date)::date as month,
+            SUM(amount) as penalty_cost
+        FROM penalties
+        WHERE vehicle_id = ANY(CAST(:vehicle_ids AS uuid[]))
+          AND date >= CAST(:month_from AS date)
+          AND date < CAST(:month_to AS date) + INTERVAL '1 month'
+        GROUP BY vehicle_id, DATE_TRUNC('month', date)
+    ) p ON p.vehicle_id = m.vehicle_id AND p.month = m.month
+    LEFT JOIN LATERAL (
+        SELECT SUM(
+            c.monthly_price
+            * (LEAST(c.end_date, m.month_end) - GREATEST(c.start_date, m.month) + 1)
+            / (m.month_end - m.month + 1)
+        ) as rental_accrual
+        FROM rental_contracts c
+        WHERE c.vehicle_id = m.vehicle_id
+          AND c.is_active = true
+          AND c.start_date <= m.month_end
+          AND c.end_date >= m.month
+    ) rc ON true
+    LEFT JOIN LATERAL (
+        SELECT
+            m.rental_monthly_price
+            * (LEAST(COALESCE(m.rental_end_date, CURRENT_DATE), m.month_end) - GREATEST(m.rental_start_date, m.month) + 1)
+            / (m.month_end - m.month + 1) as rental_accrual
+        WHERE m.is_rental = true
+          AND m.rental_monthly_price IS NOT NULL
+          AND m.rental_start_date IS NOT NULL
+          AND m.rental_start_date <= m.month_end
+          AND COALESCE(m.rental_end_date, CURRENT_DATE) >= m.month
+    ) vr ON true
+    ON CONFLICT (vehicle_id, month) DO UPDATE SET
+        organization_id = EXCLUDED.organization_id,
+        fuel_cost = EXCLUDED.fuel_cost,
+        repair_cost = EXCLUDED.repair_cost,
+        maintenance_cost = EXCLUDED.maintenance_cost,
+        insurance_cost = EXCLUDED.insurance_cost,
+        tax_expense_cost = EXCLUDED.tax_expense_cost,
+        rental_expense_cost = EXCLUDED.rental_expense_cost,
+        other_expense_cost = EXCLUDED.other_expense_cost,
+        penalty_cost = EXCLUDED.penalty_cost,
+        rental_accrual = EXCLUDED.rental_accrual,
+        tax_accrual = EXCLUDED.tax_accrual,
+        updated_at = EXCLUDED.updated_at
+"""
+
+
+def month_start(value):
+    """Return the first day of the month containing value"""
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.replace(day=1)
+
+
+def refresh_vehicle_costs(vehicle_ids, date_from, date_to=None):
+    """Recompute monthly cost rows for the given vehicles and date range"""
+    vehicle_ids = [str(v) for v in vehicle_ids if v]
+    if not vehicle_ids:
+        return
+    month_from = month_start(date_from)
+    month_to = month_start(date_to or date.today())
+    if month_from > month_to:
+        month_from, month_to = month_to, month_from
+
+    with engine.begin() as conn:
+        conn.execute(text(REFRESH_QUERY), {
+            'vehicle_ids': vehicle_ids,
+            'month_from': month_from,
+            'month_to': month_to
+        })
+
+
+def record_cost_change(vehicle_ids, dates=None):
+    """Write hook: refresh the months touched by an expense/penalty/vehicle write
+
+    Without dates the whole history of the vehicles is refreshed (e.g. rental
+    or tax settings changed).
+    """
+    if not isinstance(vehicle_ids, (list, tuple, set)):
+        vehicle_ids = [vehicle_ids]
+    dates = [d for d in (dates or []) if d]
+    try:
+        if dates:
+            for day in {month_start(d) for d in dates}:
+                refresh_vehicle_costs(vehicle_ids, day, day)
+        else:
+            first = _first_cost_date("v.id = ANY(CAST(:vehicle_ids AS uuid[]))",
+                                     {'vehicle_ids': [str(v) for v in vehicle_ids if v]})
+            refresh_vehicle_costs(vehicle_ids, first)
+    except Exception as e:
+        # The report can always be rebuilt; never fail the user's write
+        print(f"TCO refresh failed: {e}")
+
+
+def _first_cost_date(vehicle_filter, params):
+    result = execute_query(f"""
+        SELECT LEAST(
+            (SELECT MIN(ce.date) FROM car_expenses ce JOIN vehicles v ON ce.vehicle_id = v.id WHERE {vehicle_filter}),
+            (SELECT MIN(p.date) FROM penalties p JOIN vehicles v ON p.vehicle_id = v.id WHERE {vehicle_filter}),
+            (SELECT MIN(c.start_date) FROM rental_contracts c JOIN vehicles v ON c.vehicle_id = v.id WHERE {vehicle_filter}),
+            (SELECT MIN(v.rental_start_date) FROM vehicles v WHERE {vehicle_filter}),
+            (SELECT MIN(v.created_at)::date FROM vehicles v WHERE {vehicle_filter})
+        )
+    """, params)
+    return result[0][0] if result and result[0][0] else date.today()
+
+
+def rebuild_tco(org_id):
+    """Recompute all monthly cost rows of an organization"""
+    vehicles = execute_query(
+        "SELECT id FROM vehicles WHERE organization_id = :org_id", {'org_id': org_id}
+    ) or []
+    if not vehicles:
+        return
+    first = _first_cost_date("v.organization_id = :org_id", {'org_id': org_id})
+    refresh_vehicle_costs([v[0] for v in vehicles], first)
+
+
+def refresh_accruals():
+    """Recompute the months whose accruals change over time; returns the vehicle count"""
+    vehicles = execute_query("""
+        SELECT v.id, EXISTS (SELECT 1 FROM rental_contracts c WHERE c.vehicle_id = v.id)
+        FROM vehicles v
+        JOIN organizations o ON v.organization_id = o.id
+        WHERE o.subscription_status = 'active'
+    """) or []
+    if not vehicles:
+        return 0
+    today = date.today()
+    previous_month = month_start(month_start(today) - timedelta(days=1))
+    refresh_vehicle_costs([v[0] for v in vehicles], previous_month, today)
+    with_contracts = [v[0] for v in vehicles if v[1]]
+    if with_contracts:
+        record_cost_change(with_contracts)
+    return len(vehicles)
+
+
+def _refresh_loop():
+    while True:
+        try:
+            refresh_accruals()
+        except Exception as e:
+            print(f"TCO accrual refresh failed: {e}")
+        time.sleep(ACCRUAL_REFRESH_INTERVAL)
+
+
+def start_accrual_refresh():
+    """Start the daily accrual refresh thread once per process"""
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is None or not _refresh_thread.is_alive():
+            _refresh_thread = threading.Thread(
+                target=_refresh_loop, name=background_thread_name("tco-accrual-refresh"), daemon=True
+            )
+            _refresh_thread.start()
+
+
+def has_tco_data(org_id):
+    result = execute_query(
+        "SELECT EXISTS (SELECT 1 FROM vehicle_cost_months WHERE organization_id = :org_id)",
+        {'org_id': org_id}
+    )
+    return bool(result and result[0][0])
+
+
+def get_tco_ranking(org_id, date_from, date_to, limit=None):
+    """Rank vehicles by total cost of ownership over the months of a date range
+
+    Returns rows in TCO_COLUMNS order, most expensive first.
+    """
+    query = """
+        SELECT
+            v.id,
+            v.name,
+            v.license_plate,
+            SUM(c.fuel_cost) as fuel_cost,
+            SUM(c.repair_cost) as repair_cost,
+            SUM(c.maintenance_cost) as maintenance_cost,
+            SUM(c.insurance_cost) as insurance_cost,
+            SUM(c.other_expense_cost) as other_cost,
+            SUM(c.penalty_cost) as penalty_cost,
+            SUM(c.rental_cost) as rental_cost,
+            SUM(c.tax_cost) as tax_cost,
+            SUM(c.fuel_cost + c.repair_cost + c.maintenance_cost + c.insurance_cost
+                + c.other_expense_cost + c.penalty_cost + c.rental_cost + c.tax_cost) as total_cost
+        FROM (
+            SELECT
+                vehicle_id,
+                fuel_cost, repair_cost, maintenance_cost, insurance_cost,
+                other_expense_cost, penalty_cost,
+                CASE WHEN rental_accrual > 0 THEN rental_accrual ELSE rental_expense_cost END as rental_cost,
+                CASE WHEN tax_accrual > 0 THEN tax_accrual ELSE tax_expense_cost END as tax_cost
+            FROM vehicle_cost_months
+            WHERE organization_id = :org_id
+              AND month BETWEEN :month_from AND :month_to
+        ) c
+        JOIN vehicles v ON c.vehicle_id = v.id
+        GROUP BY v.id, v.name, v.license_plate
+        ORDER BY total_cost DESC
+    """
+    params = {
+        'org_id': org_id,
+        'month_from': month_start(date_from),
+        'month_to': month_start(date_to)
+    }
+    if limit:
+        query += " LIMIT :limit"
+        params['limit'] = limit
+    return execute_query(query, params) or []
+
+
+def tco_dataframe(rows):
+    """Convert ranking rows into a DataFrame with display column names"""
+    df = pd.DataFrame(rows, columns=TCO_COLUMNS)
+    for column in TCO_COLUMNS[3:]:
+        df[column] = df[column].astype(float)
+    return df
+
+
+def tco_to_csv(rows):
+    """Render ranking rows as CSV for download"""
+    return tco_dataframe(rows).drop(columns=['ID']).to_csv(index=False)
@@ -3,19 +3,16 @@ Telegram Bot integration for bug reporting
 """
 import os
 import asyncio
+import importlib.util
 import logging
 from typing import Optional
-try:
-    from telegram import Bot
-    from telegram.error import TelegramError
-    TELEGRAM_AVAILABLE = True
-except ImportError:
-    TELEGRAM_AVAILABLE = False
-    Bot = None
-    TelegramError = Exception
-    print("Telegram library not available")
 import streamlit as st
 
+# python-telegram-bot is imported only when a report is actually sent
+TELEGRAM_AVAILABLE = importlib.util.find_spec('telegram') is not None
+if not TELEGRAM_AVAILABLE:
+    print("Telegram library not available")
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -28,6 +25,7 @@ class TelegramBugReporter:
         
         if self.token and TELEGRAM_AVAILABLE:
             try:
+                from telegram import Bot
                 self.bot = Bot(token=self.token)
                 logger.info("Telegram bot initialized successfully")
             except Exception as e:
@@ -64,6 +62,7 @@ class TelegramBugReporter:
             logger.error("Telegram bot is not configured")
             return False
         
+        from telegram.error import TelegramError
         try:
             # Format bug report message
             message = self._format_bug_report(title, description, user_info)
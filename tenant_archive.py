@@ -0,0 +1,294 @@
+"""
+Streaming export and restore of one organization (tenant)
+
+    python tenant_archive.py export <organization_id> [-o archive.tar.gz]
+    python tenant_archive.py restore archive.tar.gz [--database-url URL] [--uploads-dir DIR]
+    python tenant_archive.py verify archive.tar.gz
+
+Export writes a gzipped tar with
+
+- data/<table>.csv: every tenant-scoped table (tenant_purge.TENANT_TABLES)
+  via COPY ... TO STDOUT, spooled through a temporary file so memory stays
+  bounded whatever the tenant's size,
+- uploads/...: the files referenced by the tenant's rows,
+- manifest.json: tables with columns, row counts and SHA-256, files with
+  size and SHA-256.
+
+Restore checks the manifest against the target schema and bulk-loads all
+tables with COPY ... FROM STDIN in one transaction, parents first; a
+checksum mismatch rolls everything back. teams.lead_id and users.team_id
+reference each other, so teams are loaded through a staging table and their
+lead is set once users exist. Files are extracted under the uploads
+directory after the commit.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import uuid
+from datetime import datetime
+from sqlalchemy import create_engine, text
+from database import engine as default_engine
+from tenant_purge import TENANT_TABLES, UPLOADS_DIR, existing_tables, collect_files, unmapped_tables
+
+ARCHIVE_FORMAT = 1
+MANIFEST = 'manifest.json'
+CHUNK_BYTES = 1024 * 1024
+# Columns loaded as NULL and set after all tables are in (circular references)
+DEFERRED_COLUMNS = {'teams': ('lead_id',)}
+
+
+class HashingFile:
+    """File wrapper computing SHA-256 and size of what passes through it"""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        chunk = data.encode('utf-8') if isinstance(data, str) else data
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        return self.f.write(chunk)
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.f.readline(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def table_columns(conn, table):
+    return [row[0] for row in conn.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = :table
+          AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """), {'table': table}).fetchall()]
+
+
+def _add_stream(tar, name, f, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(datetime.now().timestamp())
+    tar.addfile(info, f)
+
+
+def export_tenant(org_id, output, engine=default_engine, progress=print):
+    """Write the tenant archive to output; returns the manifest"""
+    org_id = str(uuid.UUID(str(org_id)))
+    manifest = {
+        'format': ARCHIVE_FORMAT,
+        'organization_id': org_id,
+        'exported_at': datetime.now().isoformat(timespec='seconds'),
+        'tables': [],
+        'files': []
+    }
+    with engine.begin() as conn, tarfile.open(output, 'w:gz') as tar:
+        # One snapshot for all tables, so the archive is consistent
+        conn.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"))
+        tables = existing_tables(conn)
+        for table in unmapped_tables(conn):
+            progress(f"⚠️ {table} has organization_id but is not in TENANT_TABLES; not exported")
+        cursor = conn.connection.dbapi_connection.cursor()
+        for table, _, where, _ in tables:
+            columns = table_columns(conn, table)
+            column_list = ', '.join(columns)
+            query = f"SELECT {column_list} FROM {table} WHERE {where.replace(':org_id', repr(org_id))}"
+            with tempfile.TemporaryFile() as spool:
+                hashing = HashingFile(spool)
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", hashing)
+                rows = cursor.rowcount
+                spool.seek(0)
+                _add_stream(tar, f"data/{table}.csv", spool, hashing.size)
+            manifest['tables'].append({
+                'name': table,
+                'file': f"data/{table}.csv",
+                'columns': columns,
+                'rows': rows,
+                'bytes': hashing.size,
+                'sha256': hashing.sha256.hexdigest()
+            })
+            progress(f"{table}: {rows} rows")
+
+        root = os.path.dirname(UPLOADS_DIR)
+        for path in collect_files(conn, org_id, tables):
+            if not os.path.isfile(path):
+                progress(f"⚠️ missing file {path}")
+                continue
+            name = os.path.relpath(path, root)
+            tar.add(path, arcname=name, recursive=False)
+            manifest['files'].append({'path': name, 'bytes': os.path.getsize(path), 'sha256': file_sha256(path)})
+        progress(f"files: {len(manifest['files'])}")
+
+        data = json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.seek(0)
+            _add_stream(tar, MANIFEST, f, len(data))
+    return manifest
+
+
+def read_manifest(tar):
+    member = tar.getmember(MANIFEST)
+    manifest = json.load(tar.extractfile(member))
+    if manifest.get('format') != ARCHIVE_FORMAT:
+        raise ValueError(f"Unsupported archive format {manifest.get('format')}")
+    return manifest
+
+
+def verify_archive(path):
+    """Check every member against the manifest checksums; returns a list of problems"""
+    problems = []
+    with tarfile.open(path, 'r:*') as tar:
+        manifest = read_manifest(tar)
+        expected = {t['file']: t['sha256'] for t in manifest['tables']}
+        expected.update({f['path']: f['sha256'] for f in manifest['files']})
+        for member in tar:
+            if member.name == MANIFEST or not member.isfile():
+                continue
+            if member.name not in expected:
+                problems.append(f"{member.name}: not in manifest")
+                continue
+            sha256 = hashlib.sha256()
+            f = tar.extractfile(member)
+            for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+                sha256.update(chunk)
+            if sha256.hexdigest() != expected.pop(member.name):
+                problems.append(f"{member.name}: checksum mismatch")
+        problems.extend(f"{name}: missing" for name in expected)
+    return problems
+
+
+def _copy_in(cursor, tar, entry, target, columns):
+    """COPY one archived table into target; raises on a checksum mismatch"""
+    hashing = HashingFile(tar.extractfile(entry['file']))
+    cursor.copy_expert(f"COPY {target} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", hashing)
+    if hashing.sha256.hexdigest() != entry['sha256']:
+        raise ValueError(f"{entry['file']}: checksum mismatch")
+
+
+def restore_tenant(path, engine=default_engine, uploads_dir=UPLOADS_DIR, progress=print):
+    """Load an archive into the database behind engine; returns the manifest"""
+    order = [table for table, _, _, _ in TENANT_TABLES]
+    with tarfile.open(path, 'r:*') as tar:
+        manifest = read_manifest(tar)
+        entries = sorted(manifest['tables'], key=lambda t: order.index(t['name']))
+
+        with engine.begin() as conn:
+            exists = conn.execute(text("SELECT 1 FROM organizations WHERE id = :id"),
+                                  {'id': manifest['organization_id']}).fetchone()
+            if exists:
+                raise ValueError(f"Organization {manifest['organization_id']} already exists in the target database")
+            for entry in entries:
+                missing = set(entry['columns']) - set(table_columns(conn, entry['name']))
+                if missing:
+                    raise ValueError(f"{entry['name']}: target is missing columns {', '.join(sorted(missing))} "
+                                     f"(run the migrations first)")
+
+            cursor = conn.connection.dbapi_connection.cursor()
+            for entry in entries:
+                table, columns = entry['name'], entry['columns']
+                deferred = [c for c in DEFERRED_COLUMNS.get(table, ()) if c in columns]
+                if deferred:
+                    conn.execute(text(f"""
+                        CREATE TEMP TABLE restore_{table} ON COMMIT DROP AS
+                        SELECT {', '.join(columns)} FROM {table} WITH NO DATA
+                    """))
+                    _copy_in(cursor, tar, entry, f"restore_{table}", columns)
+                    values = ', '.join('NULL' if c in deferred else c for c in columns)
+                    conn.execute(text(f"INSERT INTO {table} ({', '.join(columns)}) "
+                                      f"SELECT {values} FROM restore_{table}"))
+                else:
+                    _copy_in(cursor, tar, entry, table, columns)
+                progress(f"{table}: {entry['rows']} rows")
+
+            for entry in entries:
+                for column in DEFERRED_COLUMNS.get(entry['name'], ()):
+                    if column in entry['columns']:
+                        conn.execute(text(f"""
+                            UPDATE {entry['name']} t SET {column} = s.{column}
+                            FROM restore_{entry['name']} s
+                            WHERE t.id = s.id AND s.{column} IS NOT NULL
+                        """))
+
+            # Explicit ids were copied into serial columns
+            for entry in entries:
+                sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"),
+                                        {'table': entry['name']}).scalar() if 'id' in entry['columns'] else None
+                if sequence:
+                    conn.execute(text(f"SELECT setval(:sequence, GREATEST((SELECT MAX(id) FROM {entry['name']}), 1))"),
+                                 {'sequence': sequence})
+
+        root = os.path.realpath(uploads_dir)
+        for item in manifest['files']:
+            relative = os.path.relpath(item['path'], 'uploads')
+            target = os.path.realpath(os.path.join(root, relative))
+            if not target.startswith(root + os.sep):
+                progress(f"⚠️ skipped file outside uploads: {item['path']}")
+                continue
+            if os.path.exists(target) and file_sha256(target) == item['sha256']:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with tar.extractfile(item['path']) as source, open(target, 'wb') as f:
+                shutil.copyfileobj(source, f, CHUNK_BYTES)
+            if file_sha256(target) != item['sha256']:
+                progress(f"⚠️ checksum mismatch: {item['path']}")
+        progress(f"files: {len(manifest['files'])}")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or restore one organization with its uploads")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="write a tenant archive")
+    export.add_argument('organization_id')
+    export.add_argument('-o', '--output', help="archive path (default tenant-<id>-<date>.tar.gz)")
+    restore = commands.add_parser('restore', help="load a tenant archive into a database")
+    restore.add_argument('archive')
+    restore.add_argument('--database-url', help="target database (default DATABASE_URL)")
+    restore.add_argument('--uploads-dir', default=UPLOADS_DIR)
+    verify = commands.add_parser('verify', help="check an archive against its manifest")
+    verify.add_argument('archive')
+    options = parser.parse_args(argv)
+
+    if options.command == 'export':
+        output = options.output or f"tenant-{options.organization_id}-{datetime.now():%Y%m%d}.tar.gz"
+        manifest = export_tenant(options.organization_id, output)
+        rows = sum(t['rows'] for t in manifest['tables'])
+        print(f"✅ {output}: {rows} rows, {len(manifest['files'])} files")
+    elif options.command == 'restore':
+        engine = create_engine(options.database_url) if options.database_url else default_engine
+        manifest = restore_tenant(options.archive, engine, options.uploads_dir)
+        print(f"✅ Restored organization {manifest['organization_id']}")
+    else:
+        problems = verify_archive(options.archive)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            return 1
+        print("✅ Archive matches its manifest")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+Background purge of an organization (tenant) and its uploaded files
+
+start_purge() records a job in tenant_purge_jobs and runs it in a daemon
+thread:
+
+1. the organization is set to subscription_status 'deleting', which blocks
+   logins (authenticate_user only accepts 'active'),
+2. the upload paths referenced by the tenant's rows are collected,
+3. the rows are deleted children first. Tenants up to PURGE_TX_MAX_ROWS rows
+   are deleted in one transaction; bigger ones in batches of PURGE_BATCH_ROWS
+   by primary key, one transaction per batch, to keep lock time and WAL
+   bursts small,
+4. the collected files are removed from uploads/.
+
+Progress (current table, deleted rows, removed files) is written to the job
+row after every table or batch. A purge is idempotent, so an interrupted job
+is simply started again:
+
+    python tenant_purge.py <organization_id>
+"""
+import argparse
+import os
+import re
+import threading
+import uuid
+from sqlalchemy import text
+from database import engine, execute_query
+from query_metrics import background_thread_name
+
+# Tenants with more rows are purged in batches instead of one transaction
+PURGE_TX_MAX_ROWS = int(os.getenv('PURGE_TX_MAX_ROWS', '50000'))
+PURGE_BATCH_ROWS = int(os.getenv('PURGE_BATCH_ROWS', '5000'))
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+
+_VEHICLES = "vehicle_id IN (SELECT id FROM vehicles WHERE organization_id = :org_id)"
+_TEAMS = "team_id IN (SELECT id FROM teams WHERE organization_id = :org_id)"
+
+# Tenant-scoped tables, parents first: (table, key column or None, row filter,
+# columns holding upload paths). Tables missing in a database are skipped.
+# vehicle_types, fuel_limits and vehicle_ownership_history come from the
+# Next.js migrations on the same database.
+TENANT_TABLES = [
+    ('organizations', 'id', "id = :org_id", []),
+    ('fuel_limits', 'id', "organization_id = :org_id", []),
+    ('teams', 'id', "organization_id = :org_id", []),
+    ('users', 'id', "organization_id = :org_id", []),
+    ('vehicle_types', 'id', "organization_id = :org_id", []),
+    ('vehicles', 'id', "organization_id = :org_id", ['photo_url']),
+    ('vehicle_ownership_history', 'id', "organization_id = :org_id", []),
+    ('team_members', 'id', "organization_id = :org_id", []),
+    ('team_member_documents', 'id',
+     "team_member_id IN (SELECT id FROM team_members WHERE organization_id = :org_id)", ['file_url']),
+    ('vehicle_assignments', 'id', f"{_VEHICLES} OR {_TEAMS}", []),
+    ('materials', 'id', "organization_id = :org_id", []),
+    ('material_assignments', 'id', "organization_id = :org_id", []),
+    ('material_history', 'id', "material_id IN (SELECT id FROM materials WHERE organization_id = :org_id)", []),
+    ('inventory_events', 'id', "organization_id = :org_id", []),
+    ('inventory_balances', None, "organization_id = :org_id", []),
+    ('penalties', 'id', "organization_id = :org_id", ['photo_url']),
+    ('maintenances', 'id', _VEHICLES, ['receipt_url']),
+    ('car_expenses', 'id', "organization_id = :org_id", ['receipt_url']),
+    ('expenses', 'id', f"{_VEHICLES} OR {_TEAMS}", ['receipt_url']),
+    ('rental_contracts', 'id', "organization_id = :org_id", ['contract_file_url']),
+    ('vehicle_documents', 'id', "organization_id = :org_id", ['file_url']),
+    ('user_documents', 'id', "organization_id = :org_id", ['file_url']),
+    ('vehicle_cost_months', None, "organization_id = :org_id", []),
+    ('fuel_consumption_stats', None, "organization_id = :org_id", []),
+    ('spend_forecast_models', None, "organization_id = :org_id", []),
+]
+# Tables with organization_id that are not tenant data: the purge job log
+# outlives the tenant, search_index follows its source tables through triggers
+NOT_TENANT_DATA = {'tenant_purge_jobs', 'search_index'}
+
+_threads = {}
+_threads_lock = threading.Lock()
+
+
+def existing_tables(conn):
+    names = [table for table, _, _, _ in TENANT_TABLES]
+    rows = conn.execute(text("""
+        SELECT name FROM unnest(CAST(:names AS text[])) AS name
+        WHERE to_regclass(name) IS NOT NULL
+    """), {'names': names}).fetchall()
+    found = {row[0] for row in rows}
+    return [spec for spec in TENANT_TABLES if spec[0] in found]
+
+
+def unmapped_tables(conn):
+    """Tables with an organization_id column that TENANT_TABLES does not cover"""
+    mapped = {table for table, _, _, _ in TENANT_TABLES} | NOT_TENANT_DATA
+    rows = conn.execute(text("""
+        SELECT c.table_name
+        FROM information_schema.columns c
+        JOIN information_schema.tables t
+          ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE c.table_schema = current_schema() AND c.column_name = 'organization_id'
+          AND t.table_type = 'BASE TABLE'
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = to_regclass(c.table_name))
+        ORDER BY c.table_name
+    """)).fetchall()
+    return [row[0] for row in rows if row[0] not in mapped]
+
+
+def split_paths(value):
+    """Upload paths of a URL column (several files are joined with ';' or ',')"""
+    return [p.strip() for p in re.split(r'[;,]', value or '') if p.strip()]
+
+
+def upload_path(path):
+    """Absolute path of a stored upload, or None if it points outside uploads/"""
+    absolute = os.path.realpath(os.path.join(os.path.dirname(UPLOADS_DIR), path.lstrip('/')))
+    return absolute if absolute.startswith(UPLOADS_DIR + os.sep) else None
+
+
+def collect_files(conn, org_id, tables):
+    files = set()
+    for table, _, where, columns in tables:
+        for column in columns:
+            rows = conn.execute(text(f"SELECT {column} FROM {table} WHERE ({where}) AND {column} IS NOT NULL"),
+                                {'org_id': org_id}).fetchall()
+            for row in rows:
+                files.update(p for p in map(upload_path, split_paths(row[0])) if p)
+    return sorted(files)
+
+
+def count_rows(conn, org_id, tables):
+    return {table: conn.execute(text(f"SELECT COUNT(*) FROM {table} WHERE {where}"), {'org_id': org_id}).scalar()
+            for table, _, where, _ in tables}
+
+
+def remove_files(paths):
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ Could not remove {path}: {e}")
+    return removed
+
+
+def _update_job(job_id, **fields):
+    assignments = ', '.join(f"{name} = :{name}" for name in fields)
+    execute_query(f"UPDATE tenant_purge_jobs SET {assignments} WHERE id = :id", {'id': job_id, **fields})
+
+
+def _prepare(conn, org_id):
+    # teams.lead_id -> users and users.team_id -> teams reference each other
+    conn.execute(text("UPDATE organizations SET subscription_status = 'deleting' WHERE id = :org_id"),
+                 {'org_id': org_id})
+    conn.execute(text("UPDATE teams SET lead_id = NULL WHERE organization_id = :org_id"), {'org_id': org_id})
+
+
+def _delete_all(conn, table, where, org_id):
+    return conn.execute(text(f"DELETE FROM {table} WHERE {where}"), {'org_id': org_id}).rowcount
+
+
+def _delete_batch(conn, table, key, where, org_id):
+    return conn.execute(text(f"""
+        DELETE FROM {table}
+        WHERE {key} IN (SELECT {key} FROM {table} WHERE {where} LIMIT :batch)
+    """), {'org_id': org_id, 'batch': PURGE_BATCH_ROWS}).rowcount
+
+
+def purge_tenant(org_id, job_id=None, progress=None):
+    """Delete every row and upload of an organization; returns (deleted rows, removed files)"""
+    org_id = str(org_id)
+
+    def report(**fields):
+        if job_id:
+            _update_job(job_id, **fields)
+        if progress:
+            progress(fields)
+
+    with engine.begin() as conn:
+        tables = existing_tables(conn)
+        files = collect_files(conn, org_id, tables)
+        counts = count_rows(conn, org_id, tables)
+        batched = sum(counts.values()) > PURGE_TX_MAX_ROWS
+        if batched:
+            _prepare(conn, org_id)
+    report(status='running', mode='batched' if batched else 'transaction',
+           total_rows=sum(counts.values()), files_total=len(files))
+
+    deleted = 0
+    if not batched:
+        with engine.begin() as conn:
+            _prepare(conn, org_id)
+            for table, _, where, _ in reversed(tables):
+                deleted += _delete_all(conn, table, where, org_id)
+        report(deleted_rows=deleted)
+    else:
+        for table, key, where, _ in reversed(tables):
+            if not counts[table]:
+                continue
+            report(current_table=table)
+            while True:
+                with engine.begin() as conn:
+                    if key:
+                        rows = _delete_batch(conn, table, key, where, org_id)
+                    else:
+                        rows = _delete_all(conn, table, where, org_id)
+                deleted += rows
+                report(deleted_rows=deleted)
+                if not key or rows < PURGE_BATCH_ROWS:
+                    break
+
+    # Files go last: a failed purge must not leave rows pointing at removed files
+    removed = remove_files(files)
+    report(status='done', current_table=None, files_deleted=removed)
+    return deleted, removed
+
+
+def _run_job(job_id, org_id):
+    try:
+        purge_tenant(org_id, job_id)
+        execute_query("UPDATE tenant_purge_jobs SET finished_at = CURRENT_TIMESTAMP WHERE id = :id", {'id': job_id})
+    except Exception as e:
+        print(f"⚠️ Tenant purge {job_id} failed: {e}")
+        _update_job(job_id, status='failed', error=str(e)[:1000])
+    finally:
+        with _threads_lock:
+            _threads.pop(str(org_id), None)
+
+
+def start_purge(org_id, requested_by=None, organization_name=None):
+    """Queue a purge of the organization and run it in the background; returns the job id"""
+    org_id = str(org_id)
+    with _threads_lock:
+        running = _threads.get(org_id)
+        if running:
+            return running[0]
+        job_id = str(uuid.uuid4())
+        execute_query("""
+            INSERT INTO tenant_purge_jobs (id, organization_id, organization_name, requested_by, status)
+            VALUES (:id, :org_id, :name, :requested_by, 'queued')
+        """, {'id': job_id, 'org_id': org_id, 'name': organization_name,
+              'requested_by': str(requested_by) if requested_by else None})
+        thread = threading.Thread(target=_run_job, args=(job_id, org_id),
+                                  name=background_thread_name(f"tenant-purge-{org_id}"), daemon=True)
+        _threads[org_id] = (job_id, thread)
+        thread.start()
+    return job_id
+
+
+def get_job(job_id):
+    rows = execute_query("""
+        SELECT status, mode, total_rows, deleted_rows, current_table, files_total, files_deleted, error
+        FROM tenant_purge_jobs
+        WHERE id = :id
+    """, {'id': job_id})
+    if not rows:
+        return None
+    keys = ('status', 'mode', 'total_rows', 'deleted_rows', 'current_table', 'files_total', 'files_deleted', 'error')
+    return dict(zip(keys, rows[0]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delete an organization with all its data and uploads")
+    parser.add_argument('organization_id')
+    parser.add_argument('--dry-run', action='store_true', help="only count rows and files")
+    options = parser.parse_args(argv)
+
+    if options.dry_run:
+        with engine.connect() as conn:
+            tables = existing_tables(conn)
+            counts = count_rows(conn, options.organization_id, tables)
+            files = collect_files(conn, options.organization_id, tables)
+        for table, count in counts.items():
+            if count:
+                print(f"{table:<28} {count:>10}")
+        print(f"{'total rows':<28} {sum(counts.values()):>10}")
+        print(f"{'files':<28} {len(files):>10}")
+        return 0
+
+    deleted, removed = purge_tenant(
+        options.organization_id,
+        progress=lambda fields: print(', '.join(f"{k}={v}" for k, v in fields.items()))
+    )
+    print(f"✅ Deleted {deleted} rows and {removed} files")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,20 @@
 """
 Multi-language support for the fleet management system
+
+Russian and German are defined in TRANSLATIONS below; further languages are
+JSON catalogs in locales/<code>.json ({"language_name": ..., "texts": {key:
+text}}) read the first time they are used. Each language is compiled once
+into a flat key -> text dict, with keys missing from a catalog reported at
+build time and falling back to the Russian text.
 """
+import functools
+import json
+import os
+import threading
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+# Language whose keys every catalog is checked against
+REFERENCE_LANGUAGE = 'ru'
 
 LANGUAGES = {
     'ru': 'Русский',
@@ -303,6 +317,76 @@ TRANSLATIONS = {
     }
 }
 
+_tables = {}
+_lock = threading.Lock()
+# Keys missing per language, found when its table was built
+missing_keys = {}
+# Keys requested at runtime that no catalog defines
+unknown_keys = set()
+
+def _catalog_path(language):
+    return os.path.join(LOCALES_DIR, f"{language}.json")
+
+def _read_catalog(language):
+    """Texts of an external catalog, or None when there is no such file"""
+    path = _catalog_path(language)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def build_table(language: str) -> dict:
+    """Compile the flat key -> text table of one language"""
+    reference = {key: texts[REFERENCE_LANGUAGE] for key, texts in TRANSLATIONS.items()
+                 if REFERENCE_LANGUAGE in texts}
+    if language in LANGUAGES:
+        texts = {key: values[language] for key, values in TRANSLATIONS.items() if language in values}
+    else:
+        catalog = _read_catalog(language)
+        texts = catalog.get('texts', {}) if catalog else {}
+
+    missing = sorted(set(reference) - set(texts))
+    if missing:
+        missing_keys[language] = missing
+        print(f"⚠️ Translations '{language}': {len(missing)} keys missing, using {REFERENCE_LANGUAGE}: {', '.join(missing[:10])}")
+    return {**reference, **texts}
+
+def get_table(language: str) -> dict:
+    """Flat key -> text dict of a language (built on first use)"""
+    table = _tables.get(language)
+    if table is None:
+        with _lock:
+            table = _tables.get(language)
+            if table is None:
+                table = _tables[language] = build_table(language)
+    return table
+
+@functools.lru_cache(maxsize=None)
+def available_languages() -> dict:
+    """Built-in languages plus the catalogs in locales/, code -> display name (read once)"""
+    languages = dict(LANGUAGES)
+    if os.path.isdir(LOCALES_DIR):
+        for file_name in sorted(os.listdir(LOCALES_DIR)):
+            code, extension = os.path.splitext(file_name)
+            if extension == '.json' and code not in languages:
+                catalog = _read_catalog(code) or {}
+                languages[code] = catalog.get('language_name', code)
+    return languages
+
 def get_text(key: str, language: str = 'ru') -> str:
     """Get translated text for a given key and language"""
-    return TRANSLATIONS.get(key, {}).get(language, key)
+    text = get_table(language).get(key)
+    if text is None:
+        unknown_keys.add(key)
+        return key
+    return text
+
+def translate_series(series, language: str = 'ru'):
+    """Translate a pandas Series of keys in one pass (unknown keys stay as they are)"""
+    return series.map(get_table(language)).fillna(series)
+
+if __name__ == "__main__":
+    # Check every catalog against the reference language
+    for code in available_languages():
+        get_table(code)
+    raise SystemExit(1 if missing_keys else 0)
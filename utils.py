@@ -1,5 +1,6 @@
 import streamlit as st
-import pandas as pd
+from lazy_imports import lazy_module
+pd = lazy_module('pandas')
 from datetime import datetime, date
 from database import execute_query
 from translations import get_text
@@ -73,7 +74,7 @@ def get_users_for_select(language='ru'):
 def get_vehicles_for_select(language='ru'):
     """Get vehicles for select box"""
     try:
-        vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name")
+        vehicles = execute_query("SELECT id, name, license_plate FROM vehicles ORDER BY name_sort_key, name")
         if not vehicles or not isinstance(vehicles, list):
             return []
         return [(str(vehicle[0]), f"{vehicle[1]} ({vehicle[2]})") for vehicle in vehicles]
@@ -559,7 +560,7 @@ def delete_document(document_id):
     try:
         execute_query("""
             UPDATE vehicle_documents 
-            SET is_active = false 
+            SET is_active = false, deleted_at = CURRENT_TIMESTAMP 
             WHERE id = :id
         """, {'id': document_id})
         st.success("Документ удален")
@@ -0,0 +1,231 @@
+"""
+Bulk vehicle import from CSV/XLSX
+
+The file is validated as a whole with pandas (normalized plates and VINs,
+required fields, duplicates inside the file), the valid rows are loaded into
+a temporary staging table with COPY and upserted into vehicles with one
+INSERT ... ON CONFLICT (organization_id, license_plate) statement. Every file
+row gets a result: inserted, updated, error or (dry run) valid.
+
+Plates and VINs are deduplicated by vehicle_search.normalize_key, the same
+key as the plate_key/vin_key columns search uses, so "B-FD 5555" and
+"B FD 5555" are one vehicle.
+
+The column names are those of the vehicles export (id, organization_id,
+photo_url and created_at are ignored).
+"""
+import csv
+import io
+from sqlalchemy import text
+from database import engine
+from lazy_imports import lazy_module
+from tco_report import record_cost_change
+from vehicle_search import normalize_key
+pd = lazy_module('pandas')
+
+IMPORT_COLUMNS = ['name', 'license_plate', 'vin', 'status', 'model', 'year', 'is_rental',
+                  'rental_start_date', 'rental_end_date', 'rental_monthly_price']
+VEHICLE_STATUSES = {'active', 'repair', 'unavailable', 'rented'}
+TRUE_VALUES = {'true', '1', 'yes', 'y', 'ja', 'да', 'x'}
+FALSE_VALUES = {'false', '0', 'no', 'n', 'nein', 'нет', ''}
+MIN_YEAR, MAX_YEAR = 1990, 2030
+# VINs are 17 characters without I, O and Q
+VIN_PATTERN = r'^[A-HJ-NPR-Z0-9]{17}$'
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S')
+# normalize_key of plate and VIN, carried into the staging table for matching
+STAGING_KEYS = ['plate_key', 'vin_key']
+
+
+def read_file(uploaded_file):
+    """Read an uploaded CSV or XLSX file as strings"""
+    name = getattr(uploaded_file, 'name', str(uploaded_file)).lower()
+    if name.endswith(('.xlsx', '.xls')):
+        try:
+            return pd.read_excel(uploaded_file, dtype=str, keep_default_na=False)
+        except ImportError:
+            raise ValueError("Для импорта XLSX установите openpyxl / Install openpyxl to import XLSX")
+    return pd.read_csv(uploaded_file, dtype=str, keep_default_na=False, sep=None, engine='python')
+
+
+def normalize_plate(plates):
+    return plates.str.upper().str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+def normalize_vin(vins):
+    return vins.str.upper().str.replace(r'[\s\-]', '', regex=True)
+
+
+def parse_dates(values):
+    """Parse ISO and German/Russian style dates; anything else becomes NaT"""
+    parsed = pd.to_datetime(values, format=DATE_FORMATS[0], errors='coerce')
+    for date_format in DATE_FORMATS[1:]:
+        parsed = parsed.fillna(pd.to_datetime(values, format=date_format, errors='coerce'))
+    return parsed
+
+
+def _add_error(errors, mask, message):
+    errors.loc[mask] = errors.loc[mask].where(errors.loc[mask] == '', errors.loc[mask] + '; ') + message
+
+
+def validate(df):
+    """Normalize and validate all rows at once
+
+    Returns (rows, errors, warnings): rows has the import columns plus 'row'
+    (line number in the file), errors/warnings are per-row strings.
+    """
+    df = df.rename(columns=lambda c: str(c).strip().lower())
+    missing = [c for c in ('name', 'license_plate') if c not in df.columns]
+    if missing:
+        raise ValueError(f"Нет колонок / Missing columns: {', '.join(missing)}")
+    for column in IMPORT_COLUMNS:
+        if column not in df.columns:
+            df[column] = ''
+    rows = df[IMPORT_COLUMNS].fillna('').astype(str).apply(lambda s: s.str.strip())
+    # Header is line 1
+    rows.insert(0, 'row', range(2, len(rows) + 2))
+
+    errors = pd.Series('', index=rows.index)
+    warnings = pd.Series('', index=rows.index)
+
+    rows['license_plate'] = normalize_plate(rows['license_plate'])
+    rows['vin'] = normalize_vin(rows['vin'])
+    rows['plate_key'] = rows['license_plate'].map(normalize_key)
+    rows['vin_key'] = rows['vin'].map(normalize_key)
+    rows['status'] = rows['status'].str.lower().replace('', 'active')
+    _add_error(errors, rows['name'] == '', "нет названия / name missing")
+    _add_error(errors, rows['license_plate'] == '', "нет гос. номера / plate missing")
+    _add_error(errors, ~rows['status'].isin(VEHICLE_STATUSES), "неизвестный статус / unknown status")
+    _add_error(warnings, (rows['vin'] != '') & ~rows['vin'].str.match(VIN_PATTERN), "VIN не из 17 символов / unusual VIN")
+
+    year = pd.to_numeric(rows['year'], errors='coerce')
+    _add_error(errors, (rows['year'] != '') & ~year.between(MIN_YEAR, MAX_YEAR), "неверный год / invalid year")
+    rows['year'] = year.where(year.between(MIN_YEAR, MAX_YEAR)).astype('Int64')
+
+    rental = rows['is_rental'].str.lower()
+    _add_error(errors, ~rental.isin(TRUE_VALUES | FALSE_VALUES), "неверное значение аренды / invalid is_rental")
+    rows['is_rental'] = rental.isin(TRUE_VALUES)
+
+    for column in ('rental_start_date', 'rental_end_date'):
+        parsed = parse_dates(rows[column])
+        _add_error(errors, (rows[column] != '') & parsed.isna(), f"неверная дата / invalid {column}")
+        rows[column] = parsed.dt.date
+    price = pd.to_numeric(rows['rental_monthly_price'].str.replace(',', '.'), errors='coerce')
+    _add_error(errors, (rows['rental_monthly_price'] != '') & (price.isna() | (price < 0)), "неверная цена аренды / invalid rental price")
+    rows['rental_monthly_price'] = price.where(price > 0)
+
+    # Duplicates inside the file: the first occurrence wins
+    for column, label in (('plate_key', 'гос. номер / plate'), ('vin_key', 'VIN')):
+        present = rows[column] != ''
+        first_row = rows[present].groupby(column)['row'].transform('min')
+        duplicate = present & rows[column].duplicated(keep='first')
+        for index in rows.index[duplicate]:
+            errors.loc[index] += ('; ' if errors.loc[index] else '') + f"{label} повторяется (строка {first_row.loc[index]}) / duplicate in file"
+
+    return rows, errors, warnings
+
+
+def _copy_staging(conn, rows):
+    """COPY the rows into a temporary staging table on the transaction's connection"""
+    conn.execute(text("""
+        CREATE TEMP TABLE vehicle_import_staging (
+            row INTEGER PRIMARY KEY,
+            name TEXT,
+            license_plate TEXT,
+            vin TEXT,
+            status TEXT,
+            model TEXT,
+            year INTEGER,
+            is_rental BOOLEAN,
+            rental_start_date DATE,
+            rental_end_date DATE,
+            rental_monthly_price NUMERIC(10,2),
+            plate_key TEXT,
+            vin_key TEXT
+        ) ON COMMIT DROP
+    """))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in rows[['row'] + IMPORT_COLUMNS + STAGING_KEYS].itertuples(index=False):
+        writer.writerow(['' if pd.isna(value) else value for value in record])
+    buffer.seek(0)
+    with conn.connection.dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY vehicle_import_staging (row, {', '.join(IMPORT_COLUMNS + STAGING_KEYS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+def import_vehicles(df, organization_id, dry_run=False):
+    """Validate and upsert vehicles; returns a per-row report DataFrame"""
+    rows, errors, warnings = validate(df)
+    report = pd.DataFrame({
+        'row': rows['row'],
+        'license_plate': rows['license_plate'],
+        'name': rows['name'],
+        'result': 'error',
+        'message': errors.where(errors != '', warnings)
+    })
+    valid = rows[errors == '']
+    report.loc[errors == '', 'result'] = 'valid'
+    if dry_run or valid.empty:
+        return report
+
+    with engine.begin() as conn:
+        _copy_staging(conn, valid)
+        # Match plates that were stored with other spacing, dashes or case
+        conn.execute(text("""
+            UPDATE vehicle_import_staging s
+            SET license_plate = v.license_plate
+            FROM vehicles v
+            WHERE v.organization_id = :org_id
+              AND v.plate_key = s.plate_key
+        """), {'org_id': organization_id})
+        # A VIN that already belongs to another plate would violate UNIQUE(organization_id, vin)
+        conflicts = conn.execute(text("""
+            DELETE FROM vehicle_import_staging s
+            USING vehicles v
+            WHERE v.organization_id = :org_id
+              AND s.vin_key <> ''
+              AND v.vin_key = s.vin_key
+              AND v.license_plate IS DISTINCT FROM s.license_plate
+            RETURNING s.row, v.license_plate
+        """), {'org_id': organization_id}).fetchall()
+        results = conn.execute(text("""
+            INSERT INTO vehicles (
+                organization_id, name, license_plate, vin, status, model, year,
+                is_rental, rental_start_date, rental_end_date, rental_monthly_price
+            )
+            SELECT :org_id, name, license_plate, NULLIF(vin, ''), CAST(status AS vehicle_status),
+                   NULLIF(model, ''), year, is_rental, rental_start_date, rental_end_date,
+                   rental_monthly_price
+            FROM vehicle_import_staging
+            ORDER BY row
+            ON CONFLICT (organization_id, license_plate) DO UPDATE SET
+                name = EXCLUDED.name,
+                vin = COALESCE(EXCLUDED.vin, vehicles.vin),
+                status = EXCLUDED.status,
+                model = COALESCE(EXCLUDED.model, vehicles.model),
+                year = COALESCE(EXCLUDED.year, vehicles.year),
+                is_rental = EXCLUDED.is_rental,
+                rental_start_date = EXCLUDED.rental_start_date,
+                rental_end_date = EXCLUDED.rental_end_date,
+                rental_monthly_price = EXCLUDED.rental_monthly_price
+            RETURNING id, license_plate, (xmax = 0) AS inserted
+        """), {'org_id': organization_id}).fetchall()
+        stored_plates = dict(conn.execute(text(
+            "SELECT row, license_plate FROM vehicle_import_staging"
+        )).fetchall())
+
+    by_plate = {plate: inserted for _, plate, inserted in results}
+    for row, plate in stored_plates.items():
+        index = report.index[report['row'] == row]
+        report.loc[index, 'result'] = 'inserted' if by_plate.get(plate) else 'updated'
+    for row, other_plate in conflicts:
+        index = report.index[report['row'] == row]
+        report.loc[index, 'result'] = 'error'
+        report.loc[index, 'message'] = f"VIN уже у автомобиля {other_plate} / VIN belongs to {other_plate}"
+
+    # Rental terms feed the cost report
+    if results:
+        record_cost_change([vehicle_id for vehicle_id, _, _ in results])
+    return report
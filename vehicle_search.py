@@ -0,0 +1,131 @@
+"""
+Fuzzy vehicle search by name, license plate and VIN
+
+Plates and VINs are compared through normalized generated columns
+(plate_key, vin_key: uppercase, letters and digits only), so "B-FD 5555",
+"bfd5555" and "B FD 5555" are the same plate. Names, plate_key and vin_key
+have pg_trgm GIN indexes, which serve both the substring match (LIKE) and
+the similarity match (%) without a sequential scan, and results are ranked
+by trigram similarity with exact and prefix hits first.
+
+Unsearched lists use natural name order (1, 2, 10, "Sprinter 11") through
+the persisted name_sort_key column; NATURAL_ORDER and its index also allow
+keyset pagination.
+
+    search_filter(text)                  -> SQL condition, params, score expression
+    typeahead(org_id, text, limit=10)    -> top matches for a search box
+    vehicle_page(org_id, after=None)     -> next page of vehicles in natural order
+
+    python vehicle_search.py <organization_id> <text> [--limit 10]
+"""
+import argparse
+import re
+import sys
+import time
+from database import execute_query
+
+# Shorter input is matched by prefix only (trigrams need three characters)
+MIN_FUZZY_LENGTH = 3
+TYPEAHEAD_LIMIT = 10
+PAGE_SIZE = 50
+# Served by idx_vehicles_natural_order (organization_id, name_sort_key, name, id)
+NATURAL_ORDER = "name_sort_key, name, id"
+
+
+def normalize_key(value):
+    """Plate/VIN key as stored in plate_key and vin_key"""
+    return re.sub(r'[^0-9A-ZÄÖÜ]', '', str(value or '').upper())
+
+
+def search_filter(search_text, alias='v'):
+    """(condition, params, score) for a vehicle search over the table alias"""
+    prefix = f"{alias}." if alias else ''
+    term = search_text.strip().lower()
+    key = normalize_key(search_text)
+    params = {
+        'search_like': f"%{term}%",
+        'search_term': term,
+        'search_key': key,
+        'search_key_like': f"%{key}%",
+        'search_key_prefix': f"{key}%"
+    }
+    matches = [
+        f"lower({prefix}name) LIKE :search_like",
+        f"{prefix}plate_key LIKE :search_key_like" if key else None,
+        f"{prefix}vin_key LIKE :search_key_like" if key else None,
+    ]
+    if len(term) >= MIN_FUZZY_LENGTH:
+        matches.append(f"lower({prefix}name) % :search_term")
+        if key:
+            matches.append(f"{prefix}plate_key % :search_key")
+    condition = "(" + " OR ".join(m for m in matches if m) + ")"
+    score = f"""(
+        CASE
+            WHEN {prefix}plate_key = :search_key OR {prefix}vin_key = :search_key OR lower({prefix}name) = :search_term THEN 3
+            WHEN {prefix}plate_key LIKE :search_key_prefix OR lower({prefix}name) LIKE :search_term || '%' THEN 2
+            ELSE 0
+        END
+        + GREATEST(
+            similarity(lower({prefix}name), :search_term),
+            similarity({prefix}plate_key, :search_key),
+            similarity({prefix}vin_key, :search_key)
+        )
+    )"""
+    return condition, params, score
+
+
+def typeahead(organization_id, search_text, limit=TYPEAHEAD_LIMIT):
+    """[(id, name, license_plate, vin, status, score)] best matches first"""
+    if not search_text or not search_text.strip():
+        return []
+    condition, params, score = search_filter(search_text)
+    return execute_query(f"""
+        SELECT v.id, v.name, v.license_plate, v.vin, v.status, {score} AS score
+        FROM vehicles v
+        WHERE v.organization_id = :org_id
+          AND {condition}
+        ORDER BY score DESC, v.name
+        LIMIT :limit
+    """, {**params, 'org_id': organization_id, 'limit': limit}) or []
+
+
+def natural_order(alias='v'):
+    """ORDER BY expression for natural vehicle name order"""
+    prefix = f"{alias}." if alias else ''
+    return ', '.join(prefix + column for column in NATURAL_ORDER.split(', '))
+
+
+def vehicle_page(organization_id, after=None, limit=PAGE_SIZE):
+    """[(id, name, license_plate, status, name_sort_key)] after the (name_sort_key, name, id) cursor"""
+    params = {'org_id': organization_id, 'limit': limit}
+    cursor = ""
+    if after:
+        cursor = "AND (v.name_sort_key, v.name, v.id) > (:after_key, :after_name, :after_id)"
+        params.update(after_key=after[0], after_name=after[1], after_id=after[2])
+    return execute_query(f"""
+        SELECT v.id, v.name, v.license_plate, v.status, v.name_sort_key
+        FROM vehicles v
+        WHERE v.organization_id = :org_id {cursor}
+        ORDER BY {natural_order()}
+        LIMIT :limit
+    """, params) or []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search an organization's vehicles by name, plate or VIN")
+    parser.add_argument('organization_id')
+    parser.add_argument('text')
+    parser.add_argument('--limit', type=int, default=TYPEAHEAD_LIMIT)
+    options = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = typeahead(options.organization_id, options.text, options.limit)
+    elapsed = (time.perf_counter() - started) * 1000
+    for vehicle_id, name, plate, vin, status, score in results:
+        print(f"{score:5.2f}  {name:<24} {plate or '':<14} {vin or '':<18} {status}")
+    print(f"{len(results)} results in {elapsed:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())